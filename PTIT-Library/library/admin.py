@@ -1,16 +1,64 @@
-from django.contrib import admin
-from .models import Book, Borrow, Notification, EntryLog, Collection, SubCollection
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from .models import (
+    Book, Borrow, Notification, EntryLog, Collection, SubCollection, BookBorrowStat, DailyBorrowStat, UserBorrowStat,
+)
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count
-from django.http import HttpResponse
-from openpyxl import Workbook
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
 from django.template.response import TemplateResponse
 from datetime import date
+from dateutil.relativedelta import relativedelta
 from django.urls import path
 from django.shortcuts import redirect
 from django.utils.safestring import mark_safe
-from openpyxl.utils import get_column_letter
+from .exports import ExportBusy, export_queryset
+from .instrumentation import endpoint_stats, merged_stats
+from .services import BorrowTransitionError, bulk_approve, bulk_return, check_status_change
+
+class ExportMixin:
+    """Thêm các action xuất dữ liệu (CSV / Excel / JSON Lines) cho trang danh sách.
+
+    Khai báo ``export_fields = [(đường dẫn trường, tiêu đề), ...]``; action xuất
+    các dòng đã chọn (hoặc toàn bộ kết quả lọc khi chọn "tất cả"); CSV / JSON Lines
+    được gửi dạng luồng, Excel được ghi xong ra file tạm rồi mới gửi.
+    """
+    export_fields = ()
+    export_filename = None
+    export_column_widths = None
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if self.export_fields:
+            for name in ("export_csv", "export_xlsx", "export_jsonl"):
+                actions[name] = self.get_action(name)
+        return actions
+
+    def _export(self, request, queryset, fmt):
+        try:
+            return export_queryset(
+                queryset, self.export_fields, fmt,
+                filename=self.export_filename or self.model._meta.model_name,
+                title=str(self.model._meta.verbose_name_plural)[:31],
+                column_widths=self.export_column_widths,
+            )
+        except ExportBusy as e:
+            self.message_user(request, str(e), messages.WARNING)
+
+    @admin.action(description="Xuất CSV các dòng đã chọn")
+    def export_csv(self, request, queryset):
+        return self._export(request, queryset, "csv")
+
+    @admin.action(description="Xuất Excel các dòng đã chọn")
+    def export_xlsx(self, request, queryset):
+        return self._export(request, queryset, "xlsx")
+
+    @admin.action(description="Xuất JSON Lines các dòng đã chọn")
+    def export_jsonl(self, request, queryset):
+        return self._export(request, queryset, "jsonl")
+
 
 @admin.register(Collection)
 class CollectionAdmin(admin.ModelAdmin):
@@ -27,8 +75,14 @@ class SubCollectionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'quantity', 'get_collection', 'subcollection', 'publish_year', 'publisher')
+    export_fields = (
+        ("id", "ID"), ("title", "Tên sách"), ("author", "Tác giả"), ("quantity", "Số lượng"),
+        ("subcollection__collection__name", "Bộ sưu tập"), ("subcollection__name", "Phân loại"),
+        ("publish_year", "Năm xuất bản"), ("publisher", "Nhà xuất bản"),
+    )
+    export_column_widths = (8, 50, 30, 10, 25, 25, 12, 40)
     search_fields = ("title", "author")
     list_filter = ('subcollection__collection', 'subcollection')
     list_per_page = 10 #tuy chinh phan trang
@@ -64,8 +118,37 @@ class DueDateFilter(admin.SimpleListFilter):
             return queryset.filter(due_date__year=next_month.year, due_date__month=next_month.month)
         return queryset
 
+BORROW_EXPORT_FIELDS = (
+    ("borrow_code", "Mã mượn"), ("user__username", "Người mượn"), ("book__title", "Tên sách"),
+    ("book__author", "Tác giả"), ("borrow_date", "Ngày mượn"), ("due_date", "Hạn trả"),
+    ("return_date", "Ngày trả"), ("status", "Trạng thái"),
+)
+# Số lượt quá hạn hiện trên trang thống kê (phần còn lại xem bằng file xuất)
+OVERDUE_PREVIEW_LIMIT = 50
+STATISTICS_MONTHS = 12
+
+
+class BorrowAdminForm(forms.ModelForm):
+    """Báo lỗi chuyển trạng thái (hết sách, vừa bị sửa) ngay trên form thay vì sau khi lưu."""
+
+    class Meta:
+        model = Borrow
+        fields = "__all__"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        borrow, status, book = self.instance, cleaned_data.get("status"), cleaned_data.get("book")
+        if borrow.pk and status and book and status != borrow._loaded_status:
+            try:
+                check_status_change(borrow.pk, book, borrow._loaded_status, status)
+            except BorrowTransitionError as e:
+                raise ValidationError(str(e))
+        return cleaned_data
+
+
 @admin.register(Borrow)
-class BorrowAdmin(admin.ModelAdmin):
+class BorrowAdmin(ExportMixin, admin.ModelAdmin):
+    form = BorrowAdminForm
     list_display = (
         "borrow_code", "user", "book", "formatted_borrow_date",
         "formatted_due_date", "formatted_return_date", "status"
@@ -77,6 +160,37 @@ class BorrowAdmin(admin.ModelAdmin):
 
     # Ghi đè template trang danh sách để chèn nút thống kê
     change_list_template = "admin/borrow_change_list.html"
+    actions = ("approve_selected", "return_selected")
+    export_fields = BORROW_EXPORT_FIELDS
+    export_column_widths = (12, 20, 50, 30, 12, 12, 12, 12)
+
+    # ==== Duyệt / trả hàng loạt ====
+    def _report_bulk_result(self, request, done, failures, verb):
+        if done:
+            self.message_user(request, f"Đã {verb} {done} lượt mượn.", messages.SUCCESS)
+        if failures:
+            details = "; ".join(f"{code}: {reason}" for code, reason in failures[:20])
+            more = f" (và {len(failures) - 20} lượt khác)" if len(failures) > 20 else ""
+            self.message_user(
+                request, f"Không thể {verb} {len(failures)} lượt mượn – {details}{more}", messages.WARNING
+            )
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Chỉ ghi các cột đã sửa; đổi trạng thái được Borrow.save chuyển cho services.approve / return_
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
+
+    @admin.action(description="Duyệt mượn các lượt đã chọn")
+    def approve_selected(self, request, queryset):
+        done, failures = bulk_approve(queryset)
+        self._report_bulk_result(request, done, failures, "duyệt")
+
+    @admin.action(description="Ghi nhận trả sách các lượt đã chọn")
+    def return_selected(self, request, queryset):
+        done, failures = bulk_return(queryset)
+        self._report_bulk_result(request, done, failures, "ghi nhận trả")
 
     def formatted_borrow_date(self, obj):
         return obj.borrow_date.strftime("%d/%m/%Y") if obj.borrow_date else ""
@@ -103,64 +217,71 @@ class BorrowAdmin(admin.ModelAdmin):
 
     # ==== Trang thống kê ====
     def borrow_statistics_view(self, request):
+        # Đọc từ bảng tổng hợp theo sách thay vì GROUP BY trên toàn bộ Borrow
         top_books = (
-            Borrow.objects.filter(status="Đang mượn")
-            .values("book__title")
-            .annotate(total=Count("id"))
-            .order_by("-total")[:10]
+            BookBorrowStat.objects.filter(borrowing__gt=0)
+            .annotate(book__title=F("book__title"), total=F("borrowing"))
+            .values("book__title", "total")
+            .order_by("-borrowing")[:10]
+        )
+        top_readers = (
+            UserBorrowStat.objects.filter(total_borrowed__gt=0).select_related("user")
+            .only("user__username", "borrowing", "total_borrowed")
+            .order_by("-total_borrowed", "user_id")[:10]
+        )
+        # Cộng các dòng theo ngày của 12 tháng gần nhất thay vì đếm lại bảng Borrow
+        since = date.today().replace(day=1) - relativedelta(months=STATISTICS_MONTHS - 1)
+        monthly = (
+            DailyBorrowStat.objects.filter(day__gte=since)
+            .annotate(month=TruncMonth("day")).values("month")
+            .annotate(borrowed=Sum("borrowed"), returned=Sum("returned"))
+            .order_by("-month")
         )
 
-        overdue_borrows = Borrow.objects.filter(status="Đang mượn", due_date__lt=date.today())
+        # Chỉ hiện một phần danh sách quá hạn; danh sách đầy đủ lấy bằng nút xuất file
+        overdue = Borrow.objects.filter(status="Đang mượn", due_date__lt=date.today())
+        overdue_borrows = (
+            overdue.select_related("user", "book")
+            .only("borrow_code", "due_date", "user__username", "book__title")
+            .order_by("due_date", "id")[:OVERDUE_PREVIEW_LIMIT]
+        )
 
         context = dict(
             self.admin_site.each_context(request),
             title="Thống kê mượn sách",
             top_books=top_books,
+            top_readers=top_readers,
+            monthly=monthly,
             overdue_borrows=overdue_borrows,
+            overdue_total=overdue.count(),
         )
 
         return TemplateResponse(request, "admin/borrow_statistics.html", context)
 
-    # ==== Xuất Excel ====
+    # ==== Xuất danh sách quá hạn (Excel / CSV) ====
     def export_overdue_to_excel(self, request):
-        overdue_borrows = Borrow.objects.filter(status="Đang mượn", due_date__lt=date.today())
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Danh sách quá hạn"
-
-        headers = ["Mã mượn", "Người mượn", "Tên sách", "Tác giả", "Ngày mượn", "Hạn trả"]
-        ws.append(headers)
-
-        for b in overdue_borrows:
-            ws.append([
-                b.borrow_code,
-                b.user.username,
-                b.book.title,
-                b.book.author,
-                b.borrow_date.strftime("%d/%m/%Y") if b.borrow_date else "",
-                b.due_date.strftime("%d/%m/%Y") if b.due_date else "",
-            ])
-
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        overdue_borrows = (
+            Borrow.objects.filter(status="Đang mượn", due_date__lt=date.today())
+            .order_by("due_date", "id")
         )
-        response["Content-Disposition"] = 'attachment; filename="overdue_borrows.xlsx"'
-        # Căn chỉnh độ rộng cột tự động
-        for column_cells in ws.columns:
-            length = max(len(str(cell.value)) if cell.value else 0 for cell in column_cells)
-            adjusted_width = (length + 2)
-            ws.column_dimensions[get_column_letter(column_cells[0].column)].width = adjusted_width
-
-        # Tăng nhẹ chiều cao các hàng để dễ đọc
-        for row in ws.iter_rows():
-            ws.row_dimensions[row[0].row].height = 20
-        wb.save(response)
-        return response
-    
+        fmt = "csv" if request.GET.get("format") == "csv" else "xlsx"
+        try:
+            return export_queryset(
+                overdue_borrows, BORROW_EXPORT_FIELDS[:6], fmt, "overdue_borrows",
+                title="Danh sách quá hạn", column_widths=[12, 20, 50, 30, 12, 12],
+            )
+        except ExportBusy as e:
+            self.message_user(request, str(e), messages.WARNING)
+            return redirect("admin:borrow_statistics")
+
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ("user", "title", "is_read", "formatted_created_at")
+    export_fields = (
+        ("user__username", "Người dùng"), ("title", "Tiêu đề"), ("message", "Nội dung"),
+        ("is_read", "Đã đọc"), ("created_at", "Thời gian tạo"),
+    )
+    export_column_widths = (20, 30, 80, 10, 18)
     list_filter = ("is_read", "created_at")
     search_fields = ("user__username", "title", "message")
     ordering = ("-created_at",)
@@ -173,8 +294,12 @@ class NotificationAdmin(admin.ModelAdmin):
     formatted_created_at.short_description = "Thời gian tạo"
 
 @admin.register(EntryLog)
-class EntryLogAdmin(admin.ModelAdmin):
+class EntryLogAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ('user', 'shift', 'formatted_check_in', 'formatted_check_out')
+    export_fields = (
+        ("user__username", "MSV"), ("shift", "Buổi"), ("check_in", "Giờ vào"), ("check_out", "Giờ ra"),
+    )
+    export_column_widths = (20, 10, 18, 18)
     list_filter = ('shift', 'check_in', 'check_out')
     search_fields = ('user__username',)
     ordering = ('-check_in',)
@@ -193,3 +318,33 @@ class EntryLogAdmin(admin.ModelAdmin):
         return "-"
     formatted_check_out.short_description = "Giờ ra"
 
+
+
+# ==== Trang thời gian xử lý request (số liệu từ library/instrumentation.py) ====
+TIMING_ORDERINGS = {
+    "avg": ("avg_ms", "Thời gian trung bình"),
+    "max": ("max_ms", "Thời gian lớn nhất"),
+    "queries": ("avg_queries", "Số truy vấn trung bình"),
+    "count": ("count", "Số request"),
+}
+
+
+def request_timing_view(request):
+    if request.method == "POST":
+        endpoint_stats.reset()
+        messages.success(request, "Đã xoá số liệu thời gian xử lý.")
+        return redirect("request_timing")
+
+    order = request.GET.get("o", "avg")
+    if order not in TIMING_ORDERINGS:
+        order = "avg"
+    rows = sorted(merged_stats(), key=lambda row: row[TIMING_ORDERINGS[order][0]], reverse=True)
+
+    context = dict(
+        admin.site.each_context(request),
+        title="Thời gian xử lý request",
+        rows=rows[:50],
+        order=order,
+        orderings={key: label for key, (_, label) in TIMING_ORDERINGS.items()},
+    )
+    return TemplateResponse(request, "admin/request_timing.html", context)
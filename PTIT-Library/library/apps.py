@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .fulltext import install_page_fts_index
+    from .search import install_fts_index
+    install_fts_index(connections[using])
+    install_page_fts_index(connections[using])
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from . import signals  # noqa: F401  đăng ký các signal handler
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,67 @@
+"""Mã điểm danh xoay vòng dùng chung cho mọi sinh viên.
+
+Mã được sinh theo kiểu TOTP: chia thời gian thành các khung
+``ATTENDANCE_CODE_WINDOW`` giây, mỗi khung có một mã 6 chữ số là HMAC (khóa
+suy ra từ ``SECRET_KEY``) của số thứ tự khung. Server không cần lưu mã ở đâu cả,
+mọi worker đều tính ra cùng một mã, và mã của khung trước vẫn được chấp nhận để
+sinh viên quét sát lúc đổi mã không bị từ chối.
+
+Ảnh QR của mỗi khung chỉ được vẽ một lần rồi giữ trong cache.
+"""
+import io
+import time
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+CODE_DIGITS = 6
+_SALT = "library.attendance_codes"
+
+
+def window_seconds():
+    return getattr(settings, "ATTENDANCE_CODE_WINDOW", 30)
+
+
+def current_window(now=None):
+    return int(now if now is not None else time.time()) // window_seconds()
+
+
+def seconds_left(now=None):
+    now = now if now is not None else time.time()
+    return window_seconds() - int(now) % window_seconds()
+
+
+def code_for(window):
+    digest = salted_hmac(_SALT, str(window), algorithm="sha256").digest()
+    # Cắt động như RFC 4226
+    offset = digest[-1] & 0x0F
+    number = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+    return str(number % 10 ** CODE_DIGITS).zfill(CODE_DIGITS)
+
+
+def verify(code, now=None):
+    """Mã hợp lệ nếu khớp khung hiện tại hoặc khung liền trước."""
+    if not code:
+        return False
+    window = current_window(now)
+    return any(constant_time_compare(code.strip(), code_for(w)) for w in (window, window - 1))
+
+
+def is_servable(window, now=None):
+    """Chỉ phát ảnh QR của khung hiện tại và khung trước, không lộ mã tương lai."""
+    return window in (current_window(now), current_window(now) - 1)
+
+
+def qr_svg(window):
+    """Trả về ảnh QR (SVG) của khung, vẽ một lần cho mỗi khung."""
+    key = f"attendance:qr:{window}"
+    svg = cache.get(key)
+    if svg is None:
+        buffer = io.BytesIO()
+        qrcode.make(code_for(window), image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        svg = buffer.getvalue()
+        cache.set(key, svg, window_seconds() * 2)
+    return svg
@@ -0,0 +1,156 @@
+"""Số liệu danh mục cho trang bộ sưu tập (trang đầu sau khi đăng nhập).
+
+Toàn bộ khối bộ sưu tập được cache bằng thẻ ``{% cache %}`` với khoá chứa
+``catalog_version()``. Mỗi khi sách, danh mục con, bộ sưu tập hoặc số lượng
+sách thay đổi, phiên bản được tăng (signal trong ``signals.py``, và
+``stock_changed`` cho các câu ``UPDATE`` trong ``services.py`` vốn không gửi
+signal), nên khối cũ không bao giờ được dùng lại. Ở trạng thái ổn định trang
+chỉ tốn một lần đọc cache, không truy vấn bảng danh mục nào.
+
+Trang chi tiết sách và trang danh mục con dùng GET có điều kiện: ETag được
+tính từ ``Book.updated_at`` (và số sách / tên danh mục), người dùng, phiên đăng
+nhập và số thông báo chưa đọc (thanh điều hướng khác nhau theo người), nên lần
+xem lại chỉ nhận 304. Các khối HTML được cache với khoá chứa ``updated_at``. Số lượng sách
+không nằm trong các khối đó: ``book_availability.html`` được render mới ở mỗi
+response 200, và được JavaScript làm mới qua view ``book_availability`` khi
+trình duyệt dùng lại bản đã lưu (304, nút Back).
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from .notifications import unread_count
+
+VERSION_KEY = "catalog:version"
+# Phiên bản được tăng tại chỗ khi danh mục thay đổi; thời hạn chỉ để giới hạn
+# độ lệch khi cache không dùng chung giữa các worker (LocMemCache mặc định)
+LANDING_CACHE_TIMEOUT = 300
+
+
+def catalog_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def bump_catalog_version(**kwargs):
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:  # khoá chưa có (cache vừa khởi động / bị xoá)
+        cache.set(VERSION_KEY, 1, None)
+
+
+def stock_changed():
+    """Gọi sau các câu ``UPDATE`` số lượng sách; phiên bản được tăng khi giao dịch commit."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def landing_collections():
+    """Các bộ sưu tập kèm danh mục con, mỗi mục có ``titles`` / ``available`` / ``copies``.
+
+    ``titles``: số đầu sách, ``available``: số đầu sách còn bản cho mượn,
+    ``copies``: tổng số bản còn trong kho. Chỉ ba truy vấn cho cả trang.
+    """
+    from .models import Book, Collection  # tránh circular import
+
+    counts = {
+        row['subcollection']: row
+        for row in Book.objects.order_by().values('subcollection').annotate(
+            titles=Count('id'),
+            available=Count('id', filter=Q(quantity__gt=0)),
+            copies=Sum('quantity', filter=Q(quantity__gt=0), default=0),
+        )
+    }
+    collections = list(Collection.objects.prefetch_related('subcollections').order_by('id'))
+    for collection in collections:
+        collection.titles = collection.available = collection.copies = 0
+        for sub in collection.subcollections.all():
+            row = counts.get(sub.id, {})
+            sub.titles = row.get('titles', 0)
+            sub.available = row.get('available', 0)
+            sub.copies = row.get('copies', 0)
+            collection.titles += sub.titles
+            collection.available += sub.available
+            collection.copies += sub.copies
+    return collections
+
+
+# ===== GET có điều kiện cho trang sách / danh mục con =====
+# Khoá của khối HTML chứa updated_at (và trạng thái ảnh thu nhỏ) nên sửa sách là
+# khối mới được dựng ngay; thời hạn chỉ để khối cũ không nằm mãi trong cache
+FRAGMENT_CACHE_TIMEOUT = 600
+
+
+def _memoize(request, key, compute):
+    # etag_func / last_modified_func của @condition và view dùng chung một lần truy vấn
+    memo = request.__dict__.setdefault('_catalog_memo', {})
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def _digest(*parts):
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _viewer(request):
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    # Trang có csrf_token, mà token đổi mỗi lần đăng nhập (cùng lúc với khoá phiên):
+    # thiếu khoá phiên thì sau khi đăng nhập lại trình duyệt nhận 304 và dùng token
+    # cũ, các nút POST (đánh dấu đã đọc...) bị từ chối 403
+    return user.pk, request.session.session_key, unread_count(user)
+
+
+def get_book(request, book_id):
+    """Sách cho trang chi tiết (None nếu không có), chỉ truy vấn một lần cho mỗi request."""
+    from .models import Book  # tránh circular import
+
+    return _memoize(request, ('book', book_id), lambda: (
+        Book.objects.select_related('subcollection__collection').filter(id=book_id).first()
+    ))
+
+
+def book_etag(request, book_id):
+    book = get_book(request, book_id)
+    if book is None:
+        return None
+    return _digest('book', book.id, book.updated_at.timestamp(), _viewer(request))
+
+
+def book_last_modified(request, book_id):
+    book = get_book(request, book_id)
+    return book.updated_at if book else None
+
+
+def get_subcollection(request, sub_id):
+    """``(danh mục con, phiên bản nội dung, lần sửa sách gần nhất)`` hoặc None.
+
+    Phiên bản đổi khi danh mục con / bộ sưu tập đổi tên, khi có sách thêm vào,
+    bị xoá hay chuyển đi (số sách đổi) và khi một sách trong mục được sửa.
+    """
+    from .models import Book, SubCollection  # tránh circular import
+
+    def compute():
+        sub = SubCollection.objects.select_related('collection').filter(id=sub_id).first()
+        if sub is None:
+            return None
+        books = Book.objects.filter(subcollection=sub).aggregate(n=Count('id'), updated=Max('updated_at'))
+        updated = books['updated']
+        version = _digest(sub.name, sub.collection.name, books['n'], updated and updated.timestamp())
+        return sub, version, updated
+
+    return _memoize(request, ('subcollection', sub_id), compute)
+
+
+def subcollection_etag(request, sub_id):
+    found = get_subcollection(request, sub_id)
+    if found is None:
+        return None
+    return _digest('subcollection', sub_id, found[1], request.GET.get('page'), _viewer(request))
+
+
+def subcollection_last_modified(request, sub_id):
+    found = get_subcollection(request, sub_id)
+    return found[2] if found else None
@@ -0,0 +1,119 @@
+"""Điểm danh vào / ra thư viện.
+
+Mỗi lượt vào là một dòng ``EntryLog`` duy nhất theo khoá (user, shift, day), nên
+điểm danh chỉ là một lệnh INSERT: nếu dòng đã tồn tại (``IntegrityError``) thì đó
+là lượt ra, và được ghi bằng một lệnh UPDATE có điều kiện ``check_out IS NULL``.
+Không cần đọc trước, không lọc theo ``check_in__date`` (không dùng được chỉ mục).
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import EntryLog
+from .stats import record_check_in
+
+CHECKED_IN = "in"
+CHECKED_OUT = "out"
+COMPLETED = "done"
+
+
+def shift_of(moment):
+    return "Sáng" if moment.hour < 12 else "Chiều"
+
+
+def check_in(user_id, now=None):
+    """Ghi một lượt quét của sinh viên, trả về ``(kết quả, buổi, thời điểm)``."""
+    now = timezone.localtime(now or timezone.now())
+    shift, day = shift_of(now), now.date()
+    try:
+        with transaction.atomic():
+            EntryLog.objects.create(user_id=user_id, shift=shift, day=day, check_in=now)
+            # Cùng giao dịch với lượt vào: bảng xếp hạng không bao giờ lệch với EntryLog
+            record_check_in(user_id, day)
+    except IntegrityError:
+        updated = (
+            EntryLog.objects.filter(user_id=user_id, shift=shift, day=day, check_out__isnull=True)
+            .update(check_out=now)
+        )
+        return (CHECKED_OUT if updated else COMPLETED), shift, now
+
+    return CHECKED_IN, shift, now
+
+
+def _existing_logs(scans):
+    return {
+        (log.user_id, log.shift, log.day): log
+        for log in EntryLog.objects.filter(
+            user_id__in={user_id for _, user_id in scans},
+            day__in={moment.date() for moment, _ in scans},
+        )
+    }
+
+
+def _insert_or_check_out(log, results):
+    """Ghi một lượt vào của lô như ``check_in``: nếu dòng vừa được kiosk khác tạo thì
+    lượt quét đó thành lượt ra. Trả về True nếu đã chèn được dòng mới."""
+    try:
+        with transaction.atomic():
+            log.save(force_insert=True)
+        return True
+    except IntegrityError:
+        pass
+    updated = (
+        EntryLog.objects.filter(user_id=log.user_id, shift=log.shift, day=log.day, check_out__isnull=True)
+        .update(check_out=log.check_in)
+    )
+    results[CHECKED_IN] -= 1
+    results[CHECKED_OUT if updated else COMPLETED] += 1
+    if log.check_out is not None:
+        # Lượt ra của lô cho dòng này giờ là lượt quét thừa
+        results[CHECKED_OUT] -= 1
+        results[COMPLETED] += 1
+    return False
+
+
+def bulk_check_in(scans):
+    """Ghi nhiều lượt quét ``[(user_id, thời điểm), ...]`` từ máy quét trong một giao dịch.
+
+    Đọc một lần các dòng đã có của những (user, shift, day) liên quan, rồi tạo các lượt
+    vào bằng ``bulk_create`` và ghi lượt ra bằng ``bulk_update``. Nếu kiosk khác chèn
+    cùng (user, shift, day) sau lần đọc, các lượt vào được ghi lại từng dòng thay vì
+    hỏng cả lô. Trả về ``Counter`` số lượt theo kết quả.
+    """
+    scans = sorted((timezone.localtime(moment), user_id) for user_id, moment in scans)
+    results = Counter()
+    if not scans:
+        return results
+
+    with transaction.atomic():
+        existing = _existing_logs(scans)
+        created, checked_out = [], {}
+        for moment, user_id in scans:
+            key = (user_id, shift_of(moment), moment.date())
+            log = existing.get(key)
+            if log is None:
+                log = existing[key] = EntryLog(user_id=user_id, shift=key[1], day=key[2], check_in=moment)
+                created.append(log)
+                results[CHECKED_IN] += 1
+            elif log.check_out is None:
+                log.check_out = moment
+                if log.pk:
+                    checked_out[log.pk] = log
+                results[CHECKED_OUT] += 1
+            else:
+                results[COMPLETED] += 1
+
+        try:
+            with transaction.atomic():
+                EntryLog.objects.bulk_create(created, batch_size=500)
+        except IntegrityError:
+            for log in created:
+                log.pk = None  # bulk_create đã bị hoàn tác
+            created = [log for log in created if _insert_or_check_out(log, results)]
+        EntryLog.objects.bulk_update(checked_out.values(), ['check_out'], batch_size=500)
+
+        per_day = Counter((log.user_id, log.day) for log in created)
+        for (user_id, day), n in per_day.items():
+            record_check_in(user_id, day, n)
+    return results
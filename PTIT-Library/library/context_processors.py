@@ -1,8 +1,21 @@
-from .models import Notification
-
-def unread_notifications_count(request):
-    if request.user.is_authenticated:
-        return {
-            'unread_notifications': Notification.objects.filter(user=request.user, is_read=False).count()
-        }
-    return {'unread_notifications': 0}
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import notifications_page, unread_count
+
+
+def notifications(request):
+    """Dữ liệu chuông thông báo cho mọi trang.
+
+    Các giá trị đều lazy: chỉ truy vấn khi template thực sự đọc tới, và số
+    thông báo chưa đọc lấy từ bộ đếm trong cache (xem library/notifications.py).
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return {'unread_notifications': 0}
+
+    first_page = SimpleLazyObject(lambda: notifications_page(user))
+    return {
+        'unread_notifications': SimpleLazyObject(lambda: unread_count(user)),
+        'recent_notifications': SimpleLazyObject(lambda: first_page[0]),
+        'notifications_cursor': SimpleLazyObject(lambda: first_page[1] or ''),
+    }
@@ -0,0 +1,128 @@
+"""Gửi file cần đăng nhập (PDF của sách) với Range, ETag / Last-Modified và GET có điều kiện.
+
+Trình xem PDF của trình duyệt đọc file theo từng đoạn (``Range: bytes=...``) nên
+mở được trang đầu của một luận văn 100 MB mà không phải tải hết. Khi chạy sau
+nginx / Apache, đặt ``PROTECTED_MEDIA_OFFLOAD`` để Django chỉ kiểm tra quyền rồi
+trả header ``X-Accel-Redirect`` / ``X-Sendfile``, web server tự gửi file (kể cả
+Range). Thư mục ``books/pdfs`` khi đó không được mở công khai dưới ``MEDIA_URL``;
+khi DEBUG, ``public_media`` thay cho ``static()`` và cũng chặn thư mục này.
+"""
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.views.static import serve
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Thư mục trong MEDIA_ROOT chỉ được gửi qua view có kiểm tra quyền
+PROTECTED_MEDIA_DIRS = ("books/pdfs/",)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Trả về ``(đầu, cuối)`` (tính cả hai đầu) của một khoảng byte, hoặc None để gửi cả file.
+
+    Chỉ hỗ trợ một khoảng; yêu cầu nhiều khoảng được trả cả file (RFC 9110 cho phép).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1  # "bytes=-500": 500 byte cuối
+    if start > end or start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _if_range_passes(request, etag, last_modified):
+    """Không có If-Range, hoặc If-Range khớp phiên bản hiện tại của file."""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read(file, length):
+    try:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def protected_file_response(request, field_file, filename=None, as_attachment=False,
+                            content_type="application/octet-stream"):
+    storage, name = field_file.storage, field_file.name
+    try:
+        size = storage.size(name)
+        last_modified = int(storage.get_modified_time(name).timestamp())
+    except OSError:
+        raise Http404("Không tìm thấy file.")
+    etag = f'"{size:x}-{last_modified:x}"'
+
+    headers = HttpResponse()
+    headers["ETag"] = etag
+    headers["Last-Modified"] = http_date(last_modified)
+    # File chỉ dành cho người đã đăng nhập: không cho proxy dùng chung lưu lại
+    headers["Cache-Control"] = "private, max-age=0, must-revalidate"
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=headers)
+    if conditional is not headers:
+        return conditional
+
+    offload = getattr(settings, "PROTECTED_MEDIA_OFFLOAD", None)
+    if offload == "x-accel-redirect":
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = quote(settings.PROTECTED_MEDIA_PREFIX + name)
+    elif offload == "x-sendfile":
+        response = HttpResponse()
+        response["X-Sendfile"] = storage.path(name)
+    else:
+        try:
+            byte_range = parse_range(request.META.get("HTTP_RANGE"), size) if size else None
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range and not _if_range_passes(request, etag, last_modified):
+            byte_range = None
+        start, end = byte_range or (0, size - 1)
+
+        file = storage.open(name, "rb")
+        file.seek(start)
+        response = StreamingHttpResponse(_read(file, end - start + 1), status=206 if byte_range else 200)
+        response["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Accept-Ranges"] = "bytes"
+
+    for header in ("ETag", "Last-Modified", "Cache-Control"):
+        response[header] = headers[header]
+    response["Content-Type"] = content_type
+    response["Content-Disposition"] = content_disposition_header(as_attachment, filename or name.rsplit("/", 1)[-1])
+    return response
+
+
+def public_media(request, path, document_root=None):
+    """``django.views.static.serve`` cho MEDIA_URL khi DEBUG, trừ các thư mục được bảo vệ."""
+    # serve() chuẩn hoá đường dẫn trước khi mở file, nên phải so sánh trên dạng đã chuẩn hoá
+    normalized = posixpath.normpath(path.replace("\\", "/")).lstrip("/").lower()
+    if any(normalized.startswith(prefix) for prefix in PROTECTED_MEDIA_DIRS):
+        raise Http404("Không tìm thấy file.")
+    return serve(request, path, document_root=document_root)
@@ -0,0 +1,176 @@
+"""Xuất dữ liệu cho trang quản trị.
+
+Các hàm nhận một iterator các dòng (thường là ``queryset.iterator()``), nên
+bộ nhớ không tăng theo số dòng:
+
+* CSV / JSON Lines: ``StreamingHttpResponse``, trình duyệt bắt đầu tải ngay
+  dòng đầu tiên.
+* XLSX: không gửi dạng luồng được (định dạng zip của XLSX chỉ hoàn tất khi
+  đóng file). openpyxl ở chế độ write-only ghi toàn bộ ra file tạm trên đĩa
+  trước, rồi file mới được gửi theo từng khối; người dùng chỉ nhận byte đầu
+  tiên khi file đã ghi xong.
+"""
+import csv
+import json
+import tempfile
+import threading
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_SIZE = 2000
+FORMATS = ("csv", "xlsx", "jsonl")
+
+
+class ExportBusy(Exception):
+    """Đã đạt giới hạn số lượt xuất chạy đồng thời."""
+
+
+class Echo:
+    """File giả cho csv.writer: trả lại dòng vừa ghi thay vì lưu lại."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(Echo())
+    # BOM để Excel nhận đúng tiếng Việt UTF-8
+    yield "\ufeff" + writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_csv(headers, rows, filename):
+    response = StreamingHttpResponse(csv_lines(headers, rows), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def jsonl_lines(keys, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(keys, row)), ensure_ascii=False, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_jsonl(keys, rows, filename):
+    response = StreamingHttpResponse(jsonl_lines(keys, rows), content_type="application/x-ndjson; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def write_xlsx(file, headers, rows, title, column_widths=None):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    # Chế độ write-only không đọc lại được ô, nên độ rộng cột được khai báo trước
+    for i, width in enumerate(column_widths or [len(h) + 2 for h in headers], start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    wb.save(file)
+
+
+def xlsx_response(headers, rows, filename, title, column_widths=None):
+    """Ghi hết ``rows`` ra file tạm rồi trả về response gửi file đó (không phải luồng)."""
+    file = tempfile.TemporaryFile()
+    write_xlsx(file, headers, rows, title, column_widths)
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+# ===== Xuất queryset bất kỳ =====
+class ExportSlots:
+    """Giới hạn số lượt xuất chạy đồng thời trong một tiến trình (``EXPORT_MAX_CONCURRENT``)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = 0
+
+    @property
+    def limit(self):
+        return getattr(settings, "EXPORT_MAX_CONCURRENT", 2)
+
+    def acquire(self):
+        with self._lock:
+            if self._running >= self.limit:
+                raise ExportBusy("Đang có quá nhiều lượt xuất dữ liệu, vui lòng thử lại sau ít phút.")
+            self._running += 1
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+
+
+export_slots = ExportSlots()
+
+
+class SlotReleasingIterator:
+    """Bọc nội dung streaming để trả lại lượt xuất khi gửi xong hoặc khi client ngắt kết nối.
+
+    ``StreamingHttpResponse`` gọi ``close()`` của nội dung khi response kết thúc,
+    kể cả khi chưa kịp đọc dòng nào.
+    """
+
+    def __init__(self, iterable):
+        self._iterable = iterable
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._iterable
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            export_slots.release()
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Có" if value else "Không"
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime("%H:%M %d/%m/%Y")
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    return value
+
+
+def export_queryset(queryset, fields, fmt, filename, title="Dữ liệu", column_widths=None):
+    """Xuất ``queryset`` ra CSV / XLSX / JSON Lines.
+
+    ``fields`` là danh sách ``(đường dẫn trường, tiêu đề)``; chỉ các cột này
+    được đọc bằng ``values_list`` theo từng khối ``CHUNK_SIZE`` dòng. CSV và
+    JSON Lines được gửi dạng luồng và giữ lượt xuất tới khi gửi xong; XLSX
+    được ghi hết ra file tạm ngay trong lời gọi này (xem đầu module).
+    Ném ``ExportBusy`` khi đã đạt giới hạn lượt xuất đồng thời.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    paths = [path for path, _ in fields]
+    headers = [header for _, header in fields]
+    values = queryset.values_list(*paths).iterator(chunk_size=CHUNK_SIZE)
+
+    export_slots.acquire()
+    if fmt == "xlsx":
+        try:
+            rows = ([format_value(v) for v in row] for row in values)
+            return xlsx_response(headers, rows, f"{filename}.xlsx", title, column_widths)
+        finally:
+            export_slots.release()
+
+    if fmt == "csv":
+        response = stream_csv(headers, ([format_value(v) for v in row] for row in values), f"{filename}.csv")
+    else:
+        response = stream_jsonl(paths, values, f"{filename}.jsonl")
+    response.streaming_content = SlotReleasingIterator(response.streaming_content)
+    return response
@@ -0,0 +1,225 @@
+"""Tìm kiếm trong nội dung file PDF của sách.
+
+Văn bản được trích theo từng trang vào ``BookPage`` (bản gốc để hiển thị
+đoạn trích, bản đã chuẩn hoá để tìm không dấu). Trên SQLite, cột chuẩn hoá
+được đánh chỉ mục bởi bảng FTS5 ``library_bookpage_fts`` (tokenizer
+``unicode61`` theo từ, vì văn bản dài – trigram như chỉ mục tên sách sẽ quá
+lớn), đồng bộ bằng trigger giống ``library_book_fts`` trong ``search.py``.
+
+Việc trích văn bản cần thư viện ``pypdf`` (tuỳ chọn): khi chưa cài, PDF vẫn
+được lưu bình thường nhưng không được đánh chỉ mục. PDF mới tải lên được xử
+lý ở luồng nền (``workers.submit``); lệnh ``extract_pdf_text`` xử lý các file
+đã có bằng một pool tiến trình để dùng hết các nhân CPU.
+
+PDF trích lỗi (hỏng, mã hoá) được ghi nhận bằng ``failed_marker`` trong
+``Book.pdf_indexed`` nên không bị gửi lại mỗi lần sách được lưu; lệnh
+``extract_pdf_text --force`` thử lại các file này.
+"""
+import html
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils.safestring import mark_safe
+
+from .search import fts_available, normalize_text
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # tính năng tuỳ chọn, xem docstring
+    PdfReader = None
+
+PAGE_FTS_TABLE = "library_bookpage_fts"
+# Số trang lấy từ chỉ mục cho mỗi kết quả cần hiển thị (mỗi sách chỉ giữ trang khớp nhất)
+CANDIDATE_FACTOR = 5
+SNIPPET_WORDS = 30
+FAILED_PREFIX = "!"
+
+PAGE_FTS_TRIGGERS = {
+    f"{PAGE_FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_ai AFTER INSERT ON library_bookpage BEGIN
+            INSERT INTO {PAGE_FTS_TABLE}(rowid, text_normalized) VALUES (new.id, new.text_normalized);
+        END""",
+    f"{PAGE_FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_ad AFTER DELETE ON library_bookpage BEGIN
+            INSERT INTO {PAGE_FTS_TABLE}({PAGE_FTS_TABLE}, rowid, text_normalized)
+            VALUES ('delete', old.id, old.text_normalized);
+        END""",
+    f"{PAGE_FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_au
+        AFTER UPDATE OF text_normalized ON library_bookpage BEGIN
+            INSERT INTO {PAGE_FTS_TABLE}({PAGE_FTS_TABLE}, rowid, text_normalized)
+            VALUES ('delete', old.id, old.text_normalized);
+            INSERT INTO {PAGE_FTS_TABLE}(rowid, text_normalized) VALUES (new.id, new.text_normalized);
+        END""",
+}
+
+PageMatch = namedtuple("PageMatch", "book page snippet")
+
+
+def install_page_fts_index(conn=None):
+    """Tạo bảng FTS5 cho ``BookPage`` và các trigger nếu chưa có (xem ``search.install_fts_index``)."""
+    conn = conn or connection
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        if "library_bookpage" not in conn.introspection.table_names(cursor):
+            # Cơ sở dữ liệu chưa chạy tới migration 0017
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+            list(PAGE_FTS_TRIGGERS),
+        )
+        if len(cursor.fetchall()) == len(PAGE_FTS_TRIGGERS):
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {PAGE_FTS_TABLE} USING fts5("
+            "text_normalized, content='library_bookpage', content_rowid='id', tokenize='unicode61')"
+        )
+        for sql in PAGE_FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {PAGE_FTS_TABLE}({PAGE_FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_page_fts_index(conn=None):
+    conn = conn or connection
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        for name in PAGE_FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {PAGE_FTS_TABLE}")
+
+
+# ===== Trích văn bản =====
+def extraction_available():
+    return PdfReader is not None
+
+
+def extract_pages(source):
+    """Trả về danh sách văn bản từng trang của một file PDF (đường dẫn hoặc file đã mở).
+
+    Không đụng tới Django nên chạy được trong tiến trình con của ``ProcessPoolExecutor``.
+    """
+    reader = PdfReader(source)
+    return [" ".join((page.extract_text() or "").split()) for page in reader.pages]
+
+
+def failed_marker(pdf_name):
+    """Giá trị ``pdf_indexed`` cho một PDF trích lỗi."""
+    return FAILED_PREFIX + pdf_name
+
+
+def is_processed(pdf_name, pdf_indexed):
+    """PDF ``pdf_name`` đã được trích (thành công hay lỗi) chưa."""
+    return pdf_indexed in (pdf_name, failed_marker(pdf_name))
+
+
+def store_pages(book_id, pdf_name, texts):
+    """Thay toàn bộ trang đã lưu của sách bằng ``texts`` và đánh dấu ``pdf_name`` đã xử lý."""
+    from .models import Book, BookPage  # tránh circular import
+
+    with transaction.atomic():
+        BookPage.objects.filter(book_id=book_id).delete()
+        BookPage.objects.bulk_create(
+            [
+                BookPage(book_id=book_id, number=number, text=text, text_normalized=normalize_text(text))
+                for number, text in enumerate(texts, 1)
+                if text  # trang trắng / ảnh quét không có chữ
+            ],
+            batch_size=500,
+        )
+        # update() để không kích hoạt lại signal post_save của Book
+        Book.objects.filter(id=book_id).update(pdf_indexed=pdf_name)
+
+
+def index_book_pdf(book_id):
+    """Trích văn bản PDF hiện tại của sách (chạy ở luồng nền sau khi tải lên)."""
+    from .models import Book  # tránh circular import
+
+    book = Book.objects.only("id", "pdf", "pdf_indexed").filter(id=book_id).first()
+    if book is None:
+        return
+    if not book.pdf:
+        store_pages(book.id, "", [])
+        return
+    try:
+        with book.pdf.open("rb") as file:
+            texts = extract_pages(file)
+    except Exception:
+        # Xoá các trang của file cũ và ghi nhận lỗi, rồi để workers ghi log
+        store_pages(book.id, failed_marker(book.pdf.name), [])
+        raise
+    store_pages(book.id, book.pdf.name, texts)
+
+
+def schedule_extraction(book):
+    if extraction_available():
+        from . import workers  # tránh circular import
+        workers.submit(index_book_pdf, book.id)
+
+
+# ===== Tìm kiếm =====
+def _match_expression(words):
+    # Mỗi từ là một cụm trong ngoặc kép (FTS5 hiểu là AND); từ cuối khớp theo tiền tố khi đang gõ dở
+    quoted = ['"{}"'.format(word.replace('"', '""')) for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _page_ids(normalized_query, limit):
+    from .models import BookPage  # tránh circular import
+
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {PAGE_FTS_TABLE} WHERE {PAGE_FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [_match_expression(normalized_query.split()), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    return list(
+        BookPage.objects.filter(text_normalized__contains=normalized_query)
+        .order_by("book_id", "number")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def snippet(text, query_words, size=SNIPPET_WORDS):
+    """Đoạn khoảng ``size`` từ quanh chỗ khớp đầu tiên, các từ khớp được bọc trong ``<mark>``."""
+    words = text.split()
+    normalized = [normalize_text(word) for word in words]
+
+    def matches(i):
+        return any(q in normalized[i] for q in query_words)
+
+    first = next((i for i in range(len(words)) if matches(i)), 0)
+    start = max(0, first - size // 3)
+    end = min(len(words), start + size)
+    parts = [
+        f"<mark>{html.escape(words[i])}</mark>" if matches(i) else html.escape(words[i])
+        for i in range(start, end)
+    ]
+    return mark_safe(("… " if start else "") + " ".join(parts) + (" …" if end < len(words) else ""))
+
+
+def search_pages(query, limit=10):
+    """Tìm ``query`` trong nội dung PDF, trả về tối đa ``limit`` ``PageMatch`` (mỗi sách một trang)."""
+    from .models import BookPage  # tránh circular import
+
+    normalized_query = normalize_text(re.sub(r"[^\w\s]", " ", query))
+    if not normalized_query:
+        return []
+    ids = _page_ids(normalized_query, limit * CANDIDATE_FACTOR)
+    pages = BookPage.objects.select_related("book__subcollection__collection").in_bulk(ids)
+
+    query_words = normalized_query.split()
+    results, seen = [], set()
+    for page_id in ids:
+        page = pages[page_id]
+        if page.book_id in seen:
+            continue
+        seen.add(page.book_id)
+        results.append(PageMatch(page.book, page.number, snippet(page.text, query_words)))
+        if len(results) == limit:
+            break
+    return results
@@ -0,0 +1,310 @@
+"""Đo thời gian từng request: số truy vấn, thời gian SQL, thời gian render template và view.
+
+``ServerTimingMiddleware`` bọc mọi truy vấn bằng ``connection.execute_wrapper`` và
+ghi kết quả vào header ``Server-Timing`` (xem trong tab Network của trình duyệt),
+tuỳ chọn ghi thêm một dòng log JSON cho mỗi request (logger ``library.timing``).
+
+Thời gian render chỉ đo được khi ``TEMPLATES`` dùng backend ``TimedDjangoTemplates``
+bên dưới. Truy vấn chạy trong lúc render (queryset lười) được tính cả vào SQL lẫn
+template, nên các số đo có thể chồng lên nhau.
+
+Với ``StreamingHttpResponse`` (xuất CSV/JSONL) header được gửi trước khi nội dung
+chạy, nên ``Server-Timing`` chỉ phản ánh phần việc trước khi bắt đầu gửi. Nội dung
+được bọc lại để truy vấn chạy trong lúc gửi vẫn được đếm: dòng log và số liệu gộp
+được ghi khi gửi xong (``total`` khi đó gồm cả thời gian truyền cho client).
+
+Số liệu gộp theo tên URL được giữ trong bộ nhớ của từng worker và định kỳ ghi vào
+cache, trang quản trị ``admin/request-timing/`` gộp lại từ mọi worker.
+"""
+import contextvars
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger("library.timing")
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+SLOWEST_KEPT = 5
+FLUSH_INTERVAL = 30  # giây giữa hai lần ghi số liệu của worker vào cache
+STATS_TIMEOUT = 60 * 60 * 24
+# Mỗi worker giữ một ô cố định (giành bằng cache.add, nguyên tử) thay vì sửa một danh
+# sách worker dùng chung; trang quản trị đọc đúng các ô này
+WORKER_SLOTS = 128
+SLOT_KEY = "timing:slot:{}"
+WORKER_STATS_KEY = "timing:worker:{}"
+
+
+def _slot_keys():
+    return [SLOT_KEY.format(slot) for slot in range(WORKER_SLOTS)]
+
+
+def _worker_stats_keys():
+    return [WORKER_STATS_KEY.format(slot) for slot in range(WORKER_SLOTS)]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_ms = 0.0
+        self.template_ms = 0.0
+        self.queries = []  # [(ms, sql), ...]
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(((time.perf_counter() - start) * 1000, sql))
+
+    @property
+    def sql_ms(self):
+        return sum(ms for ms, _ in self.queries)
+
+    def slowest(self, n=SLOWEST_KEPT):
+        return heapq.nlargest(n, self.queries, key=lambda q: q[0])
+
+
+def current_metrics():
+    """Số đo của request đang chạy (None nếu không qua middleware)."""
+    return _current.get()
+
+
+# ===== Đo thời gian render template =====
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Backend template Django thường, cộng thời gian render vào request đang đo."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+# ===== Gộp số liệu theo tên URL =====
+class EndpointStats:
+    """Số liệu gộp của worker hiện tại, định kỳ ghi vào cache dưới khoá riêng của worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_flush = time.monotonic()
+        self._slot = None
+
+    @property
+    def owner(self):
+        # Tính theo pid mỗi lần: các worker fork từ cùng một tiến trình không dùng chung ô
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _claim_slot(self):
+        owner = self.owner
+        if self._slot is not None:
+            key = SLOT_KEY.format(self._slot)
+            if cache.get(key) == owner:
+                cache.touch(key, STATS_TIMEOUT)
+                return self._slot
+        for slot, key in enumerate(_slot_keys()):
+            if cache.add(key, owner, STATS_TIMEOUT) or cache.get(key) == owner:
+                self._slot = slot
+                return slot
+        self._slot = None
+        logger.warning("Hết ô số liệu cho worker %s (WORKER_SLOTS=%d)", owner, WORKER_SLOTS)
+        return None
+
+    def record(self, endpoint, total_ms, metrics):
+        with self._lock:
+            row = self._stats.setdefault(endpoint, {
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_ms": 0.0, "template_ms": 0.0,
+                "queries": 0, "max_queries": 0, "slowest": [],
+            })
+            row["count"] += 1
+            row["total_ms"] += total_ms
+            row["max_ms"] = max(row["max_ms"], total_ms)
+            row["sql_ms"] += metrics.sql_ms
+            row["template_ms"] += metrics.template_ms
+            row["queries"] += len(metrics.queries)
+            row["max_queries"] = max(row["max_queries"], len(metrics.queries))
+            row["slowest"] = heapq.nlargest(
+                SLOWEST_KEPT, row["slowest"] + [[round(ms, 2), sql[:500]] for ms, sql in metrics.slowest()],
+                key=lambda q: q[0],
+            )
+            if time.monotonic() - self._last_flush < FLUSH_INTERVAL:
+                return
+            self._last_flush = time.monotonic()
+            snapshot = {endpoint: dict(row) for endpoint, row in self._stats.items()}
+        self.flush(snapshot)
+
+    def flush(self, snapshot=None):
+        if snapshot is None:
+            with self._lock:
+                snapshot = {endpoint: dict(row) for endpoint, row in self._stats.items()}
+        slot = self._claim_slot()
+        if slot is not None:
+            cache.set(WORKER_STATS_KEY.format(slot), snapshot, STATS_TIMEOUT)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._slot = None
+        cache.delete_many(_slot_keys() + _worker_stats_keys())
+
+
+endpoint_stats = EndpointStats()
+
+
+def merged_stats():
+    """Gộp số liệu của mọi worker, trả về danh sách dòng kèm các giá trị trung bình."""
+    endpoint_stats.flush()
+    merged = {}
+    for worker in cache.get_many(_worker_stats_keys()).values():
+        for endpoint, row in worker.items():
+            total = merged.setdefault(endpoint, {
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_ms": 0.0, "template_ms": 0.0,
+                "queries": 0, "max_queries": 0, "slowest": [],
+            })
+            for field in ("count", "total_ms", "sql_ms", "template_ms", "queries"):
+                total[field] += row[field]
+            total["max_ms"] = max(total["max_ms"], row["max_ms"])
+            total["max_queries"] = max(total["max_queries"], row["max_queries"])
+            total["slowest"] = heapq.nlargest(SLOWEST_KEPT, total["slowest"] + row["slowest"], key=lambda q: q[0])
+
+    rows = []
+    for endpoint, row in merged.items():
+        count = row["count"]
+        rows.append({
+            "endpoint": endpoint,
+            "count": count,
+            "avg_ms": row["total_ms"] / count,
+            "max_ms": row["max_ms"],
+            "avg_sql_ms": row["sql_ms"] / count,
+            "avg_template_ms": row["template_ms"] / count,
+            "avg_queries": row["queries"] / count,
+            "max_queries": row["max_queries"],
+            "slowest": row["slowest"],
+        })
+    return rows
+
+
+# ===== Middleware =====
+def wrap_queries(metrics):
+    """ExitStack bọc mọi kết nối CSDL của luồng hiện tại bằng ``metrics.record_query``."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics.record_query))
+    return stack
+
+
+class TimedStream:
+    """Bọc nội dung streaming để vẫn đếm truy vấn trong lúc gửi và ghi số liệu khi kết thúc.
+
+    Giống ``exports.SlotReleasingIterator``: ``close()`` được response gọi kể cả khi
+    client ngắt kết nối trước khi đọc dòng nào.
+    """
+
+    def __init__(self, iterable, metrics, on_close):
+        self._iterable = iterable
+        self._metrics = metrics
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            with wrap_queries(self._metrics):
+                yield from self._iterable
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+
+class ServerTimingMiddleware:
+    """Đặt đầu danh sách MIDDLEWARE để tính cả truy vấn của session / xác thực."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with wrap_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        if metrics.view_started is not None:
+            metrics.view_ms = (time.perf_counter() - metrics.view_started) * 1000
+
+        if getattr(settings, "SERVER_TIMING_HEADER", True):
+            response["Server-Timing"] = ", ".join([
+                # Header chỉ chứa ASCII
+                f'db;dur={metrics.sql_ms:.1f};desc="{len(metrics.queries)} queries"',
+                f"tpl;dur={metrics.template_ms:.1f}",
+                f"view;dur={metrics.view_ms:.1f}",
+                f"total;dur={total_ms:.1f}",
+            ])
+        # FileResponse gửi file qua wsgi.file_wrapper (không có truy vấn), bọc lại sẽ mất sendfile
+        if response.streaming and not response.is_async and getattr(response, "file_to_stream", None) is None:
+            response.streaming_content = TimedStream(
+                response.streaming_content, metrics, lambda: self.record(request, response, metrics),
+            )
+        else:
+            self.record(request, response, metrics)
+        return response
+
+    def record(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        match = getattr(request, "resolver_match", None)
+        endpoint = (match.view_name if match else None) or "(không khớp URL)"
+        if getattr(settings, "SERVER_TIMING_LOG", False):
+            logger.info(json.dumps({
+                "endpoint": endpoint,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "total_ms": round(total_ms, 2),
+                "view_ms": round(metrics.view_ms, 2),
+                "sql_ms": round(metrics.sql_ms, 2),
+                "queries": len(metrics.queries),
+                "template_ms": round(metrics.template_ms, 2),
+                "slowest": [{"ms": round(ms, 2), "sql": sql[:500]} for ms, sql in metrics.slowest(3)],
+            }, ensure_ascii=False))
+        endpoint_stats.record(endpoint, total_ms, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
@@ -0,0 +1,98 @@
+"""Bảng xếp hạng điểm danh theo tuần / tháng / học kỳ / toàn thời gian.
+
+Số lượt của mỗi người luôn đọc từ ``DailyAttendanceStat`` (được cộng trong
+cùng giao dịch với dòng ``EntryLog`` của lượt vào, xem ``checkin.check_in`` /
+``checkin.bulk_check_in``, nên không bao giờ mất lượt dù có nhiều worker).
+Cache chỉ giữ một ảnh chụp ngắn hạn của mỗi khoảng thời gian: top
+``TOP_SIZE`` người và danh sách tổng số lượt đã sắp xếp (để tính hạng bằng
+``bisect``), dựng bằng một truy vấn GROUP BY. Lượt điểm danh cố ý không xoá
+ảnh chụp (giờ cao điểm sẽ phải dựng lại liên tục): danh sách top và hạng
+trễ tối đa ``LEADERBOARD_TIMEOUT`` giây, riêng số lượt của chính mình thì
+luôn đúng.
+
+``python manage.py rebuild_leaderboard`` dựng sẵn ảnh chụp cho mọi khoảng.
+"""
+import bisect
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import DailyAttendanceStat
+
+PERIODS = {
+    "week": "Tuần này",
+    "month": "Tháng này",
+    "semester": "Học kỳ này",
+    "all": "Toàn thời gian",
+}
+DEFAULT_PERIOD = "month"
+LEADERBOARD_TIMEOUT = 60
+# Số người đứng đầu được giữ trong ảnh chụp (trang chỉ hiện 10)
+TOP_SIZE = 100
+
+
+def period_start(period, today=None):
+    today = today or timezone.localdate()
+    if period == "week":
+        return today - timedelta(days=today.weekday())
+    if period == "month":
+        return today.replace(day=1)
+    if period == "semester":
+        # Học kỳ 1: tháng 8 → tháng 1 năm sau, học kỳ 2: tháng 2 → tháng 7
+        if today.month >= 8:
+            return date(today.year, 8, 1)
+        if today.month >= 2:
+            return date(today.year, 2, 1)
+        return date(today.year - 1, 8, 1)
+    return None
+
+
+def _cache_key(period, start):
+    return f"leaderboard:{period}:{start or 'all'}"
+
+
+def _stats(start):
+    stats = DailyAttendanceStat.objects.all()
+    return stats.filter(day__gte=start) if start else stats
+
+
+def build(period, today=None):
+    """Dựng ảnh chụp ``{"top": [(user_id, số lượt), ...], "totals": [số lượt tăng dần]}``."""
+    start = period_start(period, today)
+    rows = sorted(
+        _stats(start).values('user_id').annotate(total=Sum('check_ins')).values_list('user_id', 'total'),
+        key=lambda row: (-row[1], row[0]),
+    )
+    board = {"top": rows[:TOP_SIZE], "totals": sorted(total for _, total in rows)}
+    cache.set(_cache_key(period, start), board, LEADERBOARD_TIMEOUT)
+    return board
+
+
+def get_board(period, today=None):
+    board = cache.get(_cache_key(period, period_start(period, today)))
+    return board if board is not None else build(period, today)
+
+
+def top(period, limit=10, today=None):
+    """Trả về ``[(user_id, số lượt), ...]`` của ``limit`` người dẫn đầu (``limit`` ≤ ``TOP_SIZE``)."""
+    return get_board(period, today)["top"][:limit]
+
+
+def count_of(user_id, period, today=None):
+    start = period_start(period, today)
+    return _stats(start).filter(user_id=user_id).aggregate(total=Sum('check_ins'))['total'] or 0
+
+
+def rank_of(user_id, period, today=None):
+    """Trả về ``(hạng, số lượt)`` của một người, hoặc ``(None, 0)`` nếu chưa điểm danh.
+
+    Số lượt đọc trực tiếp (luôn đúng), hạng so với ảnh chụp trong cache.
+    """
+    count = count_of(user_id, period, today)
+    if not count:
+        return None, 0
+    totals = get_board(period, today)["totals"]
+    # Hạng = 1 + số người có nhiều lượt hơn (đồng hạng khi bằng nhau)
+    return len(totals) - bisect.bisect_right(totals, count) + 1, count
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from unidecode import unidecode
+
+from library.models import Book
+from library.search import ranked_search, search_books
+
+
+def legacy_scan(query):
+    """Cách tìm kiếm cũ của book_list: tải toàn bộ sách rồi so khớp bằng Python."""
+    normalized_query = unidecode(query).lower()
+    return [
+        b for b in Book.objects.all()
+        if normalized_query in unidecode(b.title).lower()
+        or normalized_query in unidecode(b.author).lower()
+    ]
+
+
+def with_typo(text, rng):
+    """Bỏ dấu và làm sai một ký tự, mô phỏng cách sinh viên gõ tìm kiếm."""
+    text = unidecode(text).lower()
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1:]
+
+
+class Command(BaseCommand):
+    help = "So sánh thời gian tìm kiếm: duyệt toàn bảng (cũ) với FTS5 và chỉ mục trigram"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=20, help="Số truy vấn lấy mẫu từ tên sách")
+        parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi truy vấn")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        titles = list(Book.objects.values_list("title", flat=True)[:5000])
+        if not titles:
+            self.stdout.write(self.style.WARNING("Chưa có sách nào trong cơ sở dữ liệu."))
+            return
+
+        samples = [rng.choice(titles) for _ in range(options["queries"])]
+        exact_queries = [" ".join(t.split()[-2:]) for t in samples]
+        typo_queries = [with_typo(t, rng) for t in samples]
+
+        methods = [
+            ("Duyệt toàn bảng (cũ)", legacy_scan, exact_queries),
+            ("FTS5 / LIKE chuẩn hoá", lambda q: list(search_books(q)[:12]), exact_queries),
+            ("Trigram (gõ sai)", lambda q: ranked_search(q, limit=12), typo_queries),
+        ]
+
+        self.stdout.write(f"Số sách: {Book.objects.count()}, số truy vấn: {len(samples)}")
+        self.stdout.write(f"{'Phương pháp':<26}{'median (ms)':>14}{'max (ms)':>12}{'có kết quả':>14}")
+        for name, method, queries in methods:
+            timings, hits = [], 0
+            for query in queries:
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    result = method(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                hits += bool(result)
+            self.stdout.write(
+                f"{name:<26}{statistics.median(timings):>14.2f}{max(timings):>12.2f}"
+                f"{hits:>9}/{len(queries)}"
+            )
@@ -0,0 +1,239 @@
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from library import attendance_codes
+from library.models import Book, Borrow, Notification, SubCollection
+
+# Tỉ lệ so với khối lượng mặc định của generate_data (~1 triệu dòng)
+SIZES = {"small": 0.01, "medium": 0.1, "large": 1.0}
+DATASET_DEFAULTS = {"users": 5000, "books": 10000, "borrows": 500000, "notifications": 300000, "entry_logs": 185000}
+
+# url nhận fixtures của bộ dữ liệu; before(fixtures) chạy trước mỗi lần đo, không tính giờ
+Scenario = namedtuple("Scenario", "name method url data staff before", defaults=(None, False, None))
+
+
+def drain(response):
+    """Đọc hết nội dung (kể cả response dạng luồng) để tính đủ thời gian sinh file xuất."""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response.status_code
+
+
+def scenarios():
+    def clear_pending(fx):
+        Borrow.objects.filter(user_id=fx["student_id"], book_id=fx["register_book_id"], status="Đang chờ").delete()
+
+    def mark_unread(fx):
+        Notification.objects.filter(user_id=fx["student_id"]).update(is_read=False)
+
+    def check_in_data(fx):
+        return {"code": attendance_codes.code_for(attendance_codes.current_window())}
+
+    return [
+        Scenario("book_list", "get", lambda fx: reverse("book_list")),
+        Scenario("book_list search", "get", lambda fx: reverse("book_list") + "?q=" + fx["query"]),
+        Scenario("book_list search typo", "get", lambda fx: reverse("book_list") + "?q=" + fx["typo_query"]),
+        Scenario("book_suggest", "get", lambda fx: reverse("book_suggest") + "?q=" + fx["query"][:4]),
+        Scenario("subcollection_books", "get", lambda fx: reverse("subcollection_books", args=[fx["sub_id"]])),
+        Scenario("my_borrows", "get", lambda fx: reverse("my_borrows")),
+        Scenario("register_borrow", "get", lambda fx: reverse("register_borrow", args=[fx["register_book_id"]]),
+                 before=clear_pending),
+        Scenario("load_more_notifications", "get", lambda fx: reverse("load_more_notifications")),
+        Scenario("mark_all_read", "post", lambda fx: reverse("mark_all_read"), before=mark_unread),
+        Scenario("attendance check-in", "post", lambda fx: reverse("attendance_check_in_api"), data=check_in_data),
+        Scenario("attendance_history", "get", lambda fx: reverse("attendance_history")),
+        Scenario("attendance_statistics", "get", lambda fx: reverse("attendance_statistics")),
+        Scenario("attendance_top", "get", lambda fx: reverse("attendance_top") + "?period=semester"),
+        Scenario("admin borrow_statistics", "get", lambda fx: reverse("admin:borrow_statistics"), staff=True),
+        Scenario("admin export overdue xlsx", "get", lambda fx: reverse("admin:export_overdue_to_excel"),
+                 staff=True),
+        Scenario("admin export overdue csv", "get",
+                 lambda fx: reverse("admin:export_overdue_to_excel") + "?format=csv", staff=True),
+        Scenario("admin export borrows csv", "post", lambda fx: reverse("admin:library_borrow_changelist"),
+                 data=lambda fx: {"action": "export_csv", "select_across": "1", "index": "0",
+                                  "_selected_action": [fx["any_borrow_id"]]},
+                 staff=True),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Đo hiệu năng các view quan trọng trên các bộ dữ liệu sinh tự động ở nhiều cỡ: "
+            "p50/p95 thời gian, số truy vấn và bộ nhớ đỉnh; lưu baseline và so sánh với lần trước. "
+            "Mỗi cỡ dữ liệu chạy trên một CSDL thử tạm thời, không đụng tới CSDL thật.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="small,medium", help=f"Các cỡ dữ liệu, trong {', '.join(SIZES)}")
+        parser.add_argument("--iterations", type=int, default=30, help="Số lần đo mỗi view")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--only", help="Chỉ chạy các view có tên chứa chuỗi này")
+        parser.add_argument("--save", metavar="FILE", help="Ghi kết quả ra file JSON làm baseline")
+        parser.add_argument("--compare", metavar="FILE", help="So sánh với một baseline đã lưu")
+        parser.add_argument("--threshold", type=float, default=20.0,
+                            help="Phần trăm tăng p95 coi là chậm đi (mặc định 20)")
+        parser.add_argument("--fail-on-regression", action="store_true",
+                            help="Thoát với lỗi nếu có view chậm đi hoặc tăng số truy vấn")
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options["sizes"].split(",") if size.strip()]
+        unknown = [size for size in sizes if size not in SIZES]
+        if unknown:
+            raise CommandError(f"Cỡ dữ liệu không hợp lệ: {', '.join(unknown)}")
+        selected = [s for s in scenarios() if not options["only"] or options["only"] in s.name]
+
+        results = {}
+        setup_test_environment(debug=False)
+        try:
+            for size in sizes:
+                results[size] = self.run_size(size, selected, options)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            "meta": {"python": platform.python_version(), "database": connection.vendor,
+                     "iterations": options["iterations"], "seed": options["seed"]},
+            "results": results,
+        }
+        if options["save"]:
+            with open(options["save"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Đã lưu baseline vào {options['save']}"))
+        if options["compare"]:
+            regressions = self.compare(options["compare"], results, options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} view chậm đi hoặc tăng số truy vấn so với baseline.")
+
+    def run_size(self, size, selected, options):
+        old_name = connection.settings_dict["NAME"]
+        test_dir = tempfile.mkdtemp(prefix="library-bench-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(test_dir, f"{size}.sqlite3")
+        self.stdout.write(f"\n== Cỡ dữ liệu: {size} ==")
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            scale = SIZES[size]
+            start = time.perf_counter()
+            call_command("generate_data", seed=options["seed"], stdout=io.StringIO(),
+                         **{key: max(1, int(value * scale)) for key, value in DATASET_DEFAULTS.items()})
+            self.stdout.write(f"Sinh dữ liệu: {time.perf_counter() - start:.1f}s")
+            cache.clear()
+            fixtures = self.fixtures()
+            return self.run_scenarios(selected, fixtures, options["iterations"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(test_dir, ignore_errors=True)
+
+    def fixtures(self):
+        """Chọn dữ liệu đại diện: sinh viên mượn nhiều nhất, một phân loại, một tên sách để tìm."""
+        student_id = (
+            Borrow.objects.values("user_id").annotate(n=Count("id")).order_by("-n")
+            .values_list("user_id", flat=True).first()
+        )
+        Notification.objects.filter(user_id=student_id).update(is_read=False)
+        title = Book.objects.order_by("id").values_list("title", flat=True).first()
+        words = title.split()
+        admin = User.objects.create_superuser("__bench_admin__", password=None)
+        return {
+            "student_id": student_id,
+            "admin_id": admin.id,
+            "sub_id": SubCollection.objects.annotate(n=Count("book")).order_by("-n").values_list("id", flat=True)[0],
+            "query": " ".join(words[-3:-1]),
+            "typo_query": words[1].lower()[:-1] + " " + words[2].lower(),
+            "register_book_id": Book.objects.filter(quantity__gt=0).exclude(
+                borrow__user_id=student_id).values_list("id", flat=True).first(),
+            "any_borrow_id": Borrow.objects.values_list("id", flat=True).first(),
+        }
+
+    def run_scenarios(self, selected, fixtures, iterations):
+        clients = {False: Client(), True: Client()}
+        clients[False].force_login(User.objects.get(pk=fixtures["student_id"]))
+        clients[True].force_login(User.objects.get(pk=fixtures["admin_id"]))
+
+        width = max(len(s.name) for s in selected)
+        self.stdout.write(f"{'View':<{width}} {'p50 (ms)':>9} {'p95 (ms)':>9} {'truy vấn':>9} {'bộ nhớ (KB)':>12}")
+        results = {}
+        for scenario in selected:
+            client = clients[scenario.staff]
+
+            def request():
+                if scenario.before:
+                    scenario.before(fixtures)
+                data = scenario.data(fixtures) if callable(scenario.data) else scenario.data
+                url = scenario.url(fixtures)
+                return lambda: drain(getattr(client, scenario.method)(url, data) if data
+                                     else getattr(client, scenario.method)(url))
+
+            # Lần đầu: làm nóng cache, đếm truy vấn và đo bộ nhớ đỉnh
+            send = request()
+            reset_queries()
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as captured:
+                status = send()
+            # Đếm ngay: các request sau sẽ xoá nhật ký truy vấn (reset_queries)
+            queries = len(captured)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if status >= 400:
+                self.stdout.write(self.style.WARNING(f"{scenario.name}: HTTP {status}"))
+
+            samples = []
+            for _ in range(iterations):
+                send = request()
+                start = time.perf_counter()
+                send()
+                samples.append((time.perf_counter() - start) * 1000)
+
+            p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]
+            results[scenario.name] = {
+                "p50_ms": round(statistics.median(samples), 3),
+                "p95_ms": round(p95, 3),
+                "queries": queries,
+                "peak_kb": round(peak / 1024, 1),
+            }
+            r = results[scenario.name]
+            self.stdout.write(f"{scenario.name:<{width}} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                              f"{r['queries']:>9} {r['peak_kb']:>12.1f}")
+        return results
+
+    def compare(self, path, results, threshold):
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+        regressions = 0
+        self.stdout.write(f"\n== So sánh với {path} (ngưỡng p95 +{threshold:g}%) ==")
+        for size, views in results.items():
+            for name, new in views.items():
+                old = baseline.get(size, {}).get(name)
+                if old is None:
+                    self.stdout.write(f"[{size}] {name}: mới, chưa có trong baseline")
+                    continue
+                change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+                line = (f"[{size}] {name}: p95 {old['p95_ms']:.2f} → {new['p95_ms']:.2f} ms ({change:+.0f}%), "
+                        f"truy vấn {old['queries']} → {new['queries']}, "
+                        f"bộ nhớ {old['peak_kb']:.0f} → {new['peak_kb']:.0f} KB")
+                if change > threshold or new["queries"] > old["queries"]:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(line))
+                elif change < -threshold or new["queries"] < old["queries"]:
+                    self.stdout.write(self.style.SUCCESS(line))
+                else:
+                    self.stdout.write(line)
+        return regressions
@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from library.models import Book, Borrow, EntryLog, Notification
+
+LOADTEST_PREFIX = "__explain_hot_queries_"
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries(user_id, today):
+    """(tên, chỉ mục mong đợi, queryset) của các truy vấn nóng trong views.py / admin.py."""
+    return [
+        ("Cảnh báo quá hạn (book_list)", "borrow_user_status_idx",
+         Borrow.objects.filter(user_id=user_id, status="Đang mượn", due_date__lt=today)),
+        ("Yêu cầu đang chờ của một người", "borrow_user_status_idx",
+         Borrow.objects.filter(user_id=user_id, status="Đang chờ")),
+        ("Sách quá hạn (admin xuất Excel)", "borrow_status_due_idx",
+         Borrow.objects.filter(status="Đang mượn", due_date__lt=today)),
+        ("Nhắc hạn trả (send_due_reminders)", "borrow_status_due_idx",
+         Borrow.objects.filter(status="Đang mượn", due_date__lte=today + timedelta(days=7))),
+        ("Số thông báo chưa đọc", "notif_unread_idx",
+         Notification.objects.filter(user_id=user_id, is_read=False)),
+        ("Lịch sử vào ra (attendance_history)", "entrylog_user_checkin_idx",
+         EntryLog.objects.filter(user_id=user_id).order_by("-check_in")[:10]),
+    ]
+
+
+def hot_indexes():
+    names = {expected for _, expected, _ in hot_queries(0, timezone.localdate())}
+    return [
+        (model, index)
+        for model in (Borrow, Notification, EntryLog)
+        for index in model._meta.indexes
+        if index.name in names
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Tạo dữ liệu giả lớn, kiểm tra bằng EXPLAIN rằng mỗi truy vấn nóng dùng đúng chỉ mục, "
+            "rồi so sánh thời gian khi có và không có chỉ mục. Mọi thay đổi được hoàn tác khi kết thúc.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--rows", type=int, default=200000, help="Số dòng Borrow / Notification / EntryLog")
+        parser.add_argument("--repeat", type=int, default=50, help="Số lần chạy mỗi truy vấn để lấy trung vị")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        try:
+            with transaction.atomic():
+                self.generate(options["users"], options["rows"])
+                self.report(options["repeat"])
+                raise Rollback
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS("Đã hoàn tác dữ liệu giả và chỉ mục."))
+
+    def generate(self, n_users, n_rows):
+        start = time.perf_counter()
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f"{LOADTEST_PREFIX}{i}", password=password) for i in range(n_users)],
+            batch_size=1000,
+        )
+        self.user_ids = list(User.objects.filter(username__startswith=LOADTEST_PREFIX).values_list("id", flat=True))
+        Book.objects.bulk_create([Book(title=f"Sách thử {i}", author="Tác giả", quantity=5) for i in range(200)])
+        book_ids = list(Book.objects.filter(title__startswith="Sách thử ").values_list("id", flat=True))
+
+        rng, today, now = self.rng, timezone.localdate(), timezone.now()
+        # Đa số lượt mượn đã trả, như dữ liệu thật sau vài năm
+        statuses = ["Đã trả"] * 8 + ["Đang mượn", "Đang chờ"]
+        borrows = []
+        for i in range(n_rows):
+            status = rng.choice(statuses)
+            # Sách đang mượn / đang chờ là các lượt gần đây, còn lại rải đều trong 4 năm
+            borrow_date = today - timedelta(days=rng.randrange(1500 if status == "Đã trả" else 90))
+            borrows.append(Borrow(
+                user_id=rng.choice(self.user_ids), book_id=rng.choice(book_ids), borrow_code=f"EXPL{i}",
+                status=status, borrow_date=borrow_date,
+                due_date=None if status == "Đang chờ" else borrow_date + timedelta(days=60),
+                return_date=borrow_date + timedelta(days=20) if status == "Đã trả" else None,
+            ))
+        Borrow.objects.bulk_create(borrows, batch_size=2000)
+
+        Notification.objects.bulk_create(
+            [Notification(user_id=rng.choice(self.user_ids), title="Thông báo", message="",
+                          is_read=rng.random() < 0.9) for _ in range(n_rows)],
+            batch_size=2000,
+        )
+
+        # Mỗi (user, buổi, ngày) chỉ một dòng: đi lần lượt qua các ngày
+        logs = []
+        for i in range(n_rows):
+            user_id = self.user_ids[i % n_users]
+            moment = now - timedelta(days=i // n_users, hours=rng.randrange(1, 4))
+            logs.append(EntryLog(user_id=user_id, shift="Sáng", day=timezone.localdate(moment), check_in=moment))
+        EntryLog.objects.bulk_create(logs, batch_size=2000)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stdout.write(f"Đã tạo {n_users} người dùng, {n_rows} dòng mỗi bảng trong "
+                          f"{time.perf_counter() - start:.1f}s")
+
+    def timed(self, queryset, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    def report(self, repeat):
+        user_id = self.rng.choice(self.user_ids)
+        queries = hot_queries(user_id, timezone.localdate())
+
+        failures = []
+        with_index = {}
+        for label, expected, queryset in queries:
+            plan = queryset.explain()
+            if expected not in plan:
+                failures.append(f"{label}: không dùng {expected}\n    {plan}")
+            with_index[label] = self.timed(queryset, repeat)
+
+        # DROP INDEX trong giao dịch, được hoàn tác cùng dữ liệu giả
+        drop_index, quote = connection.schema_editor().sql_delete_index, connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model, index in hot_indexes():
+                cursor.execute(drop_index % {"table": quote(model._meta.db_table), "name": quote(index.name)})
+            cursor.execute("ANALYZE")
+        without_index = {label: self.timed(queryset, repeat) for label, _, queryset in queries}
+
+        width = max(len(label) for label, _, _ in queries)
+        self.stdout.write(f"\n{'Truy vấn':<{width}}  {'Chỉ mục':<26} {'Không (ms)':>10} {'Có (ms)':>9} {'Nhanh hơn':>9}")
+        for label, expected, _ in queries:
+            before, after = without_index[label], with_index[label]
+            self.stdout.write(f"{label:<{width}}  {expected:<26} {before:>10.3f} {after:>9.3f} "
+                              f"{before / after if after else float('inf'):>8.1f}x")
+
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(failure))
+            raise CommandError("Có truy vấn nóng không dùng chỉ mục mong đợi.")
+        self.stdout.write(self.style.SUCCESS("\nMọi truy vấn nóng đều dùng đúng chỉ mục."))
@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+from library.fulltext import FAILED_PREFIX, extract_pages, extraction_available, failed_marker, store_pages
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = "Trích văn bản các file PDF của sách vào chỉ mục toàn văn (dùng nhiều tiến trình)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--force", action="store_true",
+                            help="Trích lại cả những PDF đã có trong chỉ mục hoặc đã trích lỗi")
+
+    def handle(self, *args, **options):
+        if not extraction_available():
+            raise CommandError("Cần cài pypdf để trích văn bản PDF: pip install pypdf")
+
+        books = Book.objects.exclude(pdf="").exclude(pdf__isnull=True)
+        if not options["force"]:
+            books = books.exclude(pdf_indexed=F("pdf")).exclude(pdf_indexed=Concat(Value(FAILED_PREFIX), F("pdf")))
+        jobs = {}
+        for book in books.only("id", "pdf"):
+            try:
+                jobs[book.id] = (book.pdf.name, book.pdf.path)
+            except NotImplementedError:
+                raise CommandError("Storage hiện tại không có đường dẫn file cục bộ.")
+        jobs = {book_id: job for book_id, job in jobs.items() if os.path.exists(job[1])}
+        if not jobs:
+            self.stdout.write("Không có PDF nào cần xử lý.")
+            return
+
+        # Tiến trình con chỉ đọc file và trả về văn bản; việc ghi CSDL làm ở tiến trình chính
+        start = time.perf_counter()
+        pages, failed = 0, {}
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {pool.submit(extract_pages, path): book_id for book_id, (name, path) in jobs.items()}
+            for future in as_completed(futures):
+                book_id = futures[future]
+                try:
+                    texts = future.result()
+                except Exception as exc:  # PDF hỏng / mã hoá không được làm dừng cả lệnh
+                    failed[book_id] = exc
+                    store_pages(book_id, failed_marker(jobs[book_id][0]), [])
+                    continue
+                store_pages(book_id, jobs[book_id][0], texts)
+                pages += sum(1 for text in texts if text)
+
+        self.stdout.write(
+            f"Đã xử lý {len(jobs) - len(failed)}/{len(jobs)} PDF, {pages} trang có chữ "
+            f"trong {time.perf_counter() - start:.1f}s ({options['workers']} tiến trình)"
+        )
+        for book_id, exc in failed.items():
+            self.stdout.write(self.style.WARNING(f"  {jobs[book_id][0]}: {exc}"))
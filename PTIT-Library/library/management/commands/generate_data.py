@@ -0,0 +1,209 @@
+import io
+import itertools
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from library.models import Book, Borrow, EntryLog, Notification, SubCollection
+from library.search import normalize_text, rebuild_trigram_index
+from library.sequences import reserve_block
+from library.stats import rebuild_attendance_stats, rebuild_borrow_stats
+
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+MIDDLE_NAMES = ["Văn", "Thị", "Đức", "Minh", "Thu", "Ngọc", "Quốc", "Thanh", "Hữu", "Gia"]
+FIRST_NAMES = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Hải", "Huy", "Khánh", "Lan", "Linh", "Long",
+               "Mai", "Nam", "Phong", "Quân", "Sơn", "Thảo", "Trang", "Tuấn", "Việt", "Yến"]
+TOPICS = ["Lập trình Python", "Cấu trúc dữ liệu và giải thuật", "Mạng máy tính", "Cơ sở dữ liệu",
+          "An toàn thông tin", "Kỹ thuật viễn thông", "Xử lý tín hiệu số", "Điện tử số", "Trí tuệ nhân tạo",
+          "Học máy", "Kế toán tài chính", "Quản trị doanh nghiệp", "Marketing căn bản", "Toán rời rạc",
+          "Xác suất thống kê", "Hệ điều hành", "Đồ hoạ máy tính", "Thiết kế đa phương tiện", "Kỹ năng mềm"]
+KINDS = ["Giáo trình", "Bài giảng", "Nhập môn", "Cơ sở", "Thực hành", "Nâng cao", "Tuyển tập bài tập"]
+PUBLISHERS = ["Học viện Công nghệ Bưu Chính Viễn Thông", "NXB Giáo dục Việt Nam", "NXB Khoa học và Kỹ thuật",
+              "NXB Thông tin và Truyền thông", "NXB Trẻ"]
+MAJORS = ["CN", "AT", "VT", "DT", "MR", "KT", "QT"]
+
+PENDING, BORROWING, RETURNED = "Đang chờ", "Đang mượn", "Đã trả"
+
+
+class Command(BaseCommand):
+    help = ("Sinh dữ liệu giả quy mô lớn (người dùng, sách, lượt mượn, thông báo, lượt vào ra) "
+            "trên cây bộ sưu tập của seed_collections, để đo hiệu năng với dữ liệu giống thật")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Cùng seed cho ra cùng dữ liệu")
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--books", type=int, default=10000)
+        parser.add_argument("--borrows", type=int, default=500000)
+        parser.add_argument("--notifications", type=int, default=300000)
+        parser.add_argument("--entry-logs", type=int, default=185000)
+        parser.add_argument("--days", type=int, default=4 * 365, help="Số ngày lịch sử")
+        parser.add_argument("--password", default="123456", help="Mật khẩu chung của mọi người dùng sinh ra")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--skip-derived", action="store_true",
+            help="Không dựng lại chỉ mục trigram và các bảng tổng hợp sau khi sinh",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.today = timezone.localdate()
+        self.days = max(1, options["days"])
+        started = time.perf_counter()
+
+        call_command("seed_collections", stdout=io.StringIO())
+        with transaction.atomic():
+            user_ids = self.step("người dùng", self.create_users, options["users"], options["password"])
+            book_ids = self.step("sách", self.create_books, options["books"])
+            self.step("lượt mượn", self.create_borrows, options["borrows"], user_ids, book_ids)
+            self.step("thông báo", self.create_notifications, options["notifications"], user_ids)
+            self.step("lượt vào ra", self.create_entry_logs, options["entry_logs"], user_ids)
+        total = sum(options[key] for key in ("users", "books", "borrows", "notifications", "entry_logs"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã sinh {total} dòng trong {time.perf_counter() - started:.1f}s (seed={options['seed']})"
+        ))
+
+        if not options["skip_derived"]:
+            self.step("chỉ mục trigram", lambda: rebuild_trigram_index(batch_size=self.batch_size))
+            self.step("bảng tổng hợp mượn trả", rebuild_borrow_stats)
+            self.step("bảng tổng hợp điểm danh", rebuild_attendance_stats)
+
+    def step(self, label, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f"  {label}: {time.perf_counter() - start:.1f}s")
+        return result
+
+    def random_day(self, max_days=None):
+        return self.today - timedelta(days=self.rng.randrange(max_days or self.days))
+
+    def create_users(self, n, password):
+        # Băm mật khẩu một lần rồi dùng chung: make_password cho từng người mất hàng chục phút
+        password = make_password(password)
+        rng = self.rng
+        users = []
+        for i in range(n):
+            year = 20 + i % 5
+            users.append(User(
+                username=f"B{year}DC{MAJORS[i % len(MAJORS)]}{i:05d}",
+                password=password,
+                first_name=f"{rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)}",
+                last_name=rng.choice(LAST_NAMES),
+                date_joined=timezone.make_aware(datetime(2000 + year, 9, 1)),
+            ))
+        User.objects.bulk_create(users, batch_size=self.batch_size, ignore_conflicts=True)
+        return list(User.objects.filter(username__in=[u.username for u in users]).values_list("id", flat=True))
+
+    def create_books(self, n):
+        rng = self.rng
+        sub_ids = list(SubCollection.objects.values_list("id", flat=True))
+        books = []
+        for i in range(n):
+            title = f"{rng.choice(KINDS)} {rng.choice(TOPICS)} - Tập {i % 7 + 1}"
+            author = f"{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)}"
+            # bulk_create không gọi Book.save(), phải tự điền các trường chuẩn hoá
+            books.append(Book(
+                title=title, author=author, quantity=rng.randrange(0, 20),
+                subcollection_id=rng.choice(sub_ids), publish_year=str(rng.randrange(2000, 2026)),
+                publisher=rng.choice(PUBLISHERS),
+                title_normalized=normalize_text(title)[:200], author_normalized=normalize_text(author)[:100],
+            ))
+        created = Book.objects.bulk_create(books, batch_size=self.batch_size)
+        if created and created[0].pk is not None:
+            return [book.pk for book in created]
+        return list(Book.objects.order_by("-id").values_list("id", flat=True)[:n])
+
+    def insert_rows(self, model, field_names, rows):
+        """Ghi các bộ giá trị bằng một câu INSERT chuẩn bị sẵn (``executemany``), bỏ qua dòng trùng khoá.
+
+        Với các bảng lớn, ``bulk_create`` tốn ~85µs/dòng để dựng SQL cho từng giá trị (SQLite chỉ
+        cho ~140 dòng mỗi câu), chậm hơn cả việc ghi. Giá trị ngày giờ phải qua ``adapt_*`` trước.
+        """
+        ops, opts = connection.ops, model._meta
+        fields = [opts.get_field(name) for name in field_names]
+        sql = "{insert} {table} ({columns}) VALUES ({values}) {suffix}".format(
+            insert=ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            table=ops.quote_name(opts.db_table),
+            columns=", ".join(ops.quote_name(field.column) for field in fields),
+            values=", ".join(["%s"] * len(fields)),
+            suffix=ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None) or "",
+        )
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            while batch := list(itertools.islice(rows, self.batch_size)):
+                cursor.executemany(sql, batch)
+
+    def create_borrows(self, n, user_ids, book_ids):
+        rng, adapt_date = self.rng, connection.ops.adapt_datefield_value
+        # Mã mượn lấy từ cùng bộ đếm với Borrow.save() để không trùng với mã cấp sau này
+        first_code, _ = reserve_block("borrow_code", n)
+        # Sách được mượn không đều: một số ít sách phổ biến chiếm phần lớn lượt mượn
+        weights = [1 / (rank + 1) for rank in range(len(book_ids))]
+        picked_books = rng.choices(book_ids, weights=weights, k=n)
+
+        def rows():
+            for i in range(n):
+                roll = rng.random()
+                if roll < 0.85:
+                    status, borrow_date = RETURNED, self.random_day()
+                    due_date = borrow_date + timedelta(days=60)
+                    return_date = min(self.today, borrow_date + timedelta(days=rng.randrange(1, 75)))
+                elif roll < 0.97:
+                    status, borrow_date = BORROWING, self.random_day(90)  # ~1/3 đã quá hạn
+                    due_date, return_date = borrow_date + timedelta(days=60), None
+                else:
+                    status, borrow_date, due_date, return_date = PENDING, self.random_day(7), None, None
+                yield (rng.choice(user_ids), picked_books[i], f"BRC{first_code + i:04d}", adapt_date(borrow_date),
+                       adapt_date(due_date), adapt_date(return_date), status)
+
+        self.insert_rows(Borrow, ["user", "book", "borrow_code", "borrow_date", "due_date", "return_date", "status"],
+                         rows())
+
+    def create_notifications(self, n, user_ids):
+        rng, adapt_datetime = self.rng, connection.ops.adapt_datetimefield_value
+        titles = ["Yêu cầu mượn sách đã được duyệt", "Bạn đã trả sách thành công",
+                  "Sắp đến hạn trả sách", "Sách đã quá hạn trả"]
+        tz = timezone.get_current_timezone()
+
+        def rows():
+            for _ in range(n):
+                day = self.random_day()
+                created_at = datetime.combine(day, dt_time(rng.randrange(7, 21), rng.randrange(60)), tzinfo=tz)
+                # Thông báo cũ hơn một tháng đều đã đọc, tháng gần nhất còn ~10% chưa đọc
+                is_read = rng.random() < 0.9 or (self.today - day).days > 30
+                yield (rng.choice(user_ids), rng.choice(titles), "Thông báo tự động từ thư viện.",
+                       adapt_datetime(created_at), is_read)
+
+        self.insert_rows(Notification, ["user", "title", "message", "created_at", "is_read"], rows())
+
+    def create_entry_logs(self, n, user_ids):
+        rng, adapt_date, adapt_datetime = self.rng, connection.ops.adapt_datefield_value, \
+            connection.ops.adapt_datetimefield_value
+        tz = timezone.get_current_timezone()
+        # Mỗi sinh viên đi qua các (ngày, buổi) riêng biệt để không vi phạm khoá (user, shift, day)
+        slots_per_user = min(max(1, -(-n // len(user_ids))), self.days * 2)
+
+        def rows():
+            remaining = n
+            for user_id in user_ids:
+                for slot in rng.sample(range(self.days * 2), slots_per_user):
+                    if not remaining:
+                        return
+                    remaining -= 1
+                    day = self.today - timedelta(days=slot // 2)
+                    shift = "Sáng" if slot % 2 == 0 else "Chiều"
+                    start_hour = 7 if shift == "Sáng" else 13
+                    check_in = datetime.combine(day, dt_time(start_hour + rng.randrange(3), rng.randrange(60)),
+                                                tzinfo=tz)
+                    check_out = check_in + timedelta(minutes=rng.randrange(30, 240)) if day < self.today else None
+                    yield user_id, shift, adapt_date(day), adapt_datetime(check_in), adapt_datetime(check_out)
+
+        self.insert_rows(EntryLog, ["user", "shift", "day", "check_in", "check_out"], rows())
@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from library.models import Book, Collection
+from library.thumbnails import SIZES, generate_renditions, rendition_name
+
+
+class Command(BaseCommand):
+    help = "Tạo ảnh thu nhỏ (WebP + JPEG) cho các ảnh bìa sách và ảnh bộ sưu tập đã có"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--force", action="store_true", help="Tạo lại cả những ảnh đã có bản thu nhỏ")
+
+    def handle(self, *args, **options):
+        names = set(Book.objects.exclude(cover="").exclude(cover__isnull=True).values_list("cover", flat=True))
+        names |= set(Collection.objects.exclude(image="").exclude(image__isnull=True).values_list("image", flat=True))
+        names = sorted(name for name in names if default_storage.exists(name))
+        if not names:
+            self.stdout.write("Không có ảnh nào cần xử lý.")
+            return
+
+        start = time.perf_counter()
+        failed = {}
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {pool.submit(generate_renditions, name, options["force"]): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as exc:  # ảnh hỏng không được làm dừng cả lệnh
+                    failed[futures[future]] = exc
+
+        ok = [name for name in names if name not in failed]
+        original = sum(default_storage.size(name) for name in ok)
+        small = sum(default_storage.size(rendition_name(name, SIZES[0], "webp")) for name in ok)
+        self.stdout.write(f"Đã xử lý {len(ok)}/{len(names)} ảnh trong {time.perf_counter() - start:.1f}s")
+        if original:
+            self.stdout.write(f"Ảnh gốc: {original / 1024:.0f} KB, bản WebP {SIZES[0]}px: {small / 1024:.0f} KB "
+                              f"({original / max(small, 1):.0f} lần nhỏ hơn)")
+        for name, exc in failed.items():
+            self.stdout.write(self.style.WARNING(f"  {name}: {exc}"))
@@ -0,0 +1,100 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from library import attendance_codes, checkin
+
+LOADTEST_PREFIX = "__loadtest_checkin_"
+
+
+class Command(BaseCommand):
+    help = ("Đo số lượt điểm danh / giây lúc mở cửa: mỗi sinh viên quét vào rồi quét ra. "
+            "Mỗi lượt quét là một request HTTP thật (middleware, session, commit riêng); "
+            "dữ liệu thử được xoá khi kết thúc.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument(
+            "--bulk", type=int, default=0,
+            help="Gửi theo lô N lượt quét (như máy quét thẻ); 0 = từng lượt như kiosk",
+        )
+        parser.add_argument("--keep", action="store_true", help="Giữ lại dữ liệu thay vì xoá")
+
+    def handle(self, *args, **options):
+        n_users, bulk = options["users"], options["bulk"]
+        # Client gửi request qua toàn bộ handler; Host phải nằm trong ALLOWED_HOSTS
+        host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f"{LOADTEST_PREFIX}{i}", password=password) for i in range(n_users)],
+            batch_size=500,
+        )
+        users = list(User.objects.filter(username__startswith=LOADTEST_PREFIX))
+        clients = []
+        try:
+            if bulk:
+                staff = User.objects.create(username=f"{LOADTEST_PREFIX}staff", password=password, is_staff=True)
+                results, elapsed, n_scans = self.run_bulk(self.login(staff, host, clients), users, bulk)
+            else:
+                results, elapsed, n_scans = self.run_kiosk([self.login(u, host, clients) for u in users])
+        finally:
+            if not options["keep"]:
+                for client in clients:
+                    client.logout()
+                User.objects.filter(username__startswith=LOADTEST_PREFIX).delete()
+
+        mode = f"theo lô {bulk}" if bulk else "từng lượt"
+        self.stdout.write(f"Chế độ: {mode}, {n_users} sinh viên, {n_scans} lượt quét")
+        self.stdout.write(f"Kết quả: {results}")
+        self.stdout.write(f"Thời gian: {elapsed:.2f}s, thông lượng: {n_scans / elapsed:.0f} lượt/giây")
+        if options["keep"]:
+            self.stdout.write(self.style.WARNING(f"Đã giữ lại dữ liệu (người dùng {LOADTEST_PREFIX}*)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Đã xoá dữ liệu thử."))
+
+    @staticmethod
+    def login(user, host, clients):
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        clients.append(client)
+        return client
+
+    def run_kiosk(self, clients):
+        """Mỗi sinh viên gửi mã điểm danh hai lần (vào rồi ra), xen kẽ giữa các sinh viên."""
+        url = reverse("attendance_check_in_api")
+        results = {}
+        start = time.perf_counter()
+        for _ in range(2):
+            for client in clients:
+                code = attendance_codes.code_for(attendance_codes.current_window())
+                response = client.post(url, {"code": code})
+                status = response.json().get("status", response.status_code)
+                results[status] = results.get(status, 0) + 1
+        return results, time.perf_counter() - start, 2 * len(clients)
+
+    def run_bulk(self, client, users, bulk):
+        """Máy quét gửi các lô JSON; giờ quét là buổi sáng mở cửa như ngoài thực tế."""
+        url = reverse("attendance_bulk_check_in")
+        opening = timezone.localtime().replace(hour=7, minute=30, second=0, microsecond=0)
+        entries = [{"username": u.username, "time": (opening + timedelta(seconds=i)).isoformat()}
+                   for i, u in enumerate(users)]
+        entries += [{"username": u.username, "time": (opening + timedelta(hours=2, seconds=i)).isoformat()}
+                    for i, u in enumerate(users)]
+        results = {}
+        start = time.perf_counter()
+        for i in range(0, len(entries), bulk):
+            response = client.post(url, json.dumps({"entries": entries[i:i + bulk]}),
+                                   content_type="application/json")
+            data = response.json()
+            for status in (checkin.CHECKED_IN, checkin.CHECKED_OUT, checkin.COMPLETED):
+                results[status] = results.get(status, 0) + data.get(status, 0)
+        return results, time.perf_counter() - start, len(entries)
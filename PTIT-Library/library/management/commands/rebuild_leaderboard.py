@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from library import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Dựng sẵn ảnh chụp bảng xếp hạng điểm danh trong cache"
+
+    def handle(self, *args, **options):
+        for period, label in leaderboard.PERIODS.items():
+            board = leaderboard.build(period)
+            self.stdout.write(f"{label}: {len(board['totals'])} sinh viên")
+        self.stdout.write(self.style.SUCCESS("Đã dựng lại bảng xếp hạng."))
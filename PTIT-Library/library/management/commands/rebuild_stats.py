@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library.stats import rebuild_attendance_stats, rebuild_borrow_stats
+
+
+class Command(BaseCommand):
+    help = "Dựng lại các bảng thống kê tổng hợp (mượn / trả, vào ra) từ dữ liệu gốc"
+
+    def handle(self, *args, **options):
+        borrow_rows = rebuild_borrow_stats()
+        attendance_rows = rebuild_attendance_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã dựng lại {borrow_rows} dòng thống kê mượn và {attendance_rows} dòng thống kê vào ra."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from library.reminders import DUE_SOON_DAYS, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = "Gửi thông báo nhắc các lượt mượn sắp đến hạn hoặc đã quá hạn (chạy định kỳ, ví dụ bằng cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=DUE_SOON_DAYS,
+                            help="Nhắc trước hạn trả bao nhiêu ngày")
+
+    def handle(self, *args, **options):
+        created = send_due_reminders(days_before=options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Đã tạo {created} thông báo nhắc hạn trả."))
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from library.models import Book, Borrow, Sequence
+from library.sequences import SequenceAllocator
+
+STRESS_SEQUENCE = "stress_borrow_code"
+STRESS_USERNAME = "__stress_borrow_codes__"
+
+
+class Command(BaseCommand):
+    help = "Kiểm tra tải bộ cấp mã mượn: nhiều luồng cấp mã đồng thời, đếm số mã trùng và thông lượng"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--per-thread", type=int, default=200)
+        parser.add_argument("--block-size", type=int, default=1, help="Số mã mỗi luồng giữ trước")
+        parser.add_argument(
+            "--insert", action="store_true",
+            help="Tạo bản ghi Borrow thật (qua Borrow.save) thay vì chỉ cấp mã; các bản ghi được xoá "
+                 "sau khi chạy nhưng các số đã cấp của bộ đếm mã mượn không được hoàn lại",
+        )
+
+    def handle(self, *args, **options):
+        threads, per_thread = options["threads"], options["per_thread"]
+        results, errors = [], []
+        results_lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        if options["insert"]:
+            user, _ = User.objects.get_or_create(username=STRESS_USERNAME)
+            book = Book.objects.create(title="Stress test", author="Stress test", quantity=0)
+            allocator = None
+        else:
+            allocator = SequenceAllocator(STRESS_SEQUENCE, block_size=options["block_size"])
+
+        def worker():
+            codes = []
+            try:
+                barrier.wait()
+                for _ in range(per_thread):
+                    if allocator:
+                        codes.append(allocator.next_value())
+                    else:
+                        codes.append(Borrow.objects.create(user=user, book=book).borrow_code)
+            except Exception as exc:  # ghi lại lỗi để báo cáo, không dừng các luồng khác
+                with results_lock:
+                    errors.append(repr(exc))
+            finally:
+                connection.close()
+                with results_lock:
+                    results.extend(codes)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        duplicates = {code: n for code, n in Counter(results).items() if n > 1}
+        mode = "tạo Borrow" if options["insert"] else f"cấp mã (khối {options['block_size']})"
+        self.stdout.write(f"Chế độ: {mode}, {threads} luồng x {per_thread}")
+        self.stdout.write(f"Số mã đã cấp: {len(results)}, mã trùng: {len(duplicates)}, lỗi: {len(errors)}")
+        self.stdout.write(f"Thời gian: {elapsed:.2f}s, thông lượng: {len(results) / elapsed:.0f} mã/giây")
+        for error in errors[:5]:
+            self.stdout.write(self.style.WARNING(f"  {error}"))
+
+        if options["insert"]:
+            book.delete()
+            user.delete()
+        else:
+            Sequence.objects.filter(name=STRESS_SEQUENCE).delete()
+
+        if duplicates:
+            self.stdout.write(self.style.ERROR(f"Phát hiện mã trùng: {list(duplicates)[:10]}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Không có mã trùng."))
@@ -0,0 +1,79 @@
+from django.db import migrations, models
+from unidecode import unidecode
+
+
+def normalize(value):
+    return " ".join(unidecode(value or "").lower().split())
+
+
+def fill_normalized_fields(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    books = list(Book.objects.only('id', 'title', 'author'))
+    for book in books:
+        book.title_normalized = normalize(book.title)[:200]
+        book.author_normalized = normalize(book.author)[:100]
+    Book.objects.bulk_update(books, ['title_normalized', 'author_normalized'], batch_size=500)
+
+
+# DDL được chép cố định tại đây (không import library.search) để migration
+# vẫn chạy đúng khi mã của ứng dụng thay đổi về sau.
+FTS_TABLE = "library_book_fts"
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title_normalized, author_normalized,
+        content='library_book', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title_normalized, author_normalized)
+        VALUES (new.id, new.title_normalized, new.author_normalized);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title_normalized, author_normalized)
+        VALUES ('delete', old.id, old.title_normalized, old.author_normalized);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title_normalized, author_normalized ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title_normalized, author_normalized)
+        VALUES ('delete', old.id, old.title_normalized, old.author_normalized);
+        INSERT INTO {FTS_TABLE}(rowid, title_normalized, author_normalized)
+        VALUES (new.id, new.title_normalized, new.author_normalized);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_collection_book_cover_subcollection_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='title_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_normalized_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from unidecode import unidecode
+
+
+def normalize(value):
+    return " ".join(unidecode(value or "").lower().split())
+
+
+def trigrams(text):
+    # Bản chép cố định của library.search.trigrams tại thời điểm tạo migration
+    result = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def book_trigrams(book):
+    return trigrams(book.title) | trigrams(book.author)
+
+
+def build_trigram_index(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    BookTrigram = apps.get_model('library', 'BookTrigram')
+    BookTrigram.objects.bulk_create(
+        [
+            BookTrigram(book_id=book.id, trigram=t)
+            for book in Book.objects.only('id', 'title', 'author')
+            for t in book_trigrams(book)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_book_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='library.book')),
+            ],
+            options={
+                'unique_together': {('trigram', 'book')},
+            },
+        ),
+        migrations.RunPython(build_trigram_index, migrations.RunPython.noop),
+    ]
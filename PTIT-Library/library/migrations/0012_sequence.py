@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+def seed_borrow_code_sequence(apps, schema_editor):
+    """Bắt đầu bộ đếm từ số lớn nhất đang có (mã cũ là BRC + id)."""
+    Borrow = apps.get_model('library', 'Borrow')
+    Sequence = apps.get_model('library', 'Sequence')
+    last = Borrow.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for code in Borrow.objects.filter(borrow_code__startswith='BRC').values_list('borrow_code', flat=True):
+        if code[3:].isdigit():
+            last = max(last, int(code[3:]))
+    Sequence.objects.update_or_create(name='borrow_code', defaults={'value': last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_notification_cursor_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm',
+                'verbose_name_plural': 'Bộ đếm',
+            },
+        ),
+        migrations.RunPython(seed_borrow_code_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_rollups(apps, schema_editor):
+    """Dựng các bảng tổng hợp từ dữ liệu hiện có (giống lệnh rebuild_stats)."""
+    Borrow = apps.get_model('library', 'Borrow')
+    EntryLog = apps.get_model('library', 'EntryLog')
+    DailyBorrowStat = apps.get_model('library', 'DailyBorrowStat')
+    BookBorrowStat = apps.get_model('library', 'BookBorrowStat')
+    DailyAttendanceStat = apps.get_model('library', 'DailyAttendanceStat')
+
+    daily = {}
+    borrowed = (
+        Borrow.objects.filter(status__in=["Đang mượn", "Đã trả"])
+        .values('book_id', 'borrow_date').annotate(n=Count('id'))
+    )
+    for row in borrowed:
+        key = (row['borrow_date'], row['book_id'])
+        daily.setdefault(key, DailyBorrowStat(day=key[0], book_id=key[1])).borrowed = row['n']
+    returned = (
+        Borrow.objects.filter(status="Đã trả", return_date__isnull=False)
+        .values('book_id', 'return_date').annotate(n=Count('id'))
+    )
+    for row in returned:
+        key = (row['return_date'], row['book_id'])
+        daily.setdefault(key, DailyBorrowStat(day=key[0], book_id=key[1])).returned = row['n']
+    DailyBorrowStat.objects.bulk_create(daily.values(), batch_size=1000)
+
+    per_book = (
+        Borrow.objects.filter(status__in=["Đang mượn", "Đã trả"]).values('book_id')
+        .annotate(total=Count('id'), borrowing=Count('id', filter=Q(status="Đang mượn")))
+    )
+    BookBorrowStat.objects.bulk_create(
+        [BookBorrowStat(book_id=r['book_id'], borrowing=r['borrowing'], total_borrowed=r['total'])
+         for r in per_book],
+        batch_size=1000,
+    )
+
+    rows = (
+        EntryLog.objects.filter(check_in__isnull=False)
+        .annotate(check_in_day=TruncDate('check_in', tzinfo=timezone.get_current_timezone()))
+        .values('user_id', 'check_in_day').annotate(n=Count('id'))
+    )
+    DailyAttendanceStat.objects.bulk_create(
+        [DailyAttendanceStat(user_id=r['user_id'], day=r['check_in_day'], check_ins=r['n']) for r in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_notification_dedupe_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookBorrowStat',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stat', serialize=False, to='library.book')),
+                ('borrowing', models.IntegerField(db_index=True, default=0, verbose_name='Đang mượn')),
+                ('total_borrowed', models.PositiveIntegerField(default=0, verbose_name='Tổng lượt mượn')),
+            ],
+            options={
+                'verbose_name': 'Thống kê mượn theo sách',
+                'verbose_name_plural': 'Thống kê mượn theo sách',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyAttendanceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Ngày')),
+                ('check_ins', models.PositiveIntegerField(default=0, verbose_name='Lượt vào')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance', to=settings.AUTH_USER_MODEL, verbose_name='MSV')),
+            ],
+            options={
+                'verbose_name': 'Thống kê vào ra theo ngày',
+                'verbose_name_plural': 'Thống kê vào ra theo ngày',
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBorrowStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Ngày')),
+                ('borrowed', models.PositiveIntegerField(default=0, verbose_name='Lượt mượn')),
+                ('returned', models.PositiveIntegerField(default=0, verbose_name='Lượt trả')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='library.book', verbose_name='Sách')),
+            ],
+            options={
+                'verbose_name': 'Thống kê mượn theo ngày',
+                'verbose_name_plural': 'Thống kê mượn theo ngày',
+                'unique_together': {('day', 'book')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def fill_day(apps, schema_editor):
+    """Điền ``day`` theo ngày địa phương của check_in.
+
+    Nếu đã có nhiều lượt cùng (user, shift, day) thì gộp vào lượt vào sớm nhất (giữ giờ
+    ra muộn nhất) rồi xoá các lượt còn lại, để có thể tạo ràng buộc duy nhất.
+    """
+    EntryLog = apps.get_model('library', 'EntryLog')
+    DailyAttendanceStat = apps.get_model('library', 'DailyAttendanceStat')
+    batch, duplicates = [], []
+    previous_key = previous = None
+    # Sắp theo (user, shift, check_in) để các lượt trùng nằm liền nhau
+    logs = EntryLog.objects.filter(check_in__isnull=False).order_by('user_id', 'shift', 'check_in', 'id')
+    for log in logs.only('id', 'user_id', 'shift', 'check_in', 'check_out').iterator(chunk_size=2000):
+        key = (log.user_id, log.shift, timezone.localdate(log.check_in))
+        if key == previous_key:
+            if log.check_out and (previous.check_out is None or log.check_out > previous.check_out):
+                previous.check_out = log.check_out
+            duplicates.append((log.id, key))
+            continue
+        log.day = key[2]
+        batch.append(log)
+        previous_key, previous = key, log
+        if len(batch) > 1000:
+            # Giữ lại lượt cuối, lượt sau có thể còn gộp vào nó
+            EntryLog.objects.bulk_update(batch[:-1], ['day', 'check_out'])
+            batch = batch[-1:]
+    EntryLog.objects.bulk_update(batch, ['day', 'check_out'])
+
+    for i in range(0, len(duplicates), 500):
+        EntryLog.objects.filter(id__in=[log_id for log_id, _ in duplicates[i:i + 500]]).delete()
+    # 0014 đã đếm cả các lượt trùng vào bảng tổng hợp
+    for (user_id, day), n in Counter((key[0], key[2]) for _, key in duplicates).items():
+        DailyAttendanceStat.objects.filter(user_id=user_id, day=day).update(check_ins=F('check_ins') - n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_rollup_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrylog',
+            name='day',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Ngày'),
+        ),
+        migrations.RunPython(fill_day, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='entrylog',
+            constraint=models.UniqueConstraint(fields=('user', 'shift', 'day'), name='entrylog_user_shift_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_entrylog_day'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['user', 'status', 'due_date'], name='borrow_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['status', 'due_date'], name='borrow_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entrylog',
+            index=models.Index(fields=['user', '-check_in'], name='entrylog_user_checkin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='notif_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# DDL chép cố định (không import library.fulltext), xem migration 0009
+PAGE_FTS_TABLE = "library_bookpage_fts"
+
+PAGE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {PAGE_FTS_TABLE} USING fts5(
+        text_normalized, content='library_bookpage', content_rowid='id', tokenize='unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_ai AFTER INSERT ON library_bookpage BEGIN
+        INSERT INTO {PAGE_FTS_TABLE}(rowid, text_normalized) VALUES (new.id, new.text_normalized);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_ad AFTER DELETE ON library_bookpage BEGIN
+        INSERT INTO {PAGE_FTS_TABLE}({PAGE_FTS_TABLE}, rowid, text_normalized)
+        VALUES ('delete', old.id, old.text_normalized);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {PAGE_FTS_TABLE}_au
+    AFTER UPDATE OF text_normalized ON library_bookpage BEGIN
+        INSERT INTO {PAGE_FTS_TABLE}({PAGE_FTS_TABLE}, rowid, text_normalized)
+        VALUES ('delete', old.id, old.text_normalized);
+        INSERT INTO {PAGE_FTS_TABLE}(rowid, text_normalized) VALUES (new.id, new.text_normalized);
+    END""",
+]
+
+
+def create_page_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in PAGE_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_page_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {PAGE_FTS_TABLE}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {PAGE_FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='pdf_indexed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Trang')),
+                ('text', models.TextField()),
+                ('text_normalized', models.TextField(editable=False)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='library.book')),
+            ],
+            options={
+                'unique_together': {('book', 'number')},
+            },
+        ),
+        migrations.RunPython(create_page_fts_index, drop_page_fts_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='pdf_indexed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=110),
+        ),
+    ]
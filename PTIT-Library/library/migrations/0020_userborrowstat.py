@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_user_stats(apps, schema_editor):
+    """Dựng bộ đếm theo người đọc từ dữ liệu hiện có (giống lệnh rebuild_stats)."""
+    Borrow = apps.get_model('library', 'Borrow')
+    UserBorrowStat = apps.get_model('library', 'UserBorrowStat')
+    per_user = (
+        Borrow.objects.filter(status__in=["Đang mượn", "Đã trả"]).values('user_id')
+        .annotate(total=Count('id'), borrowing=Count('id', filter=Q(status="Đang mượn")))
+    )
+    UserBorrowStat.objects.bulk_create(
+        [UserBorrowStat(user_id=r['user_id'], borrowing=r['borrowing'], total_borrowed=r['total'])
+         for r in per_user],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('library', '0019_book_pdf_indexed_failed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBorrowStat',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stat', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Người mượn')),
+                ('borrowing', models.IntegerField(default=0, verbose_name='Đang mượn')),
+                ('total_borrowed', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Tổng lượt mượn')),
+            ],
+            options={
+                'verbose_name': 'Thống kê mượn theo người đọc',
+                'verbose_name_plural': 'Thống kê mượn theo người đọc',
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import F
+from django.utils import timezone
+
+
+def merge_duplicates(apps, schema_editor):
+    """Gộp các lượt vào ra trùng (user, shift, day) mà bản cũ của 0015 để ``day`` trống.
+
+    Các dòng đó không hiện trong lịch sử (lọc theo ``day``) và sửa trong admin thì vi
+    phạm ràng buộc duy nhất. Gộp vào lượt đã giữ (giờ ra muộn nhất) rồi xoá.
+    """
+    EntryLog = apps.get_model('library', 'EntryLog')
+    DailyAttendanceStat = apps.get_model('library', 'DailyAttendanceStat')
+    orphans = EntryLog.objects.filter(check_in__isnull=False, day__isnull=True).order_by('check_in', 'id')
+    for log in orphans.iterator(chunk_size=500):
+        day = timezone.localdate(log.check_in)
+        kept = EntryLog.objects.filter(user_id=log.user_id, shift=log.shift, day=day).first()
+        if kept is None:
+            log.day = day
+            log.save(update_fields=['day'])
+            continue
+        if log.check_out and (kept.check_out is None or log.check_out > kept.check_out):
+            kept.check_out = log.check_out
+            kept.save(update_fields=['check_out'])
+        log.delete()
+        DailyAttendanceStat.objects.filter(user_id=log.user_id, day=day).update(check_ins=F('check_ins') - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0020_userborrowstat'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
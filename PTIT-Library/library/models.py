@@ -1,8 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models import F
-from datetime import date
-from dateutil.relativedelta import relativedelta
 from django.utils import timezone
 import uuid
 
@@ -42,6 +40,15 @@ class Book(models.Model):
     publish_year = models.CharField("Năm xuất bản", max_length=200, default="2023")
     publisher = models.CharField("Nhà xuất bản", max_length=255, default="Học viện Công nghệ Bưu Chính Viễn Thông")
     pdf = models.FileField(upload_to='books/pdfs/', null=True, blank=True)
+    # Bản không dấu, chữ thường của tên sách / tác giả, dùng cho tìm kiếm (xem library/search.py)
+    title_normalized = models.CharField(max_length=200, blank=True, default="", editable=False, db_index=True)
+    author_normalized = models.CharField(max_length=100, blank=True, default="", editable=False, db_index=True)
+    # Tên file PDF đã được trích văn bản vào BookPage, hoặc "!" + tên file nếu trích lỗi
+    # (xem library/fulltext.py); dài hơn cột pdf để chứa thêm dấu đó
+    pdf_indexed = models.CharField(max_length=110, blank=True, default="", editable=False)
+    # Đổi khi sách được lưu qua save(); các UPDATE số lượng trong services.py không chạm
+    # tới cột này (số lượng được hiển thị bằng khối riêng, xem library/catalog.py)
+    updated_at = models.DateTimeField("Cập nhật lúc", auto_now=True)
 
     class Meta:
         verbose_name = "Sách"
@@ -49,6 +56,21 @@ class Book(models.Model):
 
     def __str__(self):
         return f"{self.title} - {self.author}"
+
+    def save(self, *args, **kwargs):
+        from .search import normalize_text  # tránh circular import
+
+        self.title_normalized = normalize_text(self.title)[:200]
+        self.author_normalized = normalize_text(self.author)[:100]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'title' in update_fields:
+                update_fields.add('title_normalized')
+            if 'author' in update_fields:
+                update_fields.add('author_normalized')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
     
     @property
     def collection(self):
@@ -56,6 +78,38 @@ class Book(models.Model):
         return self.subcollection.collection if self.subcollection else None
 
 
+class BookTrigram(models.Model):
+    """Chỉ mục trigram (tên sách + tác giả đã chuẩn hoá) phục vụ tìm kiếm gần đúng."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('trigram', 'book')
+
+    def __str__(self):
+        return f"{self.trigram!r} - {self.book_id}"
+
+
+class BookPage(models.Model):
+    """Văn bản của một trang PDF, đánh chỉ mục toàn văn để tìm trong nội dung tài liệu."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField("Trang")
+    text = models.TextField()
+    text_normalized = models.TextField(editable=False)
+
+    class Meta:
+        unique_together = ('book', 'number')
+
+    def __str__(self):
+        return f"{self.book_id} - trang {self.number}"
+
+    def save(self, *args, **kwargs):
+        from .search import normalize_text  # tránh circular import
+
+        self.text_normalized = normalize_text(self.text)
+        super().save(*args, **kwargs)
+
+
 class Borrow(models.Model):
     STATUS_CHOICES = [
         ("Đang chờ", "Đang chờ"),
@@ -80,56 +134,64 @@ class Borrow(models.Model):
     class Meta:
         verbose_name = "Lượt mượn sách"
         verbose_name_plural = "Danh sách lượt mượn"
+        indexes = [
+            # Sách của một người theo trạng thái, kể cả cảnh báo quá hạn ở book_list
+            models.Index(fields=['user', 'status', 'due_date'], name='borrow_user_status_idx'),
+            # Quá hạn / sắp đến hạn: xuất Excel trong admin, lệnh send_due_reminders
+            models.Index(fields=['status', 'due_date'], name='borrow_status_due_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ trạng thái lúc tải để save() biết có chuyển trạng thái hay không
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def save(self, *args, **kwargs):
-        from .models import Notification  # tránh circular import
+        from .services import transition_for  # tránh circular import
 
         creating = self._state.adding  # True nếu là bản ghi mới
 
-        # Tạo mã mượn tự động
+        # Tạo mã mượn tự động từ bộ đếm riêng (không phải đọc lại bảng Borrow)
         if creating and not self.borrow_code:
-            last = Borrow.objects.order_by('id').last()
-            next_id = (last.id + 1) if last else 1
-            self.borrow_code = f"BRC{next_id:04d}"
-
-        # Kiểm tra thay đổi trạng thái
-        if not creating:
-            old = Borrow.objects.get(pk=self.pk)
-            old_status = old.status
-            new_status = self.status
-
-            # Nếu từ "Đang chờ" → "Đang mượn": giảm số lượng
-            if old_status == "Đang chờ" and new_status == "Đang mượn":
-                if self.book.quantity > 0:
-                    self.book.quantity -= 1
-                    self.book.save()
-
-                # Tự động tính hạn trả = 5 tháng kể từ ngày mượn
-                if not self.due_date:
-                    self.due_date = (self.borrow_date or date.today()) + relativedelta(months=5)
-
-                Notification.objects.create(
-                    user=self.user,
-                    title="Mượn sách thành công",
-                    message=f"Bạn đã mượn thành công sách '{self.book.title}'. "
-                            f"Sách được mượn đến hết ngày {self.due_date.strftime('%d/%m/%Y')}."
-                )
-
-            # Nếu từ "Đang mượn" → "Đã trả": tăng số lượng
-            elif old_status == "Đang mượn" and new_status == "Đã trả":
-                self.book.quantity += 1
-                self.book.save()
-                # Ghi nhận ngày trả
-                self.return_date = date.today()
-
-                if self.return_date > (self.due_date or date.today()):
-                    msg = f"Cảm ơn bạn đã trả sách '{self.book.title}'. " \
-                          "Hãy lưu ý trả sách đúng hạn các lần mượn sau để tránh phí phạt."
-                else:
-                    msg = f"Cảm ơn bạn đã trả sách '{self.book.title}' đúng hạn."
-                Notification.objects.create(user=self.user, title="Trả sách thành công", message=msg)
+            from .sequences import borrow_codes
+            self.borrow_code = f"BRC{borrow_codes.next_value():04d}"
+
+        if creating:
+            super().save(*args, **kwargs)
+        else:
+            old_status = getattr(self, '_loaded_status', None)
+            if old_status is None:
+                old_status = Borrow.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            transition = transition_for(old_status, self.status)
+            if transition is None:
+                super().save(*args, **kwargs)
+            else:
+                # Duyệt / trả sách đi qua services.approve / return_ (khoá dòng, trừ kho bằng F(),
+                # chỉ ghi cột trạng thái và ngày); các cột khác được ghi trước trong cùng giao dịch
+                update_fields = kwargs.pop('update_fields', None)
+                if update_fields is None:
+                    update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+                update_fields = set(update_fields) - {'status'}
+                with transaction.atomic():
+                    if update_fields:
+                        super().save(*args, update_fields=update_fields, **kwargs)
+                    transition(self)
+        self._loaded_status = self.status
+
+class Sequence(models.Model):
+    """Bộ đếm tăng dần dùng chung giữa các tiến trình (xem library/sequences.py)."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Bộ đếm"
+        verbose_name_plural = "Bộ đếm"
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
 
-        super().save(*args, **kwargs)
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
@@ -137,9 +199,17 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Khoá chống trùng cho thông báo tự động, ví dụ "borrow:12:due_soon" (xem library/reminders.py)
+    dedupe_key = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Phân trang theo con trỏ (created_at, id) trong load_more_notifications
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created_idx'),
+            # Chỉ các thông báo chưa đọc: đếm số chưa đọc, "đánh dấu đã đọc tất cả"
+            models.Index(fields=['user', '-created_at'], condition=models.Q(is_read=False), name='notif_unread_idx'),
+        ]
         verbose_name = "Thông báo"
         verbose_name_plural = "Thông báo"
 
@@ -151,12 +221,90 @@ class EntryLog(models.Model):
     shift = models.CharField(max_length=10, choices=[('Sáng', 'Sáng'), ('Chiều', 'Chiều')], verbose_name="Buổi")
     check_in = models.DateTimeField(null=True, blank=True)
     check_out = models.DateTimeField(null=True, blank=True)
+    # Ngày (giờ địa phương) của check_in, để điểm danh là một lệnh INSERT theo khoá (user, shift, day)
+    day = models.DateField(null=True, blank=True, editable=False, verbose_name="Ngày")
 
     class Meta:
         verbose_name = "Lượt vào ra"
         verbose_name_plural = "Các lượt vào ra"
         ordering = ['-check_in']
+        indexes = [
+            # Lịch sử vào ra của một người, mới nhất trước
+            models.Index(fields=['user', '-check_in'], name='entrylog_user_checkin_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'shift', 'day'], name='entrylog_user_shift_day_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.shift} ({self.check_in or 'Chưa vào'})"
 
+    def save(self, *args, **kwargs):
+        if self.check_in:
+            self.day = timezone.localdate(self.check_in)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'day'}
+        super().save(*args, **kwargs)
+
+
+
+# ===== Bảng tổng hợp thống kê (cập nhật dần, xem library/stats.py) =====
+class DailyBorrowStat(models.Model):
+    """Số lượt mượn / trả của từng cuốn sách theo ngày."""
+    day = models.DateField(verbose_name="Ngày")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats', verbose_name="Sách")
+    borrowed = models.PositiveIntegerField(default=0, verbose_name="Lượt mượn")
+    returned = models.PositiveIntegerField(default=0, verbose_name="Lượt trả")
+
+    class Meta:
+        verbose_name = "Thống kê mượn theo ngày"
+        verbose_name_plural = "Thống kê mượn theo ngày"
+        unique_together = ('day', 'book')
+
+    def __str__(self):
+        return f"{self.day} - {self.book_id}: +{self.borrowed} / -{self.returned}"
+
+
+class BookBorrowStat(models.Model):
+    """Bộ đếm theo sách: số lượt đang mượn và tổng số lượt đã mượn."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='borrow_stat')
+    borrowing = models.IntegerField(default=0, db_index=True, verbose_name="Đang mượn")
+    total_borrowed = models.PositiveIntegerField(default=0, verbose_name="Tổng lượt mượn")
+
+    class Meta:
+        verbose_name = "Thống kê mượn theo sách"
+        verbose_name_plural = "Thống kê mượn theo sách"
+
+    def __str__(self):
+        return f"{self.book_id}: {self.borrowing} / {self.total_borrowed}"
+
+
+class UserBorrowStat(models.Model):
+    """Bộ đếm theo người đọc: số sách đang mượn và tổng số lượt đã mượn."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='borrow_stat',
+                                verbose_name="Người mượn")
+    borrowing = models.IntegerField(default=0, verbose_name="Đang mượn")
+    total_borrowed = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Tổng lượt mượn")
+
+    class Meta:
+        verbose_name = "Thống kê mượn theo người đọc"
+        verbose_name_plural = "Thống kê mượn theo người đọc"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.borrowing} / {self.total_borrowed}"
+
+
+class DailyAttendanceStat(models.Model):
+    """Số lượt điểm danh vào thư viện của từng người theo ngày."""
+    day = models.DateField(verbose_name="Ngày")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_attendance', verbose_name="MSV")
+    check_ins = models.PositiveIntegerField(default=0, verbose_name="Lượt vào")
+
+    class Meta:
+        verbose_name = "Thống kê vào ra theo ngày"
+        verbose_name_plural = "Thống kê vào ra theo ngày"
+        unique_together = ('user', 'day')
+
+    def __str__(self):
+        return f"{self.day} - {self.user_id}: {self.check_ins}"
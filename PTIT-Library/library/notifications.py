@@ -0,0 +1,76 @@
+"""Các tiện ích dùng chung cho thông báo (phân trang theo con trỏ, bộ đếm chưa đọc...)."""
+import base64
+from datetime import datetime
+
+from django.core.cache import caches
+from django.db.models import Q
+
+PAGE_SIZE = 10
+# Bộ đếm nằm trong cache dùng chung giữa các worker (alias "shared", xem settings.CACHES):
+# LocMemCache riêng từng tiến trình thì worker khác vẫn hiện số cũ sau khi đọc thông báo.
+UNREAD_CACHE_ALIAS = "shared"
+# Thời hạn chỉ giới hạn độ lệch trong trường hợp hiếm: một request vừa đếm xong thì
+# thông báo mới commit và xoá khoá, rồi request đó mới ghi số cũ vào cache
+UNREAD_CACHE_TIMEOUT = 300
+
+
+def encode_cursor(notification):
+    """Mã hoá vị trí ``(created_at, id)`` của một thông báo thành chuỗi con trỏ."""
+    raw = f"{notification.created_at.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Giải mã con trỏ, ném ``ValueError`` nếu chuỗi không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as exc:
+        raise ValueError("Con trỏ không hợp lệ") from exc
+
+
+def notifications_page(user, cursor=None, limit=PAGE_SIZE):
+    """Trả về ``(danh sách thông báo, con trỏ trang sau hoặc None)``.
+
+    Phân trang theo khoá ``(created_at, id)`` thay vì OFFSET nên trang thứ 50
+    tốn chi phí như trang đầu (dùng chỉ mục ``user, -created_at, -id``) và
+    thông báo mới đến không làm lệch các trang đang cuộn.
+    """
+    from .models import Notification  # tránh circular import
+
+    notifications = Notification.objects.filter(user=user).order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        notifications = notifications.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+    page = list(notifications[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+# ===== Bộ đếm thông báo chưa đọc (cache dùng chung theo người dùng) =====
+# Mọi thay đổi chỉ xoá khoá thay vì cộng / trừ tại chỗ: incr của cache dùng chung
+# (file, CSDL) là đọc rồi ghi, hai worker cùng cộng sẽ mất một lần. Lần đọc sau
+# đếm lại bằng chỉ mục một phần ``notif_unread_idx`` (chỉ các thông báo chưa đọc).
+def _unread_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def unread_count(user):
+    """Số thông báo chưa đọc, chỉ đếm trong cơ sở dữ liệu khi cache chưa có."""
+    from .models import Notification  # tránh circular import
+
+    cache = caches[UNREAD_CACHE_ALIAS]
+    key = _unread_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count()
+        cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_unread_counts(user_ids):
+    """Xoá bộ đếm của các người dùng sau khi thông báo của họ thay đổi (gọi sau commit)."""
+    caches[UNREAD_CACHE_ALIAS].delete_many([_unread_key(user_id) for user_id in set(user_ids)])
@@ -0,0 +1,83 @@
+"""Gửi thông báo nhắc hạn trả sách cho mọi người dùng.
+
+Chạy định kỳ bằng lệnh ``python manage.py send_due_reminders`` (ví dụ cron
+mỗi sáng: ``0 7 * * * python manage.py send_due_reminders``) thay vì kiểm tra
+trong từng lần mở trang "Quản lý mượn sách".
+
+Mỗi thông báo mang ``dedupe_key = "borrow:<id>:<loại>"`` (cột unique), nên
+chạy lại lệnh bao nhiêu lần cũng không gửi trùng.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Borrow, Notification
+from .notifications import invalidate_unread_counts
+
+DUE_SOON = "due_soon"
+OVERDUE = "overdue"
+DUE_SOON_DAYS = 7
+CHUNK_SIZE = 500
+
+
+def reminder_key(borrow, kind):
+    return f"borrow:{borrow.id}:{kind}"
+
+
+def build_reminder(borrow, kind):
+    due = borrow.due_date.strftime('%d/%m/%Y')
+    if kind == OVERDUE:
+        message = (f"Sách '{borrow.book.title}' bạn đang mượn đã quá hạn trả từ ngày {due}. "
+                   "Hãy nhanh chóng đến thư viện trả sách!")
+    else:
+        message = (f"Sách '{borrow.book.title}' bạn đang mượn sẽ hết hạn vào ngày {due}. "
+                   "Hãy trả sách đúng hạn để tránh phí phạt.")
+    return Notification(
+        user_id=borrow.user_id,
+        title="Lưu ý!",
+        message=message,
+        dedupe_key=reminder_key(borrow, kind),
+    )
+
+
+def send_due_reminders(today=None, days_before=DUE_SOON_DAYS):
+    """Tạo nhắc nhở cho các lượt mượn sắp đến hạn / quá hạn, trả về số thông báo mới."""
+    today = today or timezone.localdate()
+    borrows = (
+        Borrow.objects.filter(status="Đang mượn", due_date__lte=today + timedelta(days=days_before))
+        .select_related('book')
+        .only('id', 'user_id', 'due_date', 'book__title')
+        .order_by('id')
+    )
+
+    created = 0
+    chunk = []
+    for borrow in borrows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(borrow)
+        if len(chunk) >= CHUNK_SIZE:
+            created += _save_chunk(chunk, today)
+            chunk = []
+    if chunk:
+        created += _save_chunk(chunk, today)
+    return created
+
+
+def _save_chunk(borrows, today):
+    """Lưu các nhắc nhở chưa có cho ``borrows``, trả về số dòng thực sự được thêm."""
+    reminders = [build_reminder(b, OVERDUE if b.due_date < today else DUE_SOON) for b in borrows]
+    keys = [r.dedupe_key for r in reminders]
+    with transaction.atomic():
+        # Khoá các lượt mượn của nhóm này để hai lần chạy song song không cùng
+        # kiểm tra rồi cùng ghi một nhắc nhở (SQLite: transaction IMMEDIATE đã khoá ghi)
+        list(Borrow.objects.select_for_update().filter(id__in=[b.id for b in borrows]).values_list('id'))
+        existing = set(Notification.objects.filter(dedupe_key__in=keys).values_list('dedupe_key', flat=True))
+        new = [r for r in reminders if r.dedupe_key not in existing]
+        if not new:
+            return 0
+        # bulk_create(ignore_conflicts=True) bỏ qua dòng trùng mà không báo,
+        # nên đếm lại theo dedupe_key thay vì tin vào len(new)
+        Notification.objects.bulk_create(new, ignore_conflicts=True)
+        inserted = Notification.objects.filter(dedupe_key__in=keys).count() - len(existing)
+    invalidate_unread_counts(r.user_id for r in new)
+    return inserted
@@ -0,0 +1,436 @@
+"""Tìm kiếm sách không phân biệt dấu.
+
+Tên sách / tác giả được chuẩn hoá (bỏ dấu, chữ thường) vào hai cột
+``title_normalized`` / ``author_normalized`` mỗi khi ``Book`` được lưu.
+Trên SQLite, hai cột này được đánh chỉ mục bởi bảng FTS5 ``library_book_fts``
+(tokenizer trigram, cập nhật bằng trigger – xem migration 0009), nên một truy
+vấn con chuỗi chỉ cần tra chỉ mục thay vì duyệt toàn bộ bảng sách.
+Các backend khác dùng ``LIKE`` trên cột đã chuẩn hoá.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from unidecode import unidecode
+
+FTS_TABLE = "library_book_fts"
+# Tokenizer trigram của FTS5 chỉ khớp được chuỗi từ 3 ký tự trở lên
+FTS_MIN_QUERY_LENGTH = 3
+
+FTS_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON library_book BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title_normalized, author_normalized)
+            VALUES (new.id, new.title_normalized, new.author_normalized);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON library_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title_normalized, author_normalized)
+            VALUES ('delete', old.id, old.title_normalized, old.author_normalized);
+        END""",
+    # Chỉ chạy khi tên / tác giả đổi, cập nhật số lượng sách không đụng tới chỉ mục
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF title_normalized, author_normalized ON library_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title_normalized, author_normalized)
+            VALUES ('delete', old.id, old.title_normalized, old.author_normalized);
+            INSERT INTO {FTS_TABLE}(rowid, title_normalized, author_normalized)
+            VALUES (new.id, new.title_normalized, new.author_normalized);
+        END""",
+}
+
+
+def normalize_text(value):
+    """Bỏ dấu tiếng Việt, chuyển chữ thường và gộp khoảng trắng."""
+    return " ".join(unidecode(value or "").lower().split())
+
+
+def fts_available(conn=None):
+    return (conn or connection).vendor == "sqlite"
+
+
+def install_fts_index(conn=None):
+    """Tạo bảng FTS5 và các trigger đồng bộ nếu chưa có (chỉ với SQLite).
+
+    SQLite tạo lại bảng ``library_book`` khi migration thay đổi cột, việc này
+    xoá luôn các trigger, nên hàm được gọi lại sau mỗi lần ``migrate``
+    (xem ``LibraryConfig.ready``) và dựng lại chỉ mục khi thiếu trigger.
+    """
+    conn = conn or connection
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        columns = {c.name for c in conn.introspection.get_table_description(cursor, "library_book")}
+        if "title_normalized" not in columns:
+            # Cơ sở dữ liệu chưa chạy tới migration 0009
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+            list(FTS_TRIGGERS),
+        )
+        if len(cursor.fetchall()) == len(FTS_TRIGGERS):
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title_normalized, author_normalized, "
+            "content='library_book', content_rowid='id', tokenize='trigram')"
+        )
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_fts_index(conn=None):
+    conn = conn or connection
+    if not fts_available(conn):
+        return
+    with conn.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _fts_phrase(normalized_query):
+    # Đặt trong ngoặc kép để FTS5 coi cả chuỗi là một cụm, không hiểu các toán tử AND/OR/NEAR
+    return '"{}"'.format(normalized_query.replace('"', '""'))
+
+
+def search_books(query):
+    """Trả về queryset (lazy) các sách có tên hoặc tác giả chứa ``query``.
+
+    Queryset chưa được thực thi nên ``Paginator`` chỉ sinh ra một truy vấn
+    ``COUNT`` và một truy vấn ``LIMIT/OFFSET`` cho trang hiện tại.
+    """
+    from .models import Book  # tránh circular import
+
+    normalized_query = normalize_text(query)
+    books = Book.objects.select_related('subcollection__collection').order_by('title', 'id')
+    if not normalized_query:
+        return books.none()
+
+    if fts_available() and len(normalized_query) >= FTS_MIN_QUERY_LENGTH:
+        match_ids = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            (_fts_phrase(normalized_query),),
+        )
+        return books.filter(id__in=match_ids)
+
+    return books.filter(
+        Q(title_normalized__contains=normalized_query)
+        | Q(author_normalized__contains=normalized_query)
+    )
+
+
+# ===== Tìm kiếm gần đúng bằng trigram =====
+# Mỗi từ được đệm thành "  tu " rồi cắt thành các cụm 3 ký tự (giống pg_trgm),
+# nên lỗi gõ một ký tự chỉ làm mất vài trigram của từ đó.
+SIMILARITY_THRESHOLD = 0.4
+CANDIDATE_FACTOR = 5
+# Trigram có nhiều hơn ngần này sách (ví dụ "  t" ở đầu từ) gần như không lọc được
+# gì, nên không dùng để chọn ứng viên; chỉ đọc tối đa POSTING_LIMIT + 1 dòng mỗi trigram.
+POSTING_LIMIT = 2000
+
+
+def trigrams(text):
+    result = set()
+    for word in normalize_text(text).split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def book_trigrams(book):
+    return trigrams(book.title) | trigrams(book.author)
+
+
+def index_book_trigrams(book):
+    """Cập nhật chỉ mục trigram của một cuốn sách (gọi khi sách được lưu)."""
+    from .models import BookTrigram  # tránh circular import
+
+    wanted = book_trigrams(book)
+    existing = set(BookTrigram.objects.filter(book=book).values_list('trigram', flat=True))
+    if existing - wanted:
+        BookTrigram.objects.filter(book=book, trigram__in=existing - wanted).delete()
+    BookTrigram.objects.bulk_create(
+        [BookTrigram(book=book, trigram=t) for t in wanted - existing],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_trigram_index(batch_size=1000):
+    """Dựng lại toàn bộ chỉ mục trigram (dùng cho migration / dữ liệu tạo bằng bulk_create)."""
+    from .models import Book, BookTrigram  # tránh circular import
+
+    BookTrigram.objects.all().delete()
+    batch = []
+    for book in Book.objects.only('id', 'title', 'author').iterator(chunk_size=batch_size):
+        batch.extend(BookTrigram(book_id=book.id, trigram=t) for t in book_trigrams(book))
+        if len(batch) >= batch_size:
+            BookTrigram.objects.bulk_create(batch, batch_size=batch_size)
+            batch = []
+    BookTrigram.objects.bulk_create(batch, batch_size=batch_size)
+
+
+def _postings(query_trigrams):
+    """Trả về ``{trigram: [id sách]}``, mỗi danh sách tối đa ``POSTING_LIMIT + 1`` phần tử, trong một truy vấn."""
+    from .models import BookTrigram  # tránh circular import
+
+    table = BookTrigram._meta.db_table
+    ordered = sorted(query_trigrams)
+    # Mỗi nhánh có LIMIT riêng nên phải bọc trong truy vấn con (ORM không cho LIMIT trong UNION)
+    sql = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT trigram, book_id FROM {table} WHERE trigram = %s LIMIT %s) AS p{i}"
+        for i in range(len(ordered))
+    )
+    params = [value for t in ordered for value in (t, POSTING_LIMIT + 1)]
+    postings = {t: [] for t in ordered}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for trigram, book_id in cursor.fetchall():
+            postings[trigram].append(book_id)
+    return postings
+
+
+def similarity(query_trigrams, text):
+    """Tỉ lệ trigram của truy vấn xuất hiện trong ``text`` (kiểu word_similarity của pg_trgm)."""
+    if not query_trigrams:
+        return 0.0
+    return len(query_trigrams & trigrams(text)) / len(query_trigrams)
+
+
+def ranked_search(query, limit=12, threshold=SIMILARITY_THRESHOLD):
+    """Trả về tối đa ``limit`` sách gần giống ``query`` nhất, sắp theo độ tương đồng giảm dần.
+
+    Ứng viên được chọn từ danh sách sách của từng trigram trong truy vấn
+    (xem ``_postings``), mỗi danh sách đọc tối đa ``POSTING_LIMIT + 1`` dòng
+    theo index ``(trigram, book)``. Trigram quá phổ biến bị bỏ qua khi chọn
+    ứng viên, nên chi phí bị chặn bởi số trigram của truy vấn chứ không tăng
+    theo kích thước cả kho. Điểm cuối cùng vẫn tính trên mọi trigram.
+    """
+    from .models import Book  # tránh circular import
+
+    query_trigrams = trigrams(query)
+    if not query_trigrams:
+        return []
+
+    postings = _postings(query_trigrams)
+    selective = {t: ids for t, ids in postings.items() if len(ids) <= POSTING_LIMIT}
+    # Cả truy vấn chỉ gồm trigram phổ biến: dùng phần đã đọc (đã bị chặn) của chúng
+    lists = list((selective or postings).values())
+    min_shared = max(1, int(len(lists) * threshold))
+    shared = Counter(book_id for ids in lists for book_id in ids)
+    candidates = [
+        book_id for book_id, count in shared.most_common(limit * CANDIDATE_FACTOR)
+        if count >= min_shared
+    ]
+    books = Book.objects.select_related('subcollection__collection').in_bulk(candidates)
+
+    scored = []
+    for book in books.values():
+        score = max(similarity(query_trigrams, book.title), similarity(query_trigrams, book.author))
+        if score >= threshold:
+            scored.append((score, book))
+    scored.sort(key=lambda item: (-item[0], item[1].title))
+    return [book for score, book in scored[:limit]]
+
+
+# ===== Gợi ý khi gõ (autocomplete) =====
+class _PrefixState:
+    """Dữ liệu của một phiên bản chỉ mục tiền tố (xem ``PrefixIndex``)."""
+
+    def __init__(self):
+        self.keys = []            # [(khoá, loại, id)] đã sắp xếp
+        self.items = {}           # (loại, id) -> {'label', 'keys'}
+        self.book_authors = {}    # id sách -> khoá tác giả
+        self.author_books = {}    # khoá tác giả -> số sách của tác giả
+        self._bulk = False
+
+    @classmethod
+    def from_rows(cls, books, subcollections):
+        """Dựng từ dữ liệu đọc một lần: gom mọi khoá rồi sắp xếp một lần (O(n log n))."""
+        state = cls()
+        state._bulk = True
+        for book_id, title, author in books:
+            state.add_book(book_id, title, author)
+        for sub_id, name, collection_name in subcollections:
+            state.add('subcollection', sub_id, f"{collection_name} - {name}", name)
+        state.keys.sort()
+        state._bulk = False
+        return state
+
+    @staticmethod
+    def _word_suffixes(text):
+        words = normalize_text(text).split()
+        return {" ".join(words[i:]) for i in range(len(words))}
+
+    def add(self, kind, obj_id, label, text):
+        keys = sorted(self._word_suffixes(text))
+        for key in keys:
+            if self._bulk:
+                self.keys.append((key, kind, obj_id))
+            else:
+                bisect.insort(self.keys, (key, kind, obj_id))
+        self.items[(kind, obj_id)] = {'label': label, 'keys': keys}
+
+    def remove(self, kind, obj_id):
+        item = self.items.pop((kind, obj_id), None)
+        if not item:
+            return
+        for key in item['keys']:
+            i = bisect.bisect_left(self.keys, (key, kind, obj_id))
+            if i < len(self.keys) and self.keys[i] == (key, kind, obj_id):
+                del self.keys[i]
+
+    def add_book(self, book_id, title, author):
+        self.add('book', book_id, title, title)
+        author_key = normalize_text(author)
+        if author_key:
+            self.book_authors[book_id] = author_key
+            if author_key not in self.author_books:
+                self.add('author', author_key, author, author)
+            self.author_books[author_key] = self.author_books.get(author_key, 0) + 1
+
+    def remove_book(self, book_id):
+        self.remove('book', book_id)
+        author_key = self.book_authors.pop(book_id, None)
+        if author_key:
+            self.author_books[author_key] -= 1
+            if not self.author_books[author_key]:
+                del self.author_books[author_key]
+                self.remove('author', author_key)
+
+    def update_book(self, book_id, title, author):
+        self.remove_book(book_id)
+        self.add_book(book_id, title, author)
+
+
+class PrefixIndex:
+    """Chỉ mục tiền tố trong bộ nhớ cho ô tìm kiếm.
+
+    Mỗi tên sách, tác giả và danh mục con được chuẩn hoá và tách thành các
+    hậu tố bắt đầu tại đầu mỗi từ ("giai tich 1", "tich 1", "1"), lưu trong
+    một danh sách đã sắp xếp. Tìm theo tiền tố chỉ cần một lần ``bisect`` rồi
+    đọc tiếp vài phần tử, không truy vấn cơ sở dữ liệu.
+
+    Chỉ mục được dựng ở luồng nền khi tiến trình web khởi động, cập nhật từng
+    phần qua signal khi ``Book`` thay đổi trong tiến trình hiện tại, và dựng
+    lại ở luồng nền sau ``refresh_interval`` giây (hoặc khi ``Collection`` /
+    ``SubCollection`` đổi) để nhận thay đổi từ các worker khác. Bản mới được
+    dựng ngoài khoá rồi thay vào một lần; trong lúc đó các request vẫn đọc bản
+    cũ. Chỉ request đầu tiên khi chưa có bản nào mới phải chờ.
+    """
+
+    refresh_interval = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()        # bảo vệ _state / _pending / các cờ
+        self._build_lock = threading.Lock()  # mỗi lúc chỉ một lần dựng
+        self._state = None
+        self._built_at = None
+        self._stale = False
+        self._refreshing = False
+        self._pending = None  # các cập nhật từng phần xảy ra trong lúc đang dựng
+
+    def build(self):
+        """Dựng bản mới của chỉ mục và thay vào bản đang dùng."""
+        from .models import Book, SubCollection  # tránh circular import
+
+        with self._build_lock:
+            with self._lock:
+                self._pending = []
+                self._stale = False
+            try:
+                state = _PrefixState.from_rows(
+                    Book.objects.values_list('id', 'title', 'author').iterator(),
+                    SubCollection.objects.values_list('id', 'name', 'collection__name'),
+                )
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                # Sách được sửa / xoá sau khi bắt đầu đọc CSDL: áp lại lên bản mới
+                for method, args in self._pending:
+                    getattr(state, method)(*args)
+                self._pending = None
+                self._state = state
+                self._built_at = time.monotonic()
+
+    def _build_in_background(self):
+        def run():
+            from django.db import DatabaseError, connection as thread_connection
+            try:
+                self.build()
+            except DatabaseError:
+                pass  # chưa migrate: sẽ dựng ở lần gợi ý đầu tiên
+            finally:
+                with self._lock:
+                    self._refreshing = False
+                thread_connection.close()
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=run, name="suggestion-index", daemon=True).start()
+
+    def warm_up(self):
+        """Dựng chỉ mục ở luồng nền khi tiến trình web khởi động."""
+        self._build_in_background()
+
+    def _current_state(self):
+        state = self._state
+        if state is None:
+            with self._build_lock:  # chờ lần dựng đang chạy (ví dụ warm_up) nếu có
+                state = self._state
+            if state is None:
+                self.build()
+                state = self._state
+        elif self._stale or time.monotonic() - self._built_at > self.refresh_interval:
+            self._build_in_background()
+        return state
+
+    def _apply(self, method, *args):
+        with self._lock:
+            if self._state is not None:
+                getattr(self._state, method)(*args)
+            if self._pending is not None:
+                self._pending.append((method, args))
+
+    def update_book(self, book):
+        self._apply('update_book', book.id, book.title, book.author)
+
+    def remove_book(self, book_id):
+        self._apply('remove_book', book_id)
+
+    def invalidate(self):
+        """Đánh dấu cần dựng lại; lần gợi ý sau sẽ dựng ở luồng nền."""
+        with self._lock:
+            self._stale = True
+
+    def suggest(self, prefix, limit=8):
+        """Trả về tối đa ``limit`` mục ``(loại, id, nhãn)`` có từ bắt đầu bằng ``prefix``."""
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        state = self._current_state()
+        with self._lock:
+            results, seen = [], set()
+            keys = state.keys
+            i = bisect.bisect_left(keys, (prefix,))
+            while i < len(keys) and len(results) < limit:
+                key, kind, obj_id = keys[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, obj_id) not in seen:
+                    seen.add((kind, obj_id))
+                    results.append((kind, obj_id, state.items[(kind, obj_id)]['label']))
+                i += 1
+            return results
+
+
+suggestion_index = PrefixIndex()
@@ -0,0 +1,86 @@
+"""Cấp phát số thứ tự (mã mượn...) an toàn khi nhiều request chạy đồng thời.
+
+Giá trị được cấp bằng một câu ``UPDATE value = value + n`` trên bảng
+``Sequence``: câu lệnh này khoá dòng (hoặc cả CSDL với SQLite) cho tới khi
+giao dịch kết thúc, nên hai worker không bao giờ nhận cùng một số. Trên CSDL
+hỗ trợ ``RETURNING`` (SQLite ≥ 3.35, PostgreSQL) giá trị mới được đọc ngay
+trong câu UPDATE, nên mỗi mã chỉ tốn một câu lệnh, không cần SELECT hay
+giao dịch riêng.
+
+Mỗi tiến trình có thể giữ trước một khối ``block_size`` số để giảm số lần
+ghi vào bảng bộ đếm; đổi lại các mã có thể không liên tục giữa các worker.
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+
+def _advance(name, size):
+    """Cộng ``size`` vào bộ đếm, trả về giá trị mới hoặc ``None`` nếu bộ đếm chưa có."""
+    from .models import Sequence  # tránh circular import
+
+    if connection.features.can_return_columns_from_insert:
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(Sequence._meta.db_table)} SET {qn('value')} = {qn('value')} + %s "
+                f"WHERE {qn('name')} = %s RETURNING {qn('value')}",
+                [size, name],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    with transaction.atomic():
+        if not Sequence.objects.filter(name=name).update(value=F('value') + size):
+            return None
+        return Sequence.objects.filter(name=name).values_list('value', flat=True).get()
+
+
+def reserve_block(name, size=1):
+    """Giữ ``size`` số tiếp theo của bộ đếm ``name``, trả về ``(đầu, cuối)``."""
+    from .models import Sequence  # tránh circular import
+
+    end = _advance(name, size)
+    if end is None:
+        try:
+            with transaction.atomic():
+                Sequence.objects.create(name=name, value=size)
+            end = size
+        except IntegrityError:
+            # Tiến trình khác vừa tạo bộ đếm
+            end = _advance(name, size)
+    return end - size + 1, end
+
+
+class SequenceAllocator:
+    def __init__(self, name, block_size=None, block_size_setting=None):
+        self.name = name
+        self._block_size = block_size
+        self._block_size_setting = block_size_setting
+        self._lock = threading.Lock()
+        self._next = 1
+        self._end = 0
+
+    @property
+    def block_size(self):
+        if self._block_size is not None:
+            return self._block_size
+        return max(1, getattr(settings, self._block_size_setting or '', 1) or 1)
+
+    def next_value(self):
+        block_size = self.block_size
+        if block_size == 1 or connection.in_atomic_block:
+            # Trong giao dịch của người gọi, số được cấp sẽ bị hoàn lại cùng giao dịch
+            # nếu rollback, nên không được giữ khối số trong bộ nhớ.
+            return reserve_block(self.name, 1)[0]
+        with self._lock:
+            if self._next > self._end:
+                self._next, self._end = reserve_block(self.name, block_size)
+            value = self._next
+            self._next += 1
+            return value
+
+
+borrow_codes = SequenceAllocator('borrow_code', block_size_setting='BORROW_CODE_BLOCK_SIZE')
@@ -0,0 +1,224 @@
+"""Các thao tác chuyển trạng thái lượt mượn (duyệt mượn, trả sách).
+
+Mọi thao tác chạy trong một giao dịch, khoá dòng ``Borrow`` bằng
+``select_for_update`` và thay đổi số lượng sách bằng ``UPDATE`` có điều kiện
+với ``F()``, nên các quầy duyệt đồng thời không làm mất lượt trừ kho và số
+lượng không bao giờ âm. Chỉ các cột thay đổi mới được ghi lại.
+"""
+from collections import defaultdict
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import F
+
+from .catalog import stock_changed
+from .models import Book, Borrow, Notification
+from .notifications import invalidate_unread_counts
+from .stats import record_borrowed, record_returned
+
+PENDING = "Đang chờ"
+BORROWING = "Đang mượn"
+RETURNED = "Đã trả"
+
+# Hạn trả mặc định tính từ ngày mượn
+LOAN_PERIOD = relativedelta(months=5)
+
+
+class BorrowTransitionError(Exception):
+    """Không thể chuyển trạng thái (sai trạng thái hiện tại, hết sách...)."""
+
+
+def default_due_date(borrow):
+    return (borrow.borrow_date or date.today()) + LOAN_PERIOD
+
+
+def approved_notification(borrow):
+    return Notification(
+        user_id=borrow.user_id,
+        title="Mượn sách thành công",
+        message=f"Bạn đã mượn thành công sách '{borrow.book.title}'. "
+                f"Sách được mượn đến hết ngày {borrow.due_date.strftime('%d/%m/%Y')}."
+    )
+
+
+def returned_notification(borrow):
+    if borrow.return_date > (borrow.due_date or date.today()):
+        msg = f"Cảm ơn bạn đã trả sách '{borrow.book.title}'. " \
+              "Hãy lưu ý trả sách đúng hạn các lần mượn sau để tránh phí phạt."
+    else:
+        msg = f"Cảm ơn bạn đã trả sách '{borrow.book.title}' đúng hạn."
+    return Notification(user_id=borrow.user_id, title="Trả sách thành công", message=msg)
+
+
+def _lock(borrow):
+    return Borrow.objects.select_for_update().select_related('book').get(pk=borrow.pk)
+
+
+def _take_copy(borrow):
+    if not Book.objects.filter(pk=borrow.book_id, quantity__gt=0).update(quantity=F('quantity') - 1):
+        raise BorrowTransitionError(f"Sách '{borrow.book.title}' đã hết, không thể duyệt mượn.")
+    stock_changed()
+
+
+def _return_copy(borrow):
+    Book.objects.filter(pk=borrow.book_id).update(quantity=F('quantity') + 1)
+    stock_changed()
+
+
+def _sync(borrow, locked):
+    borrow.status = locked.status
+    borrow.due_date = locked.due_date
+    borrow.return_date = locked.return_date
+    borrow._loaded_status = locked.status
+
+
+def approve(borrow):
+    """Duyệt yêu cầu "Đang chờ" → "Đang mượn": trừ kho, đặt hạn trả, gửi thông báo."""
+    with transaction.atomic():
+        locked = _lock(borrow)
+        if locked.status != PENDING:
+            raise BorrowTransitionError(f"Lượt mượn {locked.borrow_code} không ở trạng thái chờ duyệt.")
+        _take_copy(locked)
+        locked.status = BORROWING
+        locked.due_date = locked.due_date or default_due_date(locked)
+        Borrow.objects.filter(pk=locked.pk).update(status=locked.status, due_date=locked.due_date)
+        approved_notification(locked).save()
+        record_borrowed([locked])
+    _sync(borrow, locked)
+    return borrow
+
+
+def return_(borrow):
+    """Ghi nhận trả sách "Đang mượn" → "Đã trả": cộng kho, ghi ngày trả, gửi thông báo."""
+    with transaction.atomic():
+        locked = _lock(borrow)
+        if locked.status != BORROWING:
+            raise BorrowTransitionError(f"Lượt mượn {locked.borrow_code} không ở trạng thái đang mượn.")
+        _return_copy(locked)
+        locked.status = RETURNED
+        locked.return_date = date.today()
+        Borrow.objects.filter(pk=locked.pk).update(status=locked.status, return_date=locked.return_date)
+        returned_notification(locked).save()
+        record_returned([locked], locked.return_date)
+    _sync(borrow, locked)
+    return borrow
+
+
+def transition_for(old_status, new_status):
+    """Hàm thực hiện việc chuyển ``old_status`` → ``new_status`` (None nếu không có tác dụng phụ).
+
+    ``Borrow.save`` dùng hàm này, nên sửa trạng thái trong trang quản trị cũng đi qua
+    ``approve`` / ``return_``.
+    """
+    return {(PENDING, BORROWING): approve, (BORROWING, RETURNED): return_}.get((old_status, new_status))
+
+
+def check_status_change(borrow_id, book, old_status, new_status):
+    """Kiểm tra trước (không khoá, không ghi) một lần đổi trạng thái, dùng để báo lỗi trong form.
+
+    ``approve`` / ``return_`` vẫn kiểm tra lại dưới khoá khi lưu.
+    """
+    current = Borrow.objects.filter(pk=borrow_id).values_list('status', flat=True).first()
+    if current != old_status:
+        raise BorrowTransitionError("Lượt mượn vừa được người khác cập nhật, vui lòng tải lại trang.")
+    if old_status == PENDING and new_status == BORROWING and not (
+        Book.objects.filter(pk=book.pk, quantity__gt=0).exists()
+    ):
+        raise BorrowTransitionError(f"Sách '{book.title}' đã hết, không thể duyệt mượn.")
+
+
+# ===== Xử lý hàng loạt (admin action) =====
+BULK_CHUNK_SIZE = 200
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _bulk_transition(queryset, from_status, apply_chunk, chunk_size):
+    """Khung chung: chia các lượt mượn đã chọn thành từng khối, mỗi khối một giao dịch.
+
+    ``apply_chunk(borrows_by_book)`` nhận các lượt mượn hợp lệ gom theo sách,
+    trả về ``(danh sách thành công, danh sách lỗi)``. Lỗi của một dòng (hết
+    sách, sai trạng thái) không làm hỏng cả lô.
+    """
+    ids = list(queryset.order_by('borrow_date', 'id').values_list('id', flat=True))
+    done, failures = 0, []
+    for chunk in _chunks(ids, chunk_size):
+        with transaction.atomic():
+            by_book = defaultdict(list)
+            borrows = (
+                Borrow.objects.select_for_update().select_related('book')
+                .filter(id__in=chunk).order_by('borrow_date', 'id')
+            )
+            for borrow in borrows:
+                if borrow.status != from_status:
+                    failures.append((borrow.borrow_code, f"đang ở trạng thái '{borrow.status}'"))
+                else:
+                    by_book[borrow.book_id].append(borrow)
+            succeeded, chunk_failures = apply_chunk(by_book)
+            failures.extend(chunk_failures)
+            # Chỉ xoá bộ đếm khi khối đã commit (khối lỗi thì thông báo không tồn tại)
+            user_ids = {b.user_id for b in succeeded}
+            transaction.on_commit(lambda user_ids=user_ids: invalidate_unread_counts(user_ids))
+            done += len(succeeded)
+    return done, failures
+
+
+def _approve_chunk(by_book):
+    stock = dict(
+        Book.objects.select_for_update().filter(id__in=by_book).values_list('id', 'quantity')
+    )
+    succeeded, failures = [], []
+    for book_id, borrows in by_book.items():
+        n = min(len(borrows), max(stock.get(book_id, 0), 0))
+        # Một câu UPDATE cho mỗi cuốn sách; điều kiện quantity >= n giữ kho không âm
+        if n and not Book.objects.filter(pk=book_id, quantity__gte=n).update(quantity=F('quantity') - n):
+            n = 0
+        succeeded.extend(borrows[:n])
+        failures.extend(
+            (b.borrow_code, f"sách '{b.book.title}' đã hết") for b in borrows[n:]
+        )
+    if succeeded:
+        stock_changed()
+
+    # Hạn trả phụ thuộc ngày mượn nên gom theo hạn trả để cập nhật
+    by_due_date = defaultdict(list)
+    for borrow in succeeded:
+        borrow.status = BORROWING
+        borrow.due_date = borrow.due_date or default_due_date(borrow)
+        by_due_date[borrow.due_date].append(borrow.id)
+    for due_date, ids in by_due_date.items():
+        Borrow.objects.filter(id__in=ids).update(status=BORROWING, due_date=due_date)
+    Notification.objects.bulk_create([approved_notification(b) for b in succeeded])
+    record_borrowed(succeeded)
+    return succeeded, failures
+
+
+def _return_chunk(by_book):
+    today = date.today()
+    succeeded = []
+    for book_id, borrows in by_book.items():
+        Book.objects.filter(pk=book_id).update(quantity=F('quantity') + len(borrows))
+        succeeded.extend(borrows)
+    if succeeded:
+        stock_changed()
+    for borrow in succeeded:
+        borrow.status = RETURNED
+        borrow.return_date = today
+    Borrow.objects.filter(id__in=[b.id for b in succeeded]).update(status=RETURNED, return_date=today)
+    Notification.objects.bulk_create([returned_notification(b) for b in succeeded])
+    record_returned(succeeded, today)
+    return succeeded, []
+
+
+def bulk_approve(queryset, chunk_size=BULK_CHUNK_SIZE):
+    """Duyệt hàng loạt; trả về ``(số lượt đã duyệt, [(mã mượn, lý do lỗi)])``."""
+    return _bulk_transition(queryset, PENDING, _approve_chunk, chunk_size)
+
+
+def bulk_return(queryset, chunk_size=BULK_CHUNK_SIZE):
+    """Ghi nhận trả hàng loạt; trả về ``(số lượt đã trả, [(mã mượn, lý do lỗi)])``."""
+    return _bulk_transition(queryset, BORROWING, _return_chunk, chunk_size)
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .fulltext import is_processed, schedule_extraction, store_pages
+from .models import Book, Borrow, Collection, Notification, SubCollection
+from .notifications import invalidate_unread_counts
+from .search import index_book_trigrams, suggestion_index
+from .stats import forget_borrow
+from .thumbnails import schedule_renditions
+
+
+@receiver(post_save, sender=Book)
+def update_book_search_index(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    # Bỏ qua các lần lưu không đụng tới tên sách / tác giả (ví dụ chỉ cập nhật số lượng)
+    if update_fields is not None and not {'title', 'author'} & set(update_fields):
+        return
+    index_book_trigrams(instance)
+    suggestion_index.update_book(instance)
+
+
+@receiver(post_save, sender=Book)
+def make_cover_thumbnails(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'cover' not in update_fields):
+        return
+    if instance.cover:
+        schedule_renditions(instance.cover.name)
+
+
+@receiver(post_save, sender=Book)
+def extract_pdf_text(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'pdf' not in update_fields):
+        return
+    pdf_name = instance.pdf.name if instance.pdf else ""
+    if is_processed(pdf_name, instance.pdf_indexed):
+        return
+    if pdf_name:
+        schedule_extraction(instance)
+    else:
+        store_pages(instance.id, "", [])  # đã gỡ PDF: xoá các trang khỏi chỉ mục
+
+
+@receiver(post_save, sender=Collection)
+def make_collection_thumbnails(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    if instance.image:
+        schedule_renditions(instance.image.name)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_from_suggestions(sender, instance, **kwargs):
+    suggestion_index.remove_book(instance.id)
+
+
+@receiver(post_save, sender=SubCollection)
+@receiver(post_delete, sender=SubCollection)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def refresh_suggestions(sender, raw=False, **kwargs):
+    if not raw:
+        suggestion_index.invalidate()
+
+
+# Trang bộ sưu tập (book_list) được cache theo phiên bản danh mục, xem catalog.py
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=SubCollection)
+@receiver(post_delete, sender=SubCollection)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_count(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = instance.user_id
+    # Chỉ chạm vào bộ đếm sau khi commit: nếu giao dịch rollback thì thông báo không tồn tại
+    if not (created and instance.is_read):
+        transaction.on_commit(lambda: invalidate_unread_counts([user_id]))
+
+
+@receiver(post_delete, sender=Notification)
+def drop_unread_count(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_unread_counts([user_id]))
+
+
+@receiver(post_delete, sender=Borrow)
+def drop_borrow_stats(sender, instance, **kwargs):
+    forget_borrow(instance)
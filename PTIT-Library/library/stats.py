@@ -0,0 +1,126 @@
+"""Bảng tổng hợp cho các trang thống kê.
+
+Thay vì ``GROUP BY`` trên toàn bộ ``Borrow`` / ``EntryLog`` mỗi lần mở trang,
+các bộ đếm được cộng dần khi có chuyển trạng thái mượn / trả (library/services.py)
+và khi điểm danh. Lệnh ``python manage.py rebuild_stats`` dựng lại toàn bộ từ
+dữ liệu gốc (dùng lần đầu, hoặc sau khi sửa / xoá bản ghi trực tiếp trong admin).
+
+Quy ước ngày: lượt mượn tính theo ``borrow_date``, lượt trả theo ``return_date``,
+lượt vào theo ngày (giờ địa phương) của ``check_in``. Xoá một lượt đã duyệt
+(signal ``post_delete``) trừ lại các bộ đếm tương ứng.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BookBorrowStat, Borrow, DailyAttendanceStat, DailyBorrowStat, EntryLog, UserBorrowStat
+
+BORROWING = "Đang mượn"
+RETURNED = "Đã trả"
+
+
+def _bump(model, keys, **deltas):
+    """Cộng các bộ đếm của dòng ``keys``, tạo dòng mới nếu chưa có."""
+    updates = {field: F(field) + n for field, n in deltas.items()}
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Tiến trình khác vừa tạo dòng này
+        model.objects.filter(**keys).update(**updates)
+
+
+def _decrement(model, keys, **deltas):
+    # Không tạo dòng mới: dòng có thể đang bị xoá cùng sách / người dùng (CASCADE)
+    model.objects.filter(**keys).update(**{field: F(field) - n for field, n in deltas.items()})
+
+
+def record_borrowed(borrows):
+    """Cộng các lượt vừa được duyệt (mỗi nhóm sách / ngày / người một câu lệnh)."""
+    for (book_id, day), n in Counter((b.book_id, b.borrow_date) for b in borrows).items():
+        _bump(DailyBorrowStat, {'book_id': book_id, 'day': day}, borrowed=n)
+    for book_id, n in Counter(b.book_id for b in borrows).items():
+        _bump(BookBorrowStat, {'book_id': book_id}, borrowing=n, total_borrowed=n)
+    for user_id, n in Counter(b.user_id for b in borrows).items():
+        _bump(UserBorrowStat, {'user_id': user_id}, borrowing=n, total_borrowed=n)
+
+
+def record_returned(borrows, day):
+    for book_id, n in Counter(b.book_id for b in borrows).items():
+        _bump(DailyBorrowStat, {'book_id': book_id, 'day': day}, returned=n)
+        _bump(BookBorrowStat, {'book_id': book_id}, borrowing=-n)
+    for user_id, n in Counter(b.user_id for b in borrows).items():
+        _bump(UserBorrowStat, {'user_id': user_id}, borrowing=-n)
+
+
+def forget_borrow(borrow):
+    """Trừ các bộ đếm của một lượt mượn vừa bị xoá (theo trạng thái lúc xoá)."""
+    if borrow.status not in (BORROWING, RETURNED):
+        return
+    borrowing = 1 if borrow.status == BORROWING else 0
+    _decrement(DailyBorrowStat, {'book_id': borrow.book_id, 'day': borrow.borrow_date}, borrowed=1)
+    _decrement(BookBorrowStat, {'book_id': borrow.book_id}, borrowing=borrowing, total_borrowed=1)
+    _decrement(UserBorrowStat, {'user_id': borrow.user_id}, borrowing=borrowing, total_borrowed=1)
+    if borrow.status == RETURNED and borrow.return_date:
+        _decrement(DailyBorrowStat, {'book_id': borrow.book_id, 'day': borrow.return_date}, returned=1)
+
+
+def record_check_in(user_id, day, n=1):
+    _bump(DailyAttendanceStat, {'user_id': user_id, 'day': day}, check_ins=n)
+
+
+def rebuild_borrow_stats():
+    with transaction.atomic():
+        DailyBorrowStat.objects.all().delete()
+        BookBorrowStat.objects.all().delete()
+        UserBorrowStat.objects.all().delete()
+        daily = {}
+        borrowed = (
+            Borrow.objects.filter(status__in=[BORROWING, RETURNED])
+            .values('book_id', 'borrow_date').annotate(n=Count('id'))
+        )
+        for row in borrowed:
+            stat = daily.setdefault((row['borrow_date'], row['book_id']),
+                                    DailyBorrowStat(day=row['borrow_date'], book_id=row['book_id']))
+            stat.borrowed = row['n']
+        returned = (
+            Borrow.objects.filter(status=RETURNED, return_date__isnull=False)
+            .values('book_id', 'return_date').annotate(n=Count('id'))
+        )
+        for row in returned:
+            stat = daily.setdefault((row['return_date'], row['book_id']),
+                                    DailyBorrowStat(day=row['return_date'], book_id=row['book_id']))
+            stat.returned = row['n']
+        DailyBorrowStat.objects.bulk_create(daily.values(), batch_size=1000)
+
+        counters = {'total': Count('id'), 'borrowing': Count('id', filter=Q(status=BORROWING))}
+        active = Borrow.objects.filter(status__in=[BORROWING, RETURNED])
+        BookBorrowStat.objects.bulk_create(
+            [BookBorrowStat(book_id=r['book_id'], borrowing=r['borrowing'], total_borrowed=r['total'])
+             for r in active.values('book_id').annotate(**counters)],
+            batch_size=1000,
+        )
+        UserBorrowStat.objects.bulk_create(
+            [UserBorrowStat(user_id=r['user_id'], borrowing=r['borrowing'], total_borrowed=r['total'])
+             for r in active.values('user_id').annotate(**counters)],
+            batch_size=1000,
+        )
+    return len(daily)
+
+
+def rebuild_attendance_stats():
+    with transaction.atomic():
+        DailyAttendanceStat.objects.all().delete()
+        rows = (
+            EntryLog.objects.filter(check_in__isnull=False)
+            .annotate(check_in_day=TruncDate('check_in', tzinfo=timezone.get_current_timezone()))
+            .values('user_id', 'check_in_day').annotate(n=Count('id'))
+        )
+        stats = [DailyAttendanceStat(user_id=r['user_id'], day=r['check_in_day'], check_ins=r['n']) for r in rows]
+        DailyAttendanceStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
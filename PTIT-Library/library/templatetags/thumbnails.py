@@ -0,0 +1,41 @@
+from django import template
+from django.utils.html import format_html
+
+from library.thumbnails import SIZES, rendition_name, renditions_ready
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(image, alt="", css_class="", style=""):
+    """Thẻ ``<picture>`` dùng bản WebP / JPEG thu nhỏ (1x, 2x) của ``image``.
+
+    Nếu chưa có bản thu nhỏ (ảnh vừa tải lên, worker chưa chạy xong) thì dùng ảnh gốc.
+    Khối ``{% cache %}`` chứa thẻ này cần có ``image|thumbnail_ready`` trong khoá để
+    không giữ lại ảnh gốc sau khi bản thu nhỏ đã có.
+    """
+    if not image:
+        return ""
+    if not renditions_ready(image.name):
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+                           image.url, alt, css_class, style)
+
+    def srcset(ext):
+        return ", ".join(
+            f"{image.storage.url(rendition_name(image.name, size, ext))} {size // SIZES[0]}x" for size in SIZES
+        )
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset("webp"), image.storage.url(rendition_name(image.name, SIZES[0], "jpg")), srcset("jpg"),
+        alt, css_class, style,
+    )
+
+
+@register.filter
+def thumbnail_ready(image):
+    """Dùng trong khoá của ``{% cache %}``: khối được dựng lại khi bản thu nhỏ vừa có."""
+    return bool(image) and renditions_ready(image.name)
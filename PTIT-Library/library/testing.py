@@ -0,0 +1,24 @@
+"""Tiện ích cho test: giới hạn số truy vấn của một URL, xoá cache."""
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+def clear_caches():
+    """Xoá mọi cache, kể cả cache "shared" dạng file vốn còn lại giữa các test / lần chạy."""
+    for cache in caches.all():
+        cache.clear()
+
+
+class QueryBudgetMixin:
+    """Dùng kèm ``TestCase``: ``self.assertQueryBudget("my_borrows", 6)``."""
+
+    def assertQueryBudget(self, url_name, budget, *args, method="get", data=None, **kwargs):
+        url = reverse(url_name, args=args, kwargs=kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        if len(queries) > budget:
+            listing = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(queries, start=1))
+            self.fail(f"{url_name} chạy {len(queries)} truy vấn, vượt ngân sách {budget}:\n{listing}")
+        return response
@@ -1,3 +1,1235 @@
-from django.test import TestCase
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    attendance_codes, checkin, exports, fulltext, leaderboard, notifications, reminders, services, stats, thumbnails,
+)
+from .admin import OVERDUE_PREVIEW_LIMIT
+from .downloads import public_media
+from .sequences import SequenceAllocator, borrow_codes, reserve_block
+from .instrumentation import EndpointStats, RequestMetrics, ServerTimingMiddleware, endpoint_stats, merged_stats
+from .models import Book, BookBorrowStat, BookPage, Borrow, Collection, DailyBorrowStat, UserBorrowStat, DailyAttendanceStat, EntryLog, Notification, SubCollection
+from .search import (
+    FTS_TABLE, PrefixIndex, _PrefixState, _postings, ranked_search, rebuild_trigram_index, search_books,
+    trigrams,
+)
+from .testing import QueryBudgetMixin, clear_caches
+
+
+class MyBorrowsQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sv001", password="matkhau123")
+        self.client.force_login(self.user)
+
+    def create_borrows(self, n):
+        for i in range(n):
+            book = Book.objects.create(title=f"Sách {i}", author="Tác giả", quantity=5)
+            Borrow.objects.create(user=self.user, book=book, status="Đang chờ")
+            Borrow.objects.create(user=self.user, book=book, status="Đang mượn",
+                                  due_date=date.today() - timedelta(days=i % 2))
+            Borrow.objects.create(user=self.user, book=book, status="Đã trả",
+                                  due_date=date.today(), return_date=date.today())
+
+    def count_queries(self):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("my_borrows"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_borrows(self):
+        self.create_borrows(2)
+        few, _ = self.count_queries()
+        self.create_borrows(20)
+        many, response = self.count_queries()
+        self.assertEqual(few, many)
+        self.assertEqual(response.context["count_pending"], 22)
+        self.assertEqual(response.context["count_active"], 22)
+        self.assertEqual(response.context["count_overdue"], 11)
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sv002", password="matkhau123")
+        self.client.force_login(self.user)
+
+    def test_response_carries_query_count_and_timings(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("my_borrows"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for metric in ("db;dur=", "tpl;dur=", "view;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_timing_page_is_staff_only(self):
+        self.client.get(reverse("my_borrows"))
+        response = self.client.get(reverse("request_timing"))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(User.objects.create_superuser(username="admin", password="matkhau123"))
+        response = self.client.get(reverse("request_timing"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("my_borrows", [row["endpoint"] for row in response.context["rows"]])
+
+    def test_queries_run_while_streaming_are_counted(self):
+        def rows():
+            for _ in range(3):
+                yield f"{Book.objects.count()}\n"
+
+        endpoint_stats.reset()
+        middleware = ServerTimingMiddleware(lambda request: StreamingHttpResponse(rows()))
+        response = middleware(RequestFactory().get("/xuat/"))
+        self.assertIn('desc="0 queries"', response["Server-Timing"])
+        self.assertEqual(endpoint_stats._stats, {})
+
+        b"".join(response.streaming_content)  # TimedStream ghi số liệu khi đọc hết
+        self.assertEqual(endpoint_stats._stats["(không khớp URL)"]["queries"], 3)
+
+    def test_workers_claim_separate_slots(self):
+        endpoint_stats.reset()
+        workers = [EndpointStats(), EndpointStats()]
+        for pid, worker in zip((101, 102), workers):
+            with mock.patch("library.instrumentation.os.getpid", return_value=pid):
+                worker.record("home", 10.0, RequestMetrics())
+                worker.flush()
+                worker.flush()
+        self.assertEqual([worker._slot for worker in workers], [0, 1])
+
+        rows = {row["endpoint"]: row for row in merged_stats()}
+        self.assertEqual(rows["home"]["count"], 2)
+        endpoint_stats.reset()
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Số truy vấn tối đa của mỗi trang, không phụ thuộc lượng dữ liệu
+    BUDGETS = {
+        "book_list": 8,
+        "my_borrows": 5,
+        "load_more_notifications": 4,
+        "attendance_history": 6,
+        "attendance_statistics": 5,
+    }
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username="sv003", password="matkhau123")
+        self.client.force_login(self.user)
+        for i in range(15):
+            book = Book.objects.create(title=f"Sách {i}", author="Tác giả", quantity=5)
+            Borrow.objects.create(user=self.user, book=book, status="Đang chờ")
+            Notification.objects.create(user=self.user, title=f"Thông báo {i}", message="")
+
+    def test_hot_pages_stay_within_budget(self):
+        for url_name, budget in self.BUDGETS.items():
+            with self.subTest(url_name=url_name):
+                response = self.assertQueryBudget(url_name, budget)
+                self.assertEqual(response.status_code, 200)
+
+    def test_borrow_statistics_within_budget(self):
+        admin_user = User.objects.create_superuser(username="admin", password="matkhau123")
+        self.client.force_login(admin_user)
+        overdue = date.today() - timedelta(days=3)
+        for i in range(OVERDUE_PREVIEW_LIMIT + 10):
+            user = User.objects.create_user(username=f"qh{i}")
+            book = Book.objects.create(title=f"Quá hạn {i}", author="Tác giả", quantity=1)
+            Borrow.objects.create(user=user, book=book, status="Đang mượn", due_date=overdue)
+
+        # Số truy vấn cố định: các bảng tổng hợp + một trang danh sách quá hạn
+        response = self.assertQueryBudget("admin:borrow_statistics", 7)
+        self.assertEqual(len(response.context["overdue_borrows"]), OVERDUE_PREVIEW_LIMIT)
+        self.assertContains(response, f"{OVERDUE_PREVIEW_LIMIT} / {OVERDUE_PREVIEW_LIMIT + 10}")
+
+
+class CatalogLandingCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username="sv004", password="matkhau123")
+        self.client.force_login(self.user)
+        collection = Collection.objects.create(name="Giáo trình")
+        sub = SubCollection.objects.create(collection=collection, name="Toán")
+        self.book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=3, subcollection=sub)
+        Book.objects.create(title="Đại số", author="Tác giả", quantity=0, subcollection=sub)
+
+    def catalog_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("book_list"))
+        tables = ("library_book", "library_collection", "library_subcollection")
+        return response, [q["sql"] for q in queries if any(f'"{t}"' in q["sql"] for t in tables)]
+
+    def test_landing_page_served_from_cache(self):
+        response, queries = self.catalog_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, "2 đầu sách · 1 còn sẵn (3 bản)")
+
+        response, queries = self.catalog_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, "2 đầu sách · 1 còn sẵn (3 bản)")
+
+    def test_stock_change_invalidates_landing_page(self):
+        self.catalog_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.quantity = 0
+            self.book.save(update_fields=["quantity"])
+        response, queries = self.catalog_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, "2 đầu sách · 0 còn sẵn (0 bản)")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username="sv005", password="matkhau123")
+        self.client.force_login(self.user)
+        collection = Collection.objects.create(name="Giáo trình")
+        self.sub = SubCollection.objects.create(collection=collection, name="Toán")
+        self.book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=3, subcollection=self.sub)
+
+    def test_repeat_visit_gets_304(self):
+        for url in (reverse("book_detail", args=[self.book.id]), reverse("subcollection_books", args=[self.sub.id])):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_book_and_unread_count(self):
+        url = reverse("book_detail", args=[self.book.id])
+        etag = self.client.get(url)["ETag"]
+        self.book.title = "Giải tích 2"
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Giải tích 2")
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, title="Thông báo", message="")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_after_logging_in_again(self):
+        self.client.logout()
+        self.client.login(username="sv005", password="matkhau123")
+        url = reverse("book_detail", args=[self.book.id])
+        etag = self.client.get(url)["ETag"]
+        self.client.logout()
+        self.client.login(username="sv005", password="matkhau123")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)  # trang mới mang csrf token của phiên mới
+
+        csrf_client = self.client_class(enforce_csrf_checks=True)
+        csrf_client.cookies = self.client.cookies
+        token = response.content.decode().split("const csrfToken = '")[1].split("'")[0]
+        self.assertEqual(csrf_client.post(reverse("mark_all_read"), HTTP_X_CSRFTOKEN=token).status_code, 200)
+
+    def test_card_actions_follow_collection_rename(self):
+        self.book.pdf = "books/pdfs/giai-tich.pdf"
+        self.book.save()
+        url = reverse("subcollection_books", args=[self.sub.id])
+        self.assertNotContains(self.client.get(url), "Xem PDF")  # "Giáo trình": không mở PDF
+        Collection.objects.filter(pk=self.sub.collection_id).update(name="Tài liệu tham khảo")
+        self.assertContains(self.client.get(url), "Xem PDF")
+
+    def test_availability_is_not_part_of_the_cached_page(self):
+        url = reverse("book_detail", args=[self.book.id])
+        etag = self.client.get(url)["ETag"]
+        Book.objects.filter(id=self.book.id).update(quantity=0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(reverse("book_availability"), {"ids": str(self.book.id)})
+        self.assertIn("Sách hết", response.json()["books"][str(self.book.id)])
+
+    def test_fresh_page_shows_current_quantity(self):
+        urls = (reverse("book_detail", args=[self.book.id]), reverse("subcollection_books", args=[self.sub.id]))
+        for url in urls:
+            self.assertContains(self.client.get(url), "Còn sách")  # điền cache các khối
+        Book.objects.filter(id=self.book.id).update(quantity=0)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, "<strong>Số lượng:</strong> 0", html=False)
+                self.assertContains(response, "Sách hết")
+                self.assertNotContains(response, "Còn sách")
+
+    def test_availability_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse("book_availability"), {"ids": str(self.book.id)})
+        self.assertEqual(response.status_code, 302)
+
+
+class PrefixIndexTests(TestCase):
+    def setUp(self):
+        Book.objects.create(title="Giải tích 1", author="Nguyễn Văn A", quantity=1)
+        Book.objects.create(title="Đại số tuyến tính", author="Trần Thị B", quantity=1)
+        self.index = PrefixIndex()
+        self.index.build()
+
+    def labels(self, prefix):
+        return [label for kind, obj_id, label in self.index.suggest(prefix)]
+
+    def test_build_sorts_keys_once(self):
+        keys = self.index._state.keys
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(self.labels("tich"), ["Giải tích 1"])
+        self.assertEqual(self.labels("tran"), ["Trần Thị B"])
+
+    def test_stale_index_is_served_while_rebuilding_in_background(self):
+        self.index.invalidate()
+        with mock.patch.object(self.index, "build") as build, \
+                mock.patch("library.search.threading.Thread") as thread:
+            self.assertEqual(self.labels("dai"), ["Đại số tuyến tính"])
+        build.assert_not_called()
+        thread.return_value.start.assert_called_once()
+
+    def test_updates_during_rebuild_are_replayed(self):
+        book = Book.objects.create(title="Xác suất thống kê", author="Lê C", quantity=1)
+        original = _PrefixState.from_rows
+
+        def from_rows(books, subcollections):
+            state = original(list(books), list(subcollections))
+            self.index.remove_book(book.id)  # sách bị xoá trong lúc đang dựng
+            return state
+
+        with mock.patch("library.search._PrefixState.from_rows", side_effect=from_rows):
+            self.index.build()
+        self.assertEqual(self.labels("xac"), [])
+
+
+
+class SearchBooksTests(TestCase):
+    def setUp(self):
+        self.giai_tich = Book.objects.create(title="Giải tích 1", author="Nguyễn Văn A", quantity=1)
+        self.dai_so = Book.objects.create(title="Đại số tuyến tính", author="Trần Thị B", quantity=1)
+
+    def titles(self, query):
+        return [book.title for book in search_books(query)]
+
+    def fts_rowids(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", ['"%s"' % query])
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_matches_ignore_accents_and_case(self):
+        self.assertEqual(self.titles("giai tich"), ["Giải tích 1"])
+        self.assertEqual(self.titles("GIẢI TÍCH"), ["Giải tích 1"])
+        self.assertEqual(self.titles("tran thi"), ["Đại số tuyến tính"])  # theo tác giả
+        self.assertEqual(self.titles("   "), [])
+
+    def test_short_queries_fall_back_to_like(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.titles("đạ"), ["Đại số tuyến tính"])
+        self.assertNotIn(FTS_TABLE, queries.captured_queries[0]["sql"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.titles("dai"), ["Đại số tuyến tính"])
+        self.assertIn(FTS_TABLE, queries.captured_queries[0]["sql"])
+
+    def test_triggers_keep_fts_index_in_sync(self):
+        # update() không gọi Book.save: chỉ trigger mới cập nhật được chỉ mục
+        Book.objects.filter(pk=self.giai_tich.pk).update(title_normalized="xac suat thong ke")
+        self.assertEqual(self.fts_rowids("giai tich"), [])
+        self.assertEqual(self.fts_rowids("xac suat"), [self.giai_tich.pk])
+
+        self.dai_so.title = "Hình học giải tích"
+        self.dai_so.save()
+        self.assertEqual(self.titles("giai tich"), ["Hình học giải tích"])
+
+        self.dai_so.delete()
+        self.assertEqual(self.fts_rowids("giai tich"), [])
+        self.assertEqual(self.titles("tuyen tinh"), [])
+
+
+
+class RankedSearchTests(TestCase):
+    def setUp(self):
+        self.giai_tich = Book.objects.create(title="Giải tích 1", author="Nguyễn Văn A", quantity=1)
+        self.giai_tich_2 = Book.objects.create(title="Bài tập giải tích nâng cao", author="Lê C", quantity=1)
+        Book.objects.create(title="Đại số tuyến tính", author="Trần Thị B", quantity=1)
+
+    def titles(self, query, **kwargs):
+        return [book.title for book in ranked_search(query, **kwargs)]
+
+    def test_tolerates_typos_and_ranks_closest_first(self):
+        self.assertEqual(self.titles("giai tch"), ["Bài tập giải tích nâng cao", "Giải tích 1"])
+        self.assertEqual(self.titles("giai tich 1"), ["Giải tích 1", "Bài tập giải tích nâng cao"])
+        self.assertEqual(self.titles("tuyen tnh")[:1], ["Đại số tuyến tính"])
+        self.assertEqual(self.titles("nguyen van a"), ["Giải tích 1"])  # theo tác giả
+        self.assertEqual(self.titles("xyz qwe"), [])
+        self.assertEqual(self.titles("giai tich", limit=1), ["Bài tập giải tích nâng cao"])
+
+    def test_index_follows_title_changes(self):
+        self.giai_tich.title = "Xác suất thống kê"
+        self.giai_tich.save()
+        self.assertEqual(self.titles("giai tich 1"), ["Bài tập giải tích nâng cao"])
+        self.assertEqual(self.titles("xac suat"), ["Xác suất thống kê"])
+
+    def test_frequent_trigrams_are_not_used_for_candidates(self):
+        Book.objects.bulk_create(Book(title=f"Tập {i}", author="Ẩn danh", quantity=1) for i in range(5))
+        rebuild_trigram_index()
+        with mock.patch("library.search.POSTING_LIMIT", 3), \
+                CaptureQueriesContext(connection) as queries:
+            postings = _postings(trigrams("tap giai"))
+            self.assertEqual(self.titles("giai tap"), ["Bài tập giải tích nâng cao", "Giải tích 1"])
+        self.assertEqual(len(postings[" ta"]), 4)  # "tap" có ở 6 sách nhưng chỉ đọc 3 + 1
+        self.assertEqual(len(queries), 3)  # _postings ở trên, rồi danh sách trigram + in_bulk
+
+
+class BulkCheckInTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sv006", password="matkhau123")
+        self.morning = timezone.make_aware(datetime(2026, 10, 19, 7, 30))
+
+    def test_row_inserted_by_another_kiosk_becomes_check_out(self):
+        # Kiosk khác ghi lượt vào sau khi lô đã đọc các dòng hiện có
+        def existing_logs(scans):
+            EntryLog.objects.create(user=self.user, shift="Sáng", check_in=self.morning)
+            return {}
+
+        with mock.patch("library.checkin._existing_logs", side_effect=existing_logs):
+            results = checkin.bulk_check_in([(self.user.id, self.morning + timedelta(minutes=5))])
+
+        self.assertEqual(results[checkin.CHECKED_IN], 0)
+        self.assertEqual(results[checkin.CHECKED_OUT], 1)
+        log = EntryLog.objects.get(user=self.user)
+        self.assertEqual(log.check_out, self.morning + timedelta(minutes=5))
+
+    def test_malformed_entries_are_rejected(self):
+        staff = User.objects.create_user(username="staff", password="matkhau123", is_staff=True)
+        self.client.force_login(staff)
+        for entries in (["sv006"], [42], "sv006", [{"username": ["sv006"]}], [{"username": {"a": 1}}]):
+            with self.subTest(entries=entries):
+                response = self.client.post(
+                    reverse("attendance_bulk_check_in"), json.dumps({"entries": entries}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.today = date(2026, 10, 19)
+        self.users = [User.objects.create_user(username=f"xh{i}") for i in range(3)]
+        for user, n in zip(self.users, (3, 1, 2)):
+            DailyAttendanceStat.objects.create(user=user, day=self.today, check_ins=n)
+
+    def test_top_and_rank(self):
+        self.assertEqual(
+            leaderboard.top("month", today=self.today),
+            [(self.users[0].id, 3), (self.users[2].id, 2), (self.users[1].id, 1)],
+        )
+        self.assertEqual(leaderboard.rank_of(self.users[2].id, "month", today=self.today), (2, 2))
+
+    def test_own_count_is_never_stale(self):
+        leaderboard.top("month", today=self.today)  # ảnh chụp đã nằm trong cache
+        stats.record_check_in(self.users[1].id, self.today, 5)
+        self.assertEqual(leaderboard.rank_of(self.users[1].id, "month", today=self.today), (1, 6))
+        # Ảnh chụp chỉ làm mới sau LEADERBOARD_TIMEOUT giây
+        self.assertEqual(leaderboard.top("month", today=self.today)[0], (self.users[0].id, 3))
+        clear_caches()
+        self.assertEqual(leaderboard.top("month", today=self.today)[0], (self.users[1].id, 6))
+
+    def test_check_in_and_counter_commit_together(self):
+        morning = timezone.make_aware(datetime(2026, 10, 19, 9))
+        with mock.patch("library.checkin.record_check_in", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                checkin.check_in(self.users[1].id, now=morning)
+        self.assertFalse(EntryLog.objects.exists())
+
+        checkin.check_in(self.users[1].id, now=morning)
+        self.assertEqual(DailyAttendanceStat.objects.get(user=self.users[1], day=self.today).check_ins, 2)
+
+
+class BorrowAdminFormTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="matkhau123")
+        self.client.force_login(self.admin)
+        self.student = User.objects.create_user(username="sv007")
+        self.book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=0)
+        self.borrow = Borrow.objects.create(user=self.student, book=self.book, status="Đang chờ")
+
+    def post_status(self, status):
+        return self.client.post(reverse("admin:library_borrow_change", args=[self.borrow.pk]), {
+            "user": self.student.pk, "book": self.book.pk, "borrow_code": self.borrow.borrow_code,
+            "due_date": "", "return_date": "", "status": status,
+        })
+
+    def test_out_of_stock_approval_rerenders_form_without_logging(self):
+        response = self.post_status("Đang mượn")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "đã hết, không thể duyệt mượn")
+        self.assertFalse(LogEntry.objects.exists())
+        self.borrow.refresh_from_db()
+        self.assertEqual(self.borrow.status, "Đang chờ")
+
+    def test_valid_approval_is_saved(self):
+        Book.objects.filter(pk=self.book.pk).update(quantity=1)
+        with mock.patch("library.services.approve", wraps=services.approve) as approve:
+            response = self.post_status("Đang mượn")
+        self.assertEqual(response.status_code, 302)
+        approve.assert_called_once()
+        self.borrow.refresh_from_db()
+        self.assertEqual(self.borrow.status, "Đang mượn")
+        self.assertIsNotNone(self.borrow.due_date)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).quantity, 0)
+        self.assertEqual(Notification.objects.filter(user=self.student).count(), 1)
+
+    def test_return_goes_through_service(self):
+        Borrow.objects.filter(pk=self.borrow.pk).update(status="Đang mượn")
+        with mock.patch("library.services.return_", wraps=services.return_) as return_:
+            self.assertEqual(self.post_status("Đã trả").status_code, 302)
+        return_.assert_called_once()
+        self.borrow.refresh_from_db()
+        self.assertEqual((self.borrow.status, self.borrow.return_date), ("Đã trả", date.today()))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).quantity, 1)
+
+
+class BorrowTransitionConcurrencyTests(TransactionTestCase):
+    def approve_concurrently(self, borrows):
+        results = {}
+        barrier = threading.Barrier(len(borrows))
+
+        def worker(borrow):
+            try:
+                barrier.wait()
+                services.approve(borrow)
+                results[borrow.pk] = "ok"
+            except services.BorrowTransitionError:
+                results[borrow.pk] = "hết sách"
+            except Exception as exc:
+                results[borrow.pk] = repr(exc)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(borrow,)) for borrow in borrows]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return sorted(results.values())
+
+    def make_borrows(self, quantity, n=2):
+        book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=quantity)
+        users = [User.objects.create_user(username=f"dong{i}") for i in range(n)]
+        return book, [Borrow.objects.create(user=user, book=book, status="Đang chờ") for user in users]
+
+    def test_last_copy_is_approved_once(self):
+        book, borrows = self.make_borrows(quantity=1)
+        self.assertEqual(self.approve_concurrently(borrows), ["hết sách", "ok"])
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 0)
+        self.assertEqual(Borrow.objects.filter(status="Đang mượn").count(), 1)
+
+    def test_concurrent_approvals_do_not_lose_decrements(self):
+        book, borrows = self.make_borrows(quantity=5, n=4)
+        self.assertEqual(self.approve_concurrently(borrows), ["ok"] * 4)
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 1)
+
+
+class BorrowStatsTests(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(title=f"Sách {i}", author="Tác giả", quantity=5) for i in range(2)]
+        self.users = [User.objects.create_user(username=f"tk{i}") for i in range(2)]
+        self.borrows = [
+            Borrow.objects.create(user=user, book=book, status="Đang chờ") for user in self.users for book in self.books
+        ]
+
+    def counters(self):
+        return (
+            sorted(BookBorrowStat.objects.values_list("book_id", "borrowing", "total_borrowed")),
+            sorted(UserBorrowStat.objects.values_list("user_id", "borrowing", "total_borrowed")),
+            sorted(DailyBorrowStat.objects.values_list("book_id", "day", "borrowed", "returned")),
+        )
+
+    def assertRebuildMatches(self):
+        expected = self.counters()
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(self.counters(), expected)
+
+    def test_transitions_and_delete_keep_counters(self):
+        for borrow in self.borrows[:3]:
+            services.approve(borrow)
+        services.bulk_approve(Borrow.objects.filter(pk=self.borrows[3].pk))
+        services.return_(self.borrows[0])
+        services.bulk_return(Borrow.objects.filter(pk=self.borrows[1].pk))
+        today = date.today()
+        book_a, book_b = (b.id for b in self.books)
+        user_a, user_b = (u.id for u in self.users)
+        self.assertEqual(self.counters(), (
+            [(book_a, 1, 2), (book_b, 1, 2)],
+            [(user_a, 0, 2), (user_b, 2, 2)],
+            [(book_a, today, 2, 1), (book_b, today, 2, 1)],
+        ))
+        self.assertRebuildMatches()
+
+        Borrow.objects.get(pk=self.borrows[0].pk).delete()  # đã trả
+        Borrow.objects.filter(pk=self.borrows[2].pk).delete()  # đang mượn
+        self.assertEqual(self.counters(), (
+            [(book_a, 0, 0), (book_b, 1, 2)],
+            [(user_a, 0, 1), (user_b, 1, 1)],
+            [(book_a, today, 0, 0), (book_b, today, 2, 1)],
+        ))
+        # Lệnh dựng lại bỏ các dòng đã về 0
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(self.counters()[1], [(user_a, 0, 1), (user_b, 1, 1)])
+
+    def test_pending_borrows_are_not_counted(self):
+        Borrow.objects.get(pk=self.borrows[0].pk).delete()
+        self.assertEqual(self.counters(), ([], [], []))
+
+    def test_statistics_page_reads_rollups(self):
+        for borrow in self.borrows[:3]:
+            services.approve(borrow)
+        self.client.force_login(User.objects.create_superuser(username="admin", password="matkhau123"))
+        response = self.client.get(reverse("admin:borrow_statistics"))
+        self.assertEqual([s.user.username for s in response.context["top_readers"]], ["tk0", "tk1"])
+        self.assertEqual([(r["borrowed"], r["returned"]) for r in response.context["monthly"]], [(3, 0)])
+
+
+class BulkBorrowTransitionTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.users = [User.objects.create_user(username=f"hl{i}") for i in range(5)]
+
+    def pending(self, book):
+        return [Borrow.objects.create(user=user, book=book, status="Đang chờ") for user in self.users]
+
+    def test_approve_stops_at_available_stock(self):
+        book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=3)
+        borrows = self.pending(book)
+        with self.captureOnCommitCallbacks(execute=True):
+            done, failures = services.bulk_approve(Borrow.objects.all(), chunk_size=2)
+
+        self.assertEqual(done, 3)
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(all("đã hết" in reason for code, reason in failures))
+        # Lượt mượn cũ nhất được ưu tiên, kho không âm
+        self.assertEqual(
+            list(Borrow.objects.filter(status="Đang mượn").order_by("id").values_list("id", flat=True)),
+            [b.id for b in borrows[:3]],
+        )
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 0)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_wrong_status_is_reported_per_row(self):
+        book = Book.objects.create(title="Đại số", author="Tác giả", quantity=10)
+        borrows = self.pending(book)
+        Borrow.objects.filter(pk=borrows[0].pk).update(status="Đã trả")
+        done, failures = services.bulk_approve(Borrow.objects.all(), chunk_size=2)
+        self.assertEqual(done, 4)
+        self.assertEqual([code for code, reason in failures], [borrows[0].borrow_code])
+
+    def test_return_restores_stock_and_invalidates_counts_after_commit(self):
+        book = Book.objects.create(title="Xác suất", author="Tác giả", quantity=5)
+        self.pending(book)
+        services.bulk_approve(Borrow.objects.all(), chunk_size=2)
+        self.assertEqual(notifications.unread_count(self.users[0]), 1)  # đưa bộ đếm vào cache
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            done, failures = services.bulk_return(Borrow.objects.all(), chunk_size=2)
+        self.assertEqual((done, failures), (5, []))
+        self.assertEqual(notifications.unread_count(self.users[0]), 1)  # chưa commit nên bộ đếm cũ vẫn còn
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(notifications.unread_count(self.users[0]), 2)
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 5)
+
+    def test_badge_follows_new_and_read_notifications(self):
+        user = self.users[0]
+        self.client.force_login(user)
+        # Bộ cache riêng như của một worker khác, cùng thư mục với cache "shared"
+        other_worker = caches.create_connection(notifications.UNREAD_CACHE_ALIAS)
+        key = notifications._unread_key(user.id)
+
+        def badge():
+            content = self.client.get(reverse("book_list")).content.decode()
+            return int(re.search(r"Thông báo của tôi \((\d+)\)", content).group(1))
+
+        self.assertEqual(badge(), 0)
+        self.assertEqual(other_worker.get(key), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Notification.objects.create(user=user, title="Thông báo", message="")
+            Notification.objects.create(user=user, title="Thông báo", message="")
+        self.assertIsNone(other_worker.get(key))
+        self.assertEqual(badge(), 2)
+
+        self.client.get(reverse("read_notification", args=[first.id]))
+        self.assertEqual(badge(), 1)
+        self.client.post(reverse("mark_all_read"))
+        self.assertEqual(badge(), 0)
+        self.assertEqual(other_worker.get(key), 0)
+
+    def test_unread_count_changes_only_after_commit(self):
+        self.assertEqual(notifications.unread_count(self.users[0]), 0)
+        try:
+            with transaction.atomic():
+                Notification.objects.create(user=self.users[0], title="Thông báo", message="")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(notifications.unread_count(self.users[0]), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.users[0], title="Thông báo", message="")
+        self.assertEqual(notifications.unread_count(self.users[0]), 1)
+
+
+class BookPdfDownloadTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.book = Book.objects.create(title="Luận văn", author="Tác giả", quantity=1)
+        self.book.pdf.save("luan-van.pdf", ContentFile(self.content), save=False)
+        Book.objects.filter(pk=self.book.pk).update(pdf=self.book.pdf.name)
+        self.url = reverse("book_pdf", args=[self.book.id])
+        self.client.force_login(User.objects.create_user(username="sv022"))
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        # Client tự đóng response streaming khi đọc hết nội dung
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file_and_login_required(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_range_requests(self):
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=1000-": (1000, 1023),
+            "bytes=-24": (1000, 1023),
+            "bytes=1000-5000": (1000, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header=header):
+                response, body = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/1024")
+                self.assertEqual(response["Content-Length"], str(end - start + 1))
+                self.assertEqual(body, self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE="bytes=2000-")[0]
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_if_range(self):
+        etag = self.get()[0]["ETag"]
+        response, body = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+
+        # File đã đổi (ETag cũ không khớp): gửi lại cả file
+        response, body = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"cu"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_conditional_get(self):
+        response = self.get()[0]
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"])[0].status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])[0].status_code, 304)
+
+    def test_debug_media_route_hides_pdfs(self):
+        request = RequestFactory().get("/media/")
+        for path in (self.book.pdf.name, "books/covers/../pdfs/luan-van.pdf", "./Books/PDFs/luan-van.pdf"):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    public_media(request, path, document_root=self.media_root)
+
+        cover = ContentFile(b"anh", name="bia.jpg")
+        self.book.cover.save("bia.jpg", cover, save=False)
+        response = public_media(request, self.book.cover.name, document_root=self.media_root)
+        self.assertEqual(b"".join(response.streaming_content), b"anh")
+        # Không gọi response.close(): signal request_finished sẽ đóng kết nối CSDL của test
+        response.file_to_stream.close()
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client.force_login(User.objects.create_user(username="sv021"))
+        self.collection = Collection.objects.create(name="Giáo trình")
+        self.sub = SubCollection.objects.create(collection=self.collection, name="Toán")
+        self.book = Book.objects.create(title="Giải tích 1", author="Tác giả", quantity=3, subcollection=self.sub)
+        self.book.cover.save("bia.png", ContentFile(self.png((800, 1200))), save=False)
+        Book.objects.filter(pk=self.book.pk).update(cover=self.book.cover.name)
+
+    def png(self, size, mode="RGBA"):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def render(self, image):
+        return Template("{% load thumbnails %}{% thumbnail image alt='Bìa' %}").render(Context({"image": image}))
+
+    def test_generate_renditions(self):
+        name = self.book.cover.name
+        self.assertFalse(thumbnails.renditions_ready(name))
+        self.assertGreater(thumbnails.generate_renditions(name), 0)
+
+        for size in thumbnails.SIZES:
+            for ext, fmt in (("webp", "WEBP"), ("jpg", "JPEG")):
+                with default_storage.open(thumbnails.rendition_name(name, size, ext), "rb") as f:
+                    image = Image.open(f)
+                    self.assertEqual(image.format, fmt)
+                    self.assertEqual(image.height, size)  # ảnh gốc 800x1200: cạnh dài là chiều cao
+        self.assertTrue(thumbnails.renditions_ready(name))
+        self.assertEqual(thumbnails.generate_renditions(name), 0)  # đã có, không tạo lại
+
+    def test_tag_falls_back_to_original_until_ready(self):
+        html = self.render(self.book.cover)
+        self.assertIn(f'src="{self.book.cover.url}"', html)
+        self.assertNotIn("<picture>", html)
+
+        thumbnails.generate_renditions(self.book.cover.name)
+        html = self.render(self.book.cover)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(default_storage.url(thumbnails.rendition_name(self.book.cover.name, 400, "webp")) + " 2x", html)
+        self.assertEqual(self.render(None), "")
+
+    def test_failures_are_remembered(self):
+        name = default_storage.save("books/covers/hong.png", ContentFile(b"khong phai anh"))
+        with self.assertRaises(Exception):
+            thumbnails.generate_renditions(name)
+
+        with mock.patch.object(default_storage, "exists") as exists, \
+                mock.patch("library.workers.submit") as submit:
+            self.assertFalse(thumbnails.renditions_ready(name))
+            thumbnails.schedule_renditions(name)
+        exists.assert_not_called()
+        submit.assert_not_called()
+
+    def test_cached_fragments_pick_up_new_thumbnails(self):
+        self.collection.image.save("bst.png", ContentFile(self.png((300, 300), "RGB")), save=False)
+        Collection.objects.filter(pk=self.collection.pk).update(image=self.collection.image.name)
+        pages = {
+            reverse("subcollection_books", args=[self.sub.id]): self.book.cover,
+            reverse("book_list"): self.collection.image,
+        }
+        for url, image in pages.items():
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), f'src="{image.url}"')
+                thumbnails.generate_renditions(image.name)
+                response = self.client.get(url)
+                self.assertNotContains(response, f'src="{image.url}"')
+                self.assertContains(response, thumbnails.rendition_name(image.name, thumbnails.SIZES[0], "webp"))
+
+
+class PdfFullTextTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title="Mạng máy tính", author="Tác giả", quantity=1)
+        self.other = Book.objects.create(title="Cơ sở dữ liệu", author="Tác giả", quantity=1)
+
+    def test_store_pages_replaces_previous_pages(self):
+        fulltext.store_pages(self.book.id, "books/pdfs/cu.pdf", ["Trang một", "", "Trang ba"])
+        self.assertEqual(list(BookPage.objects.values_list("number", "text_normalized")),
+                         [(1, "trang mot"), (3, "trang ba")])
+
+        fulltext.store_pages(self.book.id, "books/pdfs/moi.pdf", ["Giao thức định tuyến"])
+        self.assertEqual(list(BookPage.objects.values_list("number", "text")), [(1, "Giao thức định tuyến")])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).pdf_indexed, "books/pdfs/moi.pdf")
+
+    def test_search_pages_returns_best_page_per_book(self):
+        fulltext.store_pages(self.book.id, "a.pdf", ["Giới thiệu", "Giao thức định tuyến OSPF", "Định tuyến tĩnh"])
+        fulltext.store_pages(self.other.id, "b.pdf", ["Chỉ mục và giao dịch"])
+
+        matches = fulltext.search_pages("dinh tuyen")
+        self.assertEqual([match.book for match in matches], [self.book])
+        self.assertIn(matches[0].page, (2, 3))
+        self.assertIn("<mark>tuyến</mark>", matches[0].snippet)
+
+        self.assertEqual([m.book for m in fulltext.search_pages("giao dịc")], [self.other])  # tiền tố khi đang gõ
+        self.assertEqual(fulltext.search_pages("?!"), [])
+
+    def test_snippet_window_and_escaping(self):
+        text = " ".join(f"từ{i}" for i in range(100)) + " <b>Định</b> tuyến"
+        html = fulltext.snippet(text, ["tuyen"], size=10)
+        self.assertTrue(html.startswith("… "))
+        self.assertIn("<mark>tuyến</mark>", html)
+        self.assertIn("&lt;b&gt;Định&lt;/b&gt;", html)
+        self.assertEqual(fulltext.snippet("một hai ba", ["khong"]), "một hai ba")
+
+    def test_failed_extraction_is_not_resubmitted(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        fulltext.store_pages(self.book.id, "cu.pdf", ["Trang của file cũ"])
+        with override_settings(MEDIA_ROOT=media_root):
+            self.book.pdf.save("hong.pdf", ContentFile(b"khong phai pdf"), save=False)
+            Book.objects.filter(pk=self.book.pk).update(pdf=self.book.pdf.name)
+            with self.assertRaises(Exception):
+                fulltext.index_book_pdf(self.book.id)
+
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual(book.pdf_indexed, fulltext.failed_marker(book.pdf.name))
+        self.assertFalse(BookPage.objects.filter(book=book).exists())
+
+        with mock.patch("library.signals.schedule_extraction") as schedule:
+            book.title = "Mạng máy tính (tái bản)"
+            book.save()
+        schedule.assert_not_called()
+
+
+class SequenceConcurrencyTests(TransactionTestCase):
+    threads = 8
+    per_thread = 25
+
+    def run_threads(self, allocate):
+        results, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            values = []
+            try:
+                barrier.wait()
+                for _ in range(self.per_thread):
+                    values.append(allocate())
+            except Exception as exc:
+                with lock:
+                    errors.append(repr(exc))
+            finally:
+                connection.close()
+                with lock:
+                    results.extend(values)
+
+        pool = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.threads * self.per_thread)
+        return results
+
+    def assertNoDuplicates(self, values):
+        self.assertEqual({value: n for value, n in Counter(values).items() if n > 1}, {})
+
+    def test_reserve_block_never_overlaps(self):
+        # Bộ đếm chưa tồn tại: các luồng cùng lúc đi vào nhánh tạo dòng Sequence
+        blocks = self.run_threads(lambda: reserve_block("thu_nghiem", 3))
+        values = [value for start, end in blocks for value in range(start, end + 1)]
+        self.assertNoDuplicates(values)
+        self.assertEqual(sorted(values), list(range(1, len(values) + 1)))
+
+    def test_reserve_block_is_one_statement_with_returning(self):
+        reserve_block("thu_nghiem", 1)  # tạo bộ đếm
+        with self.assertNumQueries(1 if connection.features.can_return_columns_from_insert else 2):
+            self.assertEqual(reserve_block("thu_nghiem", 4), (2, 5))
+
+    def test_borrow_codes_are_unique(self):
+        for block_size in (1, 5):
+            with self.subTest(block_size=block_size), self.settings(BORROW_CODE_BLOCK_SIZE=block_size):
+                self.assertNoDuplicates(self.run_threads(borrow_codes.next_value))
+
+    def test_separate_allocators_do_not_collide(self):
+        # Mỗi luồng một bộ cấp riêng, giống các worker giữ khối số riêng
+        allocators = threading.local()
+
+        def allocate():
+            if not hasattr(allocators, "current"):
+                allocators.current = SequenceAllocator("thu_nghiem_khoi", block_size=4)
+            return allocators.current.next_value()
+
+        self.assertNoDuplicates(self.run_threads(allocate))
+
+
+@override_settings(ATTENDANCE_CODE_WINDOW=30)
+class AttendanceCodeTests(TestCase):
+    now = 1_800_000_015  # giữa khung 60000000
+
+    def test_verify_accepts_current_and_previous_window_only(self):
+        window = attendance_codes.current_window(self.now)
+        self.assertEqual(window, 60_000_000)
+        self.assertTrue(attendance_codes.verify(attendance_codes.code_for(window), self.now))
+        self.assertTrue(attendance_codes.verify(f" {attendance_codes.code_for(window - 1)} ", self.now))
+        self.assertFalse(attendance_codes.verify(attendance_codes.code_for(window - 2), self.now))
+        self.assertFalse(attendance_codes.verify(attendance_codes.code_for(window + 1), self.now))
+        self.assertFalse(attendance_codes.verify("", self.now))
+        self.assertFalse(attendance_codes.verify(None, self.now))
+
+    def test_codes_are_six_digits_and_stable(self):
+        code = attendance_codes.code_for(123)
+        self.assertRegex(code, r"^\d{6}$")
+        self.assertEqual(code, attendance_codes.code_for(123))
+        self.assertEqual(attendance_codes.seconds_left(self.now), 15)
+
+    def test_is_servable(self):
+        window = attendance_codes.current_window(self.now)
+        self.assertTrue(attendance_codes.is_servable(window, self.now))
+        self.assertTrue(attendance_codes.is_servable(window - 1, self.now))
+        self.assertFalse(attendance_codes.is_servable(window - 2, self.now))
+        self.assertFalse(attendance_codes.is_servable(window + 1, self.now))  # không lộ mã tương lai
+
+    def test_code_and_qr_image_are_staff_only(self):
+        clear_caches()
+        student = User.objects.create_user(username="sv015")
+        staff = User.objects.create_user(username="quay", is_staff=True)
+        window = attendance_codes.current_window()
+        image_url = reverse("attendance_qr_image", args=[window])
+
+        self.client.force_login(student)
+        self.assertEqual(self.client.get(reverse("generate_qr_code")).status_code, 403)
+        self.assertEqual(self.client.get(image_url).status_code, 403)
+        self.assertRedirects(self.client.get(reverse("attendance_qr")), reverse("home"))
+
+        self.client.force_login(staff)
+        data = self.client.get(reverse("generate_qr_code")).json()
+        self.assertIn(data["code"], {attendance_codes.code_for(w) for w in (window, window + 1)})
+        response = self.client.get(image_url)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", response.content)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get(reverse("attendance_qr_image", args=[window - 2])).status_code, 404)
+
+
+class NotificationPagingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sv004")
+        other = User.objects.create_user(username="sv005")
+        Notification.objects.create(user=other, title="Không phải của tôi", message="")
+        Notification.objects.bulk_create(
+            Notification(user=self.user, title=f"TB {i}", message="") for i in range(23)
+        )
+        # 5 thông báo cũ có thời điểm khác nhau, 18 thông báo còn lại trùng created_at
+        # nên ranh giới các trang rơi vào giữa nhóm trùng và phải phân biệt bằng id
+        same_time = timezone.now().replace(microsecond=0)
+        mine = list(Notification.objects.filter(user=self.user).order_by("id"))
+        for i, notification in enumerate(mine):
+            notification.created_at = same_time - timedelta(minutes=max(0, 5 - i))
+        Notification.objects.bulk_update(mine, ["created_at"])
+        self.expected = [n.id for n in sorted(mine, key=lambda n: (n.created_at, n.id), reverse=True)]
+        self.client.force_login(self.user)
+
+    def fetch(self, cursor=None):
+        params = {"cursor": cursor} if cursor else {}
+        return self.client.get(reverse("load_more_notifications"), params)
+
+    def test_ties_on_created_at_are_paged_by_id_without_gaps(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            data = self.fetch(cursor).json()
+            seen.extend(n["id"] for n in data["notifications"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(data["notifications"]), 3)
+
+    def test_exact_last_page_has_no_next_cursor(self):
+        Notification.objects.filter(id__in=self.expected[20:]).delete()
+        first = self.fetch().json()
+        second = self.fetch(first["next_cursor"]).json()
+        self.assertEqual([n["id"] for n in second["notifications"]], self.expected[10:20])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_malformed_cursor_returns_400(self):
+        for cursor in ["khong-hop-le", "!!!", "MjAyNA", "bm90LWEtZGF0ZXw1"]:  # "2024", "not-a-date|5"
+            with self.subTest(cursor=cursor):
+                response = self.fetch(cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+
+class DueReminderTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.user = User.objects.create_user(username="sv010")
+        book = Book.objects.create(title="Giải tích 1", author="A", quantity=5)
+        self.overdue = Borrow.objects.create(user=self.user, book=book, status="Đang mượn",
+                                             due_date=self.today - timedelta(days=1))
+        self.due_soon = Borrow.objects.create(user=self.user, book=book, status="Đang mượn",
+                                              due_date=self.today + timedelta(days=3))
+        Borrow.objects.create(user=self.user, book=book, status="Đang mượn",
+                              due_date=self.today + timedelta(days=30))
+        Borrow.objects.create(user=self.user, book=book, status="Đã trả",
+                              due_date=self.today - timedelta(days=1))
+
+    def test_running_twice_creates_no_duplicates(self):
+        out = io.StringIO()
+        call_command("send_due_reminders", stdout=out)
+        self.assertIn("Đã tạo 2 thông báo", out.getvalue())
+        out = io.StringIO()
+        call_command("send_due_reminders", stdout=out)
+        self.assertIn("Đã tạo 0 thông báo", out.getvalue())
+        self.assertEqual(
+            sorted(Notification.objects.values_list("dedupe_key", flat=True)),
+            [reminders.reminder_key(self.overdue, reminders.OVERDUE),
+             reminders.reminder_key(self.due_soon, reminders.DUE_SOON)],
+        )
+
+    def test_counts_rows_actually_inserted(self):
+        original = Notification.objects.bulk_create
+
+        def skipping_bulk_create(objs, **kwargs):
+            # Giống ignore_conflicts bỏ qua một dòng đã có: không báo lỗi, không ghi
+            return original(objs[1:], **kwargs)
+
+        with mock.patch.object(Notification.objects, "bulk_create", side_effect=skipping_bulk_create):
+            self.assertEqual(reminders.send_due_reminders(today=self.today), 1)
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class ExportQuerysetTests(TestCase):
+    fields = (("title", "Tên sách"), ("quantity", "Số lượng"), ("subcollection__name", "Danh mục"),
+              ("publish_year", "Năm"))
+
+    def setUp(self):
+        Book.objects.create(title="Giải tích 1", author="A", quantity=3, publish_year="2020")
+        Book.objects.create(title='Sách "có, dấu phẩy"', author="B", quantity=0, publish_year="2021")
+        self.books = Book.objects.order_by("id")
+        self.addCleanup(setattr, exports.export_slots, "_running", 0)  # test lỗi không làm kẹt các test sau
+
+    def content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_is_streamed_with_bom_headers_and_quoting(self):
+        response = exports.export_queryset(self.books, self.fields, "csv", "sach")
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="sach.csv"')
+        self.assertEqual(exports.export_slots._running, 1)  # giữ lượt xuất tới khi gửi xong
+        self.assertEqual(self.content(response).splitlines(), [
+            "\ufeffTên sách,Số lượng,Danh mục,Năm",
+            "Giải tích 1,3,,2020",
+            '"Sách ""có, dấu phẩy""",0,,2021',
+        ])
+        self.assertEqual(exports.export_slots._running, 0)
+
+    def test_jsonl_uses_field_paths_as_keys(self):
+        response = exports.export_queryset(self.books, self.fields, "jsonl", "sach")
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lines = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(lines[0], {"title": "Giải tích 1", "quantity": 3, "subcollection__name": None,
+                                    "publish_year": "2020"})
+        self.assertEqual(len(lines), 2)
+
+    def test_xlsx_is_written_before_the_response_is_returned(self):
+        from openpyxl import load_workbook
+
+        response = exports.export_queryset(self.books, self.fields, "xlsx", "sach", title="Sách")
+        self.assertEqual(exports.export_slots._running, 0)  # file đã ghi xong, lượt xuất đã trả
+        self.assertEqual(response["Content-Type"], exports.XLSX_CONTENT_TYPE)
+        self.assertIn('filename="sach.xlsx"', response["Content-Disposition"])
+        sheet = load_workbook(io.BytesIO(b"".join(response.streaming_content)))["Sách"]
+        self.assertEqual([list(row) for row in sheet.iter_rows(values_only=True)], [
+            ["Tên sách", "Số lượng", "Danh mục", "Năm"],
+            ["Giải tích 1", 3, None, "2020"],
+            ['Sách "có, dấu phẩy"', 0, None, "2021"],
+        ])
+
+    def test_slot_is_released_when_streaming_fails(self):
+        def broken(value):
+            if value == 0:
+                raise RuntimeError("lỗi giữa chừng")
+            return value
+
+        response = exports.export_queryset(self.books, self.fields, "csv", "sach")
+        with mock.patch("library.exports.format_value", side_effect=broken):
+            with self.assertRaises(RuntimeError):
+                self.content(response)
+        self.assertEqual(exports.export_slots._running, 0)
+
+        # Client ngắt kết nối trước khi đọc dòng nào: response.close() vẫn trả lượt xuất.
+        # request_finished bị chặn để không đóng kết nối CSDL của test.
+        response = exports.export_queryset(self.books, self.fields, "jsonl", "sach")
+        with mock.patch("django.http.response.signals.request_finished.send"):
+            response.close()
+        self.assertEqual(exports.export_slots._running, 0)
+
+    def test_unknown_format_is_rejected_without_taking_a_slot(self):
+        with self.assertRaises(ValueError):
+            exports.export_queryset(self.books, self.fields, "pdf", "sach")
+        self.assertEqual(exports.export_slots._running, 0)
+
+
+class AdminExportActionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="quantri", password="matkhau123")
+        self.client.force_login(self.admin)
+        self.books = [
+            Book.objects.create(title=f"Giải tích {i}", author="Nguyễn Văn A", quantity=i) for i in range(15)
+        ] + [Book.objects.create(title="Đại số", author="Trần Thị B", quantity=1)]
+        self.addCleanup(setattr, exports.export_slots, "_running", 0)
+
+    def run_action(self, action, selected, select_across=False, query=""):
+        return self.client.post(reverse("admin:library_book_changelist") + query, {
+            "action": action,
+            "_selected_action": [book.pk for book in selected],
+            "select_across": "1" if select_across else "0",
+            "index": "0",
+        })
+
+    def exported_ids(self, response):
+        lines = b"".join(response.streaming_content).decode().splitlines()[1:]
+        return sorted(int(line.split(",")[0]) for line in lines)
+
+    def test_exports_only_selected_rows(self):
+        response = self.run_action("export_csv", self.books[:2])
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="book.csv"')
+        self.assertEqual(self.exported_ids(response), [self.books[0].pk, self.books[1].pk])
+
+    def test_select_across_exports_every_filtered_row(self):
+        # Chỉ 10 dòng của trang đầu được tick, nhưng "chọn tất cả" lấy mọi kết quả lọc
+        response = self.run_action("export_csv", self.books[:10], select_across=True, query="?q=Nguy")
+        self.assertEqual(self.exported_ids(response), sorted(book.pk for book in self.books[:15]))
+
+    def test_each_action_selects_its_format(self):
+        cases = {
+            "export_csv": ("text/csv; charset=utf-8", "book.csv"),
+            "export_jsonl": ("application/x-ndjson; charset=utf-8", "book.jsonl"),
+            "export_xlsx": (exports.XLSX_CONTENT_TYPE, "book.xlsx"),
+        }
+        for action, (content_type, filename) in cases.items():
+            with self.subTest(action=action):
+                response = self.run_action(action, self.books[:1])
+                self.assertEqual(response["Content-Type"], content_type)
+                self.assertIn(f'filename="{filename}"', response["Content-Disposition"])
+                b"".join(response.streaming_content)
+        self.assertEqual(exports.export_slots._running, 0)
+
+    @override_settings(EXPORT_MAX_CONCURRENT=1)
+    def test_busy_export_is_refused_with_a_message(self):
+        running = self.run_action("export_csv", self.books[:1])  # chưa đọc xong nên vẫn giữ lượt
+        response = self.run_action("export_xlsx", self.books[:1])
+        self.assertRedirects(response, reverse("admin:library_book_changelist"))
+        self.assertIn("quá nhiều lượt xuất", str(list(response.wsgi_request._messages)[0]))
+        b"".join(running.streaming_content)
+        self.assertEqual(self.run_action("export_xlsx", self.books[:1])["Content-Type"], exports.XLSX_CONTENT_TYPE)
@@ -0,0 +1,122 @@
+"""Ảnh thu nhỏ cho bìa sách / ảnh bộ sưu tập hiển thị trong lưới.
+
+Mỗi ảnh gốc có các bản nhỏ cố định (vừa khung ``size`` x ``size``) ở định dạng
+WebP và JPEG (cho trình duyệt không hỗ trợ WebP), lưu cạnh nhau dưới ``thumbs/``
+theo tên suy ra từ tên file gốc, nên template tính được URL mà không cần truy vấn.
+
+Ảnh được tạo trên luồng nền (library/workers.py) khi tải ảnh lên, hoặc bằng lệnh
+``python manage.py generate_thumbnails`` cho các ảnh đã có.
+
+Trạng thái của từng ảnh (đã có / chưa có / lỗi) được nhớ trong cache để template
+không phải stat file mỗi lần render. Ảnh lỗi (file hỏng, định dạng lạ) không được
+thử lại trên luồng nền; lệnh ``generate_thumbnails`` vẫn thử lại.
+"""
+import io
+import posixpath
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .catalog import bump_catalog_version
+
+# Cạnh lớn nhất (px): bản 1x cho thẻ cao 180-200px và bản 2x cho màn hình mật độ cao
+SIZES = (200, 400)
+FORMATS = (("webp", "WEBP", {"quality": 80, "method": 4}),
+           ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}))
+THUMBS_DIR = "thumbs"
+
+READY, MISSING, FAILED = "ready", "missing", "failed"
+STATE_TIMEOUTS = {
+    READY: 60 * 60 * 24,
+    MISSING: 60,  # worker có thể đang tạo (hoặc tiến trình khác vừa tạo xong): kiểm tra lại sau một phút
+    FAILED: 60 * 60 * 24,
+}
+
+
+def rendition_name(name, size, ext):
+    """``books/covers/a.png`` → ``thumbs/books/covers/a_200.webp``"""
+    stem, _ = posixpath.splitext(name)
+    return f"{THUMBS_DIR}/{stem}_{size}.{ext}"
+
+
+def rendition_names(name):
+    return [rendition_name(name, size, ext) for size in SIZES for ext, _, _ in FORMATS]
+
+
+def _state_key(name):
+    return f"thumbs:state:{name}"
+
+
+def _set_state(name, state):
+    cache.set(_state_key(name), state, STATE_TIMEOUTS[state])
+
+
+def rendition_state(name):
+    """``READY`` / ``MISSING`` / ``FAILED`` cho ảnh ``name``."""
+    state = cache.get(_state_key(name))
+    if state is None:
+        state = READY if all(default_storage.exists(n) for n in rendition_names(name)) else MISSING
+        _set_state(name, state)
+    return state
+
+
+def renditions_ready(name):
+    return rendition_state(name) == READY
+
+
+def generate_renditions(name, force=False):
+    """Tạo các bản nhỏ cho ảnh ``name`` trong storage, trả về tổng số byte đã ghi.
+
+    Lỗi được nhớ lại (``FAILED``) rồi ném tiếp cho nơi gọi.
+    """
+    if not force and renditions_ready(name):
+        return 0
+    try:
+        written = _write_renditions(name)
+    except Exception:
+        _set_state(name, FAILED)
+        raise
+    _set_state(name, READY)
+    # Khối bộ sưu tập ở trang đầu có thể đang giữ ảnh gốc: dựng lại với bản nhỏ
+    bump_catalog_version()
+    return written
+
+
+def _write_renditions(name):
+    with default_storage.open(name, "rb") as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    # JPEG không có kênh alpha: ghép lên nền trắng như màu nền của thẻ
+    flat = image
+    if image.mode == "RGBA":
+        flat = Image.new("RGB", image.size, (255, 255, 255))
+        flat.paste(image, mask=image.getchannel("A"))
+
+    written = 0
+    for size in SIZES:
+        for ext, fmt, options in FORMATS:
+            thumb = (image if fmt == "WEBP" else flat).copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumb.save(buffer, fmt, **options)
+            target = rendition_name(name, size, ext)
+            # storage.save đổi tên nếu file đã tồn tại, nên xoá bản cũ trước
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+            written += buffer.tell()
+    return written
+
+
+def schedule_renditions(name):
+    """Tạo bản nhỏ trên luồng nền sau khi giao dịch commit."""
+    from . import workers  # tránh circular import
+
+    if name and rendition_state(name) == MISSING:
+        workers.submit(generate_renditions, name)
+
@@ -11,9 +11,12 @@ urlpatterns = [
     
     # Sách
     path("books/", views.book_list, name="book_list"),
+    path("books/suggest/", views.book_suggest, name="book_suggest"),  # gợi ý khi gõ (AJAX)
+    path("books/availability/", views.book_availability, name="book_availability"),  # số lượng sách (AJAX)
 
     #Chi tiết sách
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('book/<int:book_id>/pdf/', views.book_pdf, name='book_pdf'),  # PDF cần đăng nhập, hỗ trợ Range
 
     # Mượn sách
     path("register/<int:book_id>/", views.register_borrow, name="register_borrow"),
@@ -45,7 +48,10 @@ urlpatterns = [
     # Điểm danh
     path("attendance/qr/", views.attendance_qr_page, name="attendance_qr"),
     path("attendance/qr/generate/", views.generate_qr_code, name="generate_qr_code"),
+    path("attendance/qr/<int:window>.svg", views.attendance_qr_image, name="attendance_qr_image"),
     path("attendance/check/", views.attendance_check_code, name="attendance_check_code"),  # nhập mã điểm danh
+    path("attendance/check-in/", views.attendance_check_in_api, name="attendance_check_in_api"),  # kiosk
+    path("attendance/check-in/bulk/", views.attendance_bulk_check_in, name="attendance_bulk_check_in"),  # máy quét thẻ
     path("attendance/history/", views.attendance_history, name="attendance_history"),
     path("attendance/statistics/", views.attendance_statistics, name="attendance_statistics"),
     path("attendance/top/", views.attendance_top, name="attendance_top"),
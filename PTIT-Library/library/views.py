@@ -2,17 +2,33 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from datetime import date, timedelta
-from .models import Book, Borrow, Notification, Collection, SubCollection
-from django.db.models import Q, Count
+from .models import Book, Borrow, Notification, SubCollection
+from django.db.models import Q, Count, Sum
 from django.core.paginator import Paginator
-from unidecode import unidecode
+from .search import search_books, ranked_search, suggestion_index
+from .fulltext import search_pages
+from .catalog import (
+    FRAGMENT_CACHE_TIMEOUT, LANDING_CACHE_TIMEOUT, book_etag, book_last_modified, catalog_version,
+    get_book, get_subcollection, landing_collections, subcollection_etag, subcollection_last_modified,
+)
+from .notifications import notifications_page, invalidate_unread_counts
 from datetime import timedelta
 from django.utils import timezone
-from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.http import JsonResponse, HttpResponse, Http404
+from django.urls import reverse
+from urllib.parse import urlencode
 from django.utils.timezone import localtime
-import random, io, qrcode, base64
-from .models import EntryLog
-from django.views.decorators.http import require_POST
+from .models import EntryLog, DailyAttendanceStat
+from . import checkin
+from .downloads import protected_file_response
+from . import attendance_codes
+from . import leaderboard
+from django.contrib.auth.models import User
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.cache import cache_control, never_cache
+from django.template.loader import render_to_string
+import json
 
 
 def home(request):
@@ -21,7 +37,6 @@ def home(request):
 @login_required
 def book_list(request):
     query = request.GET.get('q', '').strip()
-    collections = Collection.objects.prefetch_related('subcollections').all().order_by('id')
 
     # ✅ Kiểm tra cảnh báo quá hạn (chỉ hiện 1 lần trong phiên)
     if request.user.is_authenticated:
@@ -42,46 +57,105 @@ def book_list(request):
 
     # Nếu người dùng tìm kiếm, hiển thị danh sách sách
     if query:
-        normalized_query = unidecode(query).lower()
-        books = [
-            b for b in Book.objects.all()
-            if normalized_query in unidecode(b.title).lower()
-            or normalized_query in unidecode(b.author).lower()
-        ]
+        books = search_books(query)
         paginator = Paginator(books, 12)
         page_obj = paginator.get_page(request.GET.get('page'))
+        # Không có kết quả khớp chính xác → gợi ý các sách gần giống nhất (gõ sai, thiếu dấu...)
+        similar_books = ranked_search(query, limit=12) if not paginator.count else []
+        # Khớp trong nội dung PDF (luận văn, e-book...) chỉ hiện ở trang đầu kết quả
+        page_matches = search_pages(query, limit=10) if page_obj.number == 1 else []
         return render(request, 'library/book_list.html', {
             'query': query,
             'page_obj': page_obj,
+            'similar_books': similar_books,
+            'page_matches': page_matches,
             'collections': None,
             'grid_view': True
         })
 
-    # Nếu không có tìm kiếm → hiển thị bộ sưu tập
+    # Nếu không có tìm kiếm → hiển thị bộ sưu tập. Hàm chỉ được template gọi khi
+    # khối {% cache %} hết hạn / đổi phiên bản, nên trang thường không truy vấn danh mục
     return render(request, 'library/book_list.html', {
-        'collections': collections,
+        'collections': landing_collections,
+        'catalog_version': catalog_version(),
+        'landing_cache_timeout': LANDING_CACHE_TIMEOUT,
         'query': query,
         'grid_view': True
     })
 
 
+# Số sách tối đa mỗi lần hỏi số lượng (một trang kết quả có tối đa 12 + 12 thẻ sách)
+AVAILABILITY_MAX_IDS = 50
+
+
+@login_required
+def book_suggest(request):
+    """Gợi ý khi gõ cho ô tìm kiếm, trả lời từ chỉ mục tiền tố trong bộ nhớ."""
+    query = request.GET.get('q', '').strip()
+    suggestions = []
+    for kind, obj_id, label in suggestion_index.suggest(query, limit=8):
+        if kind == 'book':
+            url = reverse('book_detail', args=[obj_id])
+        elif kind == 'subcollection':
+            url = reverse('subcollection_books', args=[obj_id])
+        else:
+            url = f"{reverse('book_list')}?{urlencode({'q': label})}"
+        suggestions.append({'label': label, 'kind': kind, 'url': url})
+    return JsonResponse({'suggestions': suggestions})
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=subcollection_etag, last_modified_func=subcollection_last_modified)
 def subcollection_books(request, sub_id):
-    sub = get_object_or_404(SubCollection, id=sub_id)
-    books = Book.objects.filter(subcollection=sub).order_by('title')
+    found = get_subcollection(request, sub_id)
+    if found is None:
+        raise Http404("Không tìm thấy danh mục.")
+    sub, version, _ = found
+    books = Book.objects.filter(subcollection=sub).select_related('subcollection__collection').order_by('title', 'id')
 
-    paginator = Paginator(books, 6)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj = Paginator(books, 6).get_page(request.GET.get('page'))
 
     return render(request, 'library/collection_list.html', {
         'sub': sub,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'catalog_version': version,
+        'page_number': request.GET.get('page', '1'),
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
     })
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=book_etag, last_modified_func=book_last_modified)
 def book_detail(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
-    return render(request, 'library/book_detail.html', {'book': book})
+    book = get_book(request, book_id)
+    if book is None:
+        raise Http404("Không tìm thấy sách.")
+    return render(request, 'library/book_detail.html', {
+        'book': book,
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
+    })
+
+@login_required
+@never_cache
+def book_availability(request):
+    """Khối số lượng / trạng thái của các sách ``?ids=1,2,3``, làm mới sau khi trang được tải."""
+    ids = [int(x) for x in request.GET.get('ids', '').split(',') if x.isdigit()][:AVAILABILITY_MAX_IDS]
+    books = Book.objects.filter(id__in=ids).select_related('subcollection__collection')
+    return JsonResponse({'books': {
+        book.id: render_to_string('library/book_availability.html', {'book': book, 'user': request.user})
+        for book in books
+    }})
+
+@login_required
+def book_pdf(request, book_id):
+    book = get_object_or_404(Book.objects.only('id', 'title', 'pdf'), id=book_id)
+    if not book.pdf:
+        raise Http404("Sách không có file PDF.")
+    return protected_file_response(
+        request, book.pdf, filename=f"{book.title}.pdf",
+        as_attachment=request.GET.get("download") == "1", content_type="application/pdf",
+    )
 
 @login_required
 def register_borrow(request, book_id):
@@ -133,41 +207,26 @@ def cancel_borrow(request, borrow_id):
 
 @login_required
 def my_borrows(request):
-    pending = Borrow.objects.filter(user=request.user, status="Đang chờ")
-    active = Borrow.objects.filter(user=request.user, status="Đang mượn")
-    returned = Borrow.objects.filter(user=request.user, status="Đã trả")
-
-    # Kiểm tra sách sắp hết hạn trong 7 ngày
-    now = timezone.now().date()
-    for borrow in active:
-        if borrow.due_date and 0 <= (borrow.due_date - now).days <= 7:
-            exists = Notification.objects.filter(
-                user=request.user,
-                title="Lưu ý!",
-                message__icontains=borrow.book.title,
-                is_read=False
-            ).exists()
-            if not exists:
-                Notification.objects.create(
-                    user=request.user,
-                    title="Lưu ý!",
-                    message=f"Sách '{borrow.book.title}' bạn đang mượn sẽ hết hạn vào ngày {borrow.due_date.strftime('%d/%m/%Y')}. "
-                            "Hãy trả sách đúng hạn để tránh phí phạt."
-                )
-
-    overdue = [b for b in active if b.is_overdue()]
+    # Một truy vấn duy nhất (kèm sách), chia theo trạng thái trong bộ nhớ
+    borrows = Borrow.objects.filter(user=request.user).select_related('book').order_by('id')
+    pending, active, returned = [], [], []
+    by_status = {"Đang chờ": pending, "Đang mượn": active, "Đã trả": returned}
+    for b in borrows:
+        if b.status in by_status:
+            by_status[b.status].append(b)
 
     for b in active:
         b.is_late = b.is_overdue()
+    overdue = [b for b in active if b.is_late]
 
     return render(request, 'library/my_borrows.html', {
         'pending': pending,
         'active': active,
         'returned': returned,
         'overdue': overdue,
-        'count_pending': pending.count(),
-        'count_active': active.count(),
-        'count_returned': returned.count(),
+        'count_pending': len(pending),
+        'count_active': len(active),
+        'count_returned': len(returned),
         'count_overdue': len(overdue),
     })
 
@@ -175,15 +234,18 @@ def my_borrows(request):
 @login_required
 def mark_all_read(request):
     if request.method == 'POST':
-        request.user.notifications.filter(is_read=False).update(is_read=True)
+        if request.user.notifications.filter(is_read=False).update(is_read=True):
+            invalidate_unread_counts([request.user.id])
         return JsonResponse({'status': 'ok'})
     return redirect('home')
 
 @login_required
 def read_notification(request, notif_id):
     notif = get_object_or_404(Notification, id=notif_id, user=request.user)
-    notif.is_read = True
-    notif.save()
+    if not notif.is_read:
+        if Notification.objects.filter(pk=notif.pk, is_read=False).update(is_read=True):
+            invalidate_unread_counts([request.user.id])
+        notif.is_read = True
 
     local_time = timezone.localtime(notif.created_at)
     
@@ -193,25 +255,15 @@ def read_notification(request, notif_id):
         'time': local_time.strftime("%d/%m/%Y %H:%M"),
     })
 
-def notification_context(request):
-    if request.user.is_authenticated:
-        unread = Notification.objects.filter(user=request.user, is_read=False).count()
-        recent = Notification.objects.filter(user=request.user).order_by('-created_at')[:10]
-        return {'unread_notifications': unread, 'recent_notifications': recent}
-    return {}
-
 @login_required
 def load_more_notifications(request):
     if not request.user.is_authenticated:
         return JsonResponse({'notifications': []})
 
-    offset = int(request.GET.get('offset', 0))
-    limit = 10
-
-    notifications = (
-        Notification.objects.filter(user=request.user)
-        .order_by('-created_at')[offset:offset + limit]
-    )
+    try:
+        notifications, next_cursor = notifications_page(request.user, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Con trỏ không hợp lệ'}, status=400)
 
     data = []
     for n in notifications:
@@ -223,62 +275,59 @@ def load_more_notifications(request):
             'time': timezone.localtime(n.created_at).strftime("%d/%m/%Y %H:%M"),
         })
 
-    return JsonResponse({'notifications': data})
+    return JsonResponse({'notifications': data, 'next_cursor': next_cursor})
 
 # ✅ Trang hiển thị QR code và mã
 @login_required
 def attendance_qr_page(request):
-    return render(request, "library/attendance_qr.html")
-
-@login_required
-def generate_qr_code(request):
-    #chỉ admin mới dc xem link QR, cmt phần này để demo cho nhanh
-    '''
+    # Mã dùng chung cho mọi sinh viên: chỉ nhân viên (màn hình ở quầy) được xem
     if not request.user.is_staff:
         messages.error(request, "Bạn không có quyền truy cập trang này.")
         return redirect("home")
-    '''
-    # Sinh mã ngẫu nhiên gồm 6 chữ số
-    code = str(random.randint(100000, 999999))
-    request.session['attendance_code'] = code  # lưu vào session (demo)
-    request.session.modified = True
-
-    # Sinh ảnh QR (nội dung là mã 6 số)
-    qr = qrcode.make(code)
-    buffer = io.BytesIO()
-    qr.save(buffer, format='PNG')
-    qr_data = base64.b64encode(buffer.getvalue()).decode()
+    return render(request, "library/attendance_qr.html", {
+        "window_seconds": attendance_codes.window_seconds(),
+    })
 
-    return JsonResponse({
-        "code": code,
-        "qr_image": f"data:image/png;base64,{qr_data}",
+@login_required
+def generate_qr_code(request):
+    # Chỉ nhân viên: ai lấy được mã từ xa thì điểm danh được mà không cần có mặt
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Bạn không có quyền truy cập."}, status=403)
+    # Mã dùng chung theo khung thời gian, mọi sinh viên nhập cùng một mã
+    window = attendance_codes.current_window()
+    expires_in = attendance_codes.seconds_left()
+
+    response = JsonResponse({
+        "code": attendance_codes.code_for(window),
+        "qr_image": reverse("attendance_qr_image", args=[window]),
         "generated_at": timezone.localtime(timezone.now()).strftime("%H:%M:%S"),
+        "expires_in": expires_in,
     })
+    response["Cache-Control"] = f"private, max-age={expires_in}"
+    return response
+
+@login_required
+def attendance_qr_image(request, window):
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+    if not attendance_codes.is_servable(window):
+        raise Http404("Mã QR đã hết hạn.")
+    response = HttpResponse(attendance_codes.qr_svg(window), content_type="image/svg+xml")
+    # Ảnh của một khung không bao giờ đổi
+    response["Cache-Control"] = f"private, max-age={attendance_codes.window_seconds() * 2}, immutable"
+    return response
 
 @login_required
 def attendance_check_code(request):
     if request.method == "POST":
-        input_code = request.POST.get("code")
-        saved_code = request.session.get("attendance_code")
-
-        if input_code != saved_code:
+        if not attendance_codes.verify(request.POST.get("code")):
             messages.error(request, "Mã điểm danh không hợp lệ hoặc đã hết hạn.")
             return redirect("attendance_history")
 
-        user = request.user
-        now = timezone.localtime(timezone.now())
-        shift = "Sáng" if now.hour < 12 else "Chiều"
-        today = now.date()
-
-        log, created = EntryLog.objects.get_or_create(user=user, shift=shift, check_in__date=today)
-
-        if not log.check_in:
-            log.check_in = now
-            log.save()
+        result, shift, now = checkin.check_in(request.user.id)
+        if result == checkin.CHECKED_IN:
             messages.success(request, f"Điểm danh vào {shift.lower()} thành công lúc {now.strftime('%H:%M:%S')}")
-        elif not log.check_out:
-            log.check_out = now
-            log.save()
+        elif result == checkin.CHECKED_OUT:
             messages.success(request, f"Điểm danh ra {shift.lower()} thành công lúc {now.strftime('%H:%M:%S')}")
         else:
             messages.info(request, "Bạn đã hoàn thành điểm danh buổi này.")
@@ -288,6 +337,54 @@ def attendance_check_code(request):
     return render(request, 'library/attendance_check.html')
 
 
+@login_required
+@require_POST
+def attendance_check_in_api(request):
+    """Điểm danh cho kiosk: một lệnh INSERT, trả JSON, không qua messages / redirect."""
+    if not attendance_codes.verify(request.POST.get("code")):
+        return JsonResponse({"error": "Mã điểm danh không hợp lệ hoặc đã hết hạn."}, status=400)
+
+    result, shift, now = checkin.check_in(request.user.id)
+    return JsonResponse({"status": result, "shift": shift, "time": now.strftime("%H:%M:%S")})
+
+
+@login_required
+@require_POST
+def attendance_bulk_check_in(request):
+    """Nhận một loạt lượt quét từ máy quét thẻ (chỉ nhân viên).
+
+    Body JSON: ``{"entries": [{"username": "B21DCCN001", "time": "2026-10-18T07:31:05+07:00"}, ...]}``,
+    ``time`` có thể bỏ trống (lấy thời điểm nhận).
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Bạn không có quyền truy cập."}, status=403)
+    try:
+        entries = json.loads(request.body)["entries"]
+        now = timezone.now()
+        scans = []
+        for entry in entries:
+            moment = parse_datetime(entry["time"]) if entry.get("time") else now
+            if moment is None:
+                raise ValueError(entry["time"])
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            if not isinstance(entry["username"], str):
+                raise TypeError(entry["username"])
+            scans.append((entry["username"], moment))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"error": "Dữ liệu không hợp lệ."}, status=400)
+
+    user_ids = dict(User.objects.filter(username__in={username for username, _ in scans})
+                    .values_list('username', 'id'))
+    results = checkin.bulk_check_in(
+        (user_ids[username], moment) for username, moment in scans if username in user_ids
+    )
+    return JsonResponse({
+        **{status: results[status] for status in (checkin.CHECKED_IN, checkin.CHECKED_OUT, checkin.COMPLETED)},
+        "unknown": sorted({username for username, _ in scans if username not in user_ids}),
+    })
+
+
 @login_required
 def attendance_history(request):
     logs = EntryLog.objects.filter(user=request.user)
@@ -296,9 +393,9 @@ def attendance_history(request):
     start_date = request.GET.get("start")
     end_date = request.GET.get("end")
     if start_date:
-        logs = logs.filter(check_in__date__gte=start_date)
+        logs = logs.filter(day__gte=start_date)
     if end_date:
-        logs = logs.filter(check_in__date__lte=end_date)
+        logs = logs.filter(day__lte=end_date)
 
     paginator = Paginator(logs, 10)
     page_number = request.GET.get("page")
@@ -314,13 +411,13 @@ def attendance_history(request):
 @login_required
 def attendance_statistics(request):
     from django.db.models.functions import TruncMonth
-    now = timezone.now()
 
+    # Cộng các dòng tổng hợp theo ngày của người dùng (tối đa ~300 dòng cho 10 tháng)
     data = (
-        EntryLog.objects.filter(user=request.user)
-        .annotate(month=TruncMonth('check_in'))
+        DailyAttendanceStat.objects.filter(user=request.user)
+        .annotate(month=TruncMonth('day'))
         .values('month')
-        .annotate(total=Count('id'))
+        .annotate(total=Sum('check_ins'))
         .order_by('-month')[:10]
     )
 
@@ -335,15 +432,21 @@ def attendance_statistics(request):
 
 @login_required
 def attendance_top(request):
-    data = (
-        EntryLog.objects.values('user__username')
-        .annotate(total=Count('id'))
-        .order_by('-total')[:10]
-    )
-    labels = [d['user__username'] for d in data]
-    values = [d['total'] for d in data]
+    period = request.GET.get('period', leaderboard.DEFAULT_PERIOD)
+    if period not in leaderboard.PERIODS:
+        period = leaderboard.DEFAULT_PERIOD
+
+    ranking = leaderboard.top(period, limit=10)
+    usernames = User.objects.in_bulk([user_id for user_id, _ in ranking])
+    labels = [usernames[user_id].username for user_id, _ in ranking if user_id in usernames]
+    values = [total for user_id, total in ranking if user_id in usernames]
+    my_rank, my_total = leaderboard.rank_of(request.user.id, period)
 
     return render(request, "library/attendance_top.html", {
         "labels": labels,
-        "values": values
+        "values": values,
+        "period": period,
+        "periods": leaderboard.PERIODS,
+        "my_rank": my_rank,
+        "my_total": my_total,
     })
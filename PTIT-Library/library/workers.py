@@ -0,0 +1,48 @@
+"""Hàng đợi việc nền trong tiến trình web (tạo ảnh thu nhỏ, trích văn bản PDF...).
+
+Dùng một ``ThreadPoolExecutor`` dùng chung, tạo khi có việc đầu tiên. Việc được
+gửi sau khi giao dịch hiện tại commit (``transaction.on_commit``) để luồng nền
+không đọc phải dữ liệu chưa ghi. Lỗi trong việc nền chỉ được ghi log, không ảnh
+hưởng tới request đã gửi việc.
+
+Việc chưa chạy xong sẽ mất khi tiến trình dừng; các lệnh backfill tương ứng
+(ví dụ ``generate_thumbnails``) dùng để bù lại.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "BACKGROUND_WORKERS", 2),
+                thread_name_prefix="library-worker",
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Việc nền %s thất bại", getattr(func, "__name__", func))
+        raise
+    finally:
+        # Luồng nền có kết nối CSDL riêng, đóng lại nếu đã quá hạn / lỗi
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    """Chạy ``func`` trên luồng nền ngay khi giao dịch hiện tại commit."""
+    transaction.on_commit(lambda: get_executor().submit(_run, func, args, kwargs))
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_system.settings')
 
 application = get_asgi_application()
+
+# Dựng sẵn chỉ mục gợi ý tìm kiếm (library.search.suggestion_index) khi server khởi động
+from library.search import suggestion_index  # noqa: E402
+
+suggestion_index.warm_up()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Đứng đầu để đo cả truy vấn của session / xác thực (xem library/instrumentation.py)
+    'library.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +58,7 @@ ROOT_URLCONF = 'library_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'library.instrumentation.TimedDjangoTemplates',  # DjangoTemplates + đo thời gian render
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -63,8 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'library.context_processors.unread_notifications_count',
-                'library.views.notification_context',
+                'library.context_processors.notifications',
             ],
         },
     },
@@ -80,10 +82,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # BEGIN IMMEDIATE: giao dịch ghi (duyệt mượn, cấp mã...) xếp hàng chờ khoá ngay từ đầu.
+        # Với BEGIN mặc định, hai giao dịch cùng đọc rồi cùng ghi thì một bên nhận ngay lỗi
+        # "database is locked" thay vì chờ (SQLite không thể nâng khoá đọc lên khoá ghi)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # CSDL test dạng file thay vì bộ nhớ: SQLite in-memory dùng chung cache báo lỗi
+        # "table is locked" ngay thay vì chờ khoá, nên các test nhiều luồng
+        # (SequenceConcurrencyTests, BorrowTransitionConcurrencyTests) không chạy được.
+        # Django chỉ tạo một CSDL test cho cả lượt chạy nên không giới hạn riêng cho
+        # các test đó được; file bị xoá khi chạy xong và các test khác chỉ chậm không đáng kể.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# "default": cache riêng từng tiến trình cho các khối HTML / ảnh chụp có thời hạn ngắn.
+# "shared": dữ liệu mà mọi worker phải thấy giống nhau (bộ đếm thông báo chưa đọc).
+# Cache dạng file dùng chung được cho mọi worker trên cùng máy (CSDL SQLite vốn chỉ
+# chạy trên một máy) mà lần đọc không tốn truy vấn CSDL. Khi chạy nhiều máy, đổi
+# sang Redis/Memcached mà không phải sửa code.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'ptit-library-cache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -127,6 +156,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = "/books/"
 
+# Số mã mượn mỗi worker giữ trước (1 = mã liên tục, lớn hơn = ít ghi bộ đếm hơn)
+BORROW_CODE_BLOCK_SIZE = 1
+
+# Số lượt xuất dữ liệu (CSV / Excel / JSON Lines) được chạy đồng thời trên mỗi worker
+EXPORT_MAX_CONCURRENT = 2
+
+# Header Server-Timing (số truy vấn, thời gian SQL / template / view) cho mọi response,
+# và một dòng log JSON mỗi request qua logger "library.timing" nếu bật SERVER_TIMING_LOG
+SERVER_TIMING_HEADER = True
+SERVER_TIMING_LOG = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'library.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Gửi PDF sách qua web server thay vì Django (xem library/downloads.py):
+# None (Django tự gửi), "x-accel-redirect" (nginx, cần location internal trỏ tới MEDIA_ROOT
+# tại PROTECTED_MEDIA_PREFIX) hoặc "x-sendfile" (Apache mod_xsendfile / lighttpd)
+PROTECTED_MEDIA_OFFLOAD = None
+PROTECTED_MEDIA_PREFIX = "/protected-media/"
+
+# Số luồng nền trong mỗi tiến trình web (tạo ảnh thu nhỏ...), xem library/workers.py
+BACKGROUND_WORKERS = 2
+
+# Số giây mỗi mã điểm danh còn hiệu lực (mã của khung liền trước vẫn được chấp nhận)
+ATTENDANCE_CODE_WINDOW = 30
+
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = []
@@ -1,7 +1,10 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from library.admin import request_timing_view
+from library.downloads import public_media
 
 # --- Tùy chỉnh giao diện trang quản trị ---
 admin.site.site_header = "QUẢN TRỊ THƯ VIỆN PTIT"
@@ -9,10 +12,16 @@ admin.site.site_title = "Quản trị Thư viện PTIT"
 admin.site.index_title = "Trang quản trị hệ thống"
 
 urlpatterns = [
+    # Trang chỉ dành cho nhân viên, phải đứng trước admin.site.urls
+    path("admin/request-timing/", admin.site.admin_view(request_timing_view), name="request_timing"),
     path("admin/", admin.site.urls),
     path("", include("library.urls")),  # gom route của app library vào
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Như static(), nhưng PDF của sách chỉ tải được qua view book_pdf (cần đăng nhập)
+    urlpatterns += [
+        re_path(r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")), public_media,
+                {"document_root": settings.MEDIA_ROOT}),
+    ]
 